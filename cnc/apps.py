@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def enable_sqlite_wal(sender, connection, **kwargs):
+    # in WAL mode readers are never blocked by a reindex committing, and see the catalog as of their last commit
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
 
 
 class CncConfig(AppConfig):
     name = 'cnc'
+
+    def ready(self):
+        connection_created.connect(enable_sqlite_wal)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pan_cnc.lib import catalog_utils
+from pan_cnc.lib import cnc_utils
+from pan_cnc.lib import db_utils
+
+
+class Command(BaseCommand):
+    help = 'Export the indexed skillet catalog to a single file, or import it from one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('export', 'import'))
+        parser.add_argument('file_path', help='path of the catalog file')
+        parser.add_argument('--no-refresh', action='store_true',
+                            help='export the catalog as currently indexed, without cloning or indexing repositories')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'import':
+            if not catalog_utils.import_catalog(options['file_path']):
+                raise CommandError('Catalog was not imported')
+
+            return
+
+        if not options['no_refresh']:
+            # same as a first start of the web process, so the exported catalog is what it would have indexed
+            for (app_name, app_config) in settings.INSTALLED_APPS_CONFIG.items():
+                cnc_utils.init_app(app_config)
+                db_utils.initialize_default_repositories(app_name)
+
+            db_utils.refresh_skillets_from_all_repos()
+
+        if not catalog_utils.export_catalog(options['file_path']):
+            raise CommandError('Catalog was not exported')
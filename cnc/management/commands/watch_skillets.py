@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import watch_utils
+
+
+class Command(BaseCommand):
+    help = 'Watch the imported skillet repositories and re-index skillets as they are edited'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', default=None, help='name of the CNC application, defaults to the only one')
+        parser.add_argument('--debounce', type=float, default=watch_utils.DEBOUNCE_SECONDS,
+                            help='seconds to wait for further changes before indexing')
+
+    def handle(self, *args, **options):
+        if not watch_utils.watcher_available():
+            raise CommandError('inotify is not available on this platform')
+
+        app_name = options['app'] or db_utils.get_default_app_name()
+        watcher = watch_utils.SkilletRepositoryWatcher(app_name, debounce=options['debounce'])
+        watcher.start()
+        try:
+            while watcher.is_alive():
+                watcher.join(1.0)
+        except KeyboardInterrupt:
+            watcher.stop()
+            watcher.join()
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repositorydetails',
+            name='indexed_commit',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='repositorydetails',
+            name='indexed_local_changes',
+            field=models.TextField(default='[]'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0002_repositorydetails_indexed_commit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skillet',
+            name='content_hash',
+            field=models.CharField(default='', max_length=64),
+        ),
+    ]
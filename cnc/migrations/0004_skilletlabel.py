@@ -0,0 +1,61 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:00
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_labels(apps, schema_editor):
+    # same rows as pan_cnc.lib.db_utils.get_label_pairs, repeated here as migrations must not depend on app code
+    Skillet = apps.get_model('cnc', 'Skillet')
+    SkilletLabel = apps.get_model('cnc', 'SkilletLabel')
+
+    label_records = list()
+    for skillet in Skillet.objects.all():
+        try:
+            labels = json.loads(skillet.skillet_json).get('labels', dict())
+        except ValueError:
+            continue
+
+        if not isinstance(labels, dict):
+            continue
+
+        for (key, value) in labels.items():
+            values = value if isinstance(value, list) else [value]
+            indexed_values = list(dict.fromkeys(v for v in values if isinstance(v, str) and len(v) <= 512))
+            if not indexed_values or not all(isinstance(v, str) and len(v) <= 512 for v in values):
+                indexed_values.append(None)
+
+            for v in indexed_values:
+                label_records.append(SkilletLabel(skillet_id=skillet.id, key=str(key), value=v))
+
+    SkilletLabel.objects.bulk_create(label_records)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0003_skillet_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkilletLabel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('value', models.CharField(max_length=512, null=True)),
+                ('skillet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='labels', to='cnc.Skillet')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='skilletlabel',
+            index=models.Index(fields=['key', 'value'], name='cnc_skillet_key_83a049_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skilletlabel',
+            index=models.Index(fields=['skillet', 'key'], name='cnc_skillet_skillet_2724e0_idx'),
+        ),
+        migrations.RunPython(index_existing_labels, migrations.RunPython.noop),
+    ]
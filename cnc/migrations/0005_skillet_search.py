@@ -0,0 +1,65 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:00
+
+import json
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    # same table and documents as pan_cnc.lib.search_utils, repeated here as migrations must not depend on app code
+    if schema_editor.connection.vendor != 'sqlite':
+        print('Full text search requires sqlite, skillet searches will scan the catalog')
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE cnc_skillet_search USING fts5('
+                           'name, label, description, labels, variables, type UNINDEXED)')
+        except OperationalError as oe:
+            print(f'Could not create full text search index, skillet searches will scan the catalog: {oe}')
+            return
+
+        Skillet = apps.get_model('cnc', 'Skillet')
+        rows = list()
+        for skillet in Skillet.objects.all():
+            try:
+                skillet_dict = json.loads(skillet.skillet_json)
+            except ValueError:
+                continue
+
+            labels = skillet_dict.get('labels', dict())
+            label_words = list()
+            if isinstance(labels, dict):
+                for (key, value) in labels.items():
+                    label_words.append(str(key))
+                    values = value if isinstance(value, list) else [value]
+                    label_words.extend(v for v in values if isinstance(v, str))
+
+            variables = skillet_dict.get('variables', list())
+            variable_names = list()
+            if isinstance(variables, list):
+                variable_names = [str(v['name']) for v in variables if isinstance(v, dict) and 'name' in v]
+
+            rows.append((skillet.id, str(skillet_dict.get('type', '')), skillet.name,
+                         str(skillet_dict.get('label', '') or ''), str(skillet_dict.get('description', '') or ''),
+                         ' '.join(label_words), ' '.join(variable_names)))
+
+        cursor.executemany('INSERT INTO cnc_skillet_search (rowid, type, name, label, description, labels, variables) '
+                           'VALUES (%s, %s, %s, %s, %s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS cnc_skillet_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0004_skilletlabel'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0005_skillet_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repositorydetails',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+    ]
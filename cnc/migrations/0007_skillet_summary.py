@@ -0,0 +1,80 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:30
+
+import json
+
+from django.db import migrations, models
+
+
+def summarize_existing_skillets(apps, schema_editor):
+    # same values as pan_cnc.lib.db_utils.get_skillet_summary_fields, repeated here as migrations must not depend on
+    # app code
+    Skillet = apps.get_model('cnc', 'Skillet')
+
+    skillet_records = list()
+    for skillet in Skillet.objects.all():
+        try:
+            skillet_dict = json.loads(skillet.skillet_json)
+        except ValueError:
+            continue
+
+        labels = skillet_dict.get('labels', None)
+        if labels is not None and not isinstance(labels, dict):
+            labels = dict()
+
+        collection = labels.get('collection', '') if labels is not None else ''
+        if isinstance(collection, list):
+            collection = next((c for c in collection if isinstance(c, str)), '')
+
+        extends = skillet_dict.get('extends', '')
+
+        skillet.type = str(skillet_dict.get('type', '') or '')[:64]
+        skillet.label = str(skillet_dict.get('label', '') or '')
+        skillet.description = str(skillet_dict.get('description', '') or '')
+        skillet.collection = collection[:200] if isinstance(collection, str) else ''
+        skillet.labels_json = json.dumps(labels)
+        skillet.extends = extends[:200] if isinstance(extends, str) else ''
+        skillet_records.append(skillet)
+
+    Skillet.objects.bulk_update(skillet_records, ['type', 'label', 'description', 'collection', 'labels_json',
+                                                  'extends'], batch_size=50)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnc', '0006_repositorydetails_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skillet',
+            name='collection',
+            field=models.CharField(db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='skillet',
+            name='description',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='skillet',
+            name='extends',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='skillet',
+            name='label',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='skillet',
+            name='labels_json',
+            field=models.TextField(default='{}'),
+        ),
+        migrations.AddField(
+            model_name='skillet',
+            name='type',
+            field=models.CharField(db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(summarize_existing_skillets, migrations.RunPython.noop),
+    ]
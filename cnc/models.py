@@ -2,15 +2,45 @@ from django.db import models
 
 
 class RepositoryDetails(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     url = models.CharField(max_length=512)
     deploy_key_path = models.CharField(max_length=128, default='', null='')
     deploy_key_priv = models.CharField(max_length=2048, default='', null='')
     deploy_key_pub = models.CharField(max_length=2048, default='', null='')
     details_json = models.TextField(max_length=2048)
+    # commit SHA the skillets were last indexed from and any files with local changes at that time, as a json list
+    indexed_commit = models.CharField(max_length=64, default='')
+    indexed_local_changes = models.TextField(default='[]')
 
 
 class Skillet(models.Model):
     name = models.CharField(max_length=200, unique=True)
     skillet_json = models.TextField(max_length=2048, default='')
+    # sha256 of the skillet definition file and every file its snippets load, see db_utils._get_content_hash
+    content_hash = models.CharField(max_length=64, default='')
     repository = models.ForeignKey(RepositoryDetails, on_delete=models.CASCADE)
+    # summary of skillet_json for listing pages, see db_utils.get_skillet_summary_fields
+    type = models.CharField(max_length=64, default='', db_index=True)
+    label = models.TextField(default='')
+    description = models.TextField(default='')
+    # first value of the 'collection' label
+    collection = models.CharField(max_length=200, default='', db_index=True)
+    labels_json = models.TextField(default='{}')
+    # name of the skillet this one extends, see dependency_utils
+    extends = models.CharField(max_length=200, default='')
+
+
+class SkilletLabel(models.Model):
+    """
+    One row per label value of each Skillet, allowing label queries to use indexes instead of loading every skillet
+    """
+    skillet = models.ForeignKey(Skillet, on_delete=models.CASCADE, related_name='labels')
+    key = models.CharField(max_length=200)
+    # None for labels with any value that is not a string of up to 512 characters, or no values at all
+    value = models.CharField(max_length=512, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'value']),
+            models.Index(fields=['skillet', 'key']),
+        ]
@@ -0,0 +1,1540 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+In-process object store backing the long term cache functions in cnc_utils
+
+Django's LocMemCache pickles every value on set and unpickles it on get. The long term cache holds the entire
+skillet catalog, so storing it there meant every lookup deserialized the whole thing. The LongTermCache objects here
+hold live references instead. Values returned from get() are shared with every other caller in this process and
+must be treated as read-only. To change a cached value, build a new one and call set() with it.
+
+Each cache is persisted to $HOME/.pan_cnc/app_name as a snapshot file named 'cache' plus an append-only journal
+named 'cache.journal'. Only keys that changed since the last flush are appended to the journal, so the cost of a flush
+depends on what changed and not on the size of the cache. Once the journal grows larger than the snapshot, both are
+compacted into a new snapshot. The snapshot is always replaced atomically via write, fsync, and rename.
+
+The backend is chosen via settings.LONG_TERM_CACHE. 'sqlite' stores each key as a row in an indexed SQLite table,
+and 'redis' stores each key in any server that speaks the Redis protocol. Both only read a key when it is first
+requested. BACKEND may also be the dotted path of any LongTermCache subclass.
+
+Values are written with serialize(), which for the file backend produces a zlib compressed pickle stream signed with
+a random key kept in $HOME/.pan_cnc. This loads several times faster than the JSON used by older versions, which
+deserialize() still reads. The sqlite and redis backends may be shared with other hosts and only ever hold compressed
+JSON.
+
+Several processes may share the same cache, for example the web process and the celery worker. Every write bumps a
+version: the file backend appends to the journal or replaces the snapshot, and the sqlite backend increments a
+generation counter. At most every COHERENCE_CHECK_INTERVAL seconds each process checks that version and picks up
+only the keys that other processes have changed.
+
+Expired items are removed in bulk every SWEEP_INTERVAL seconds by a background thread using a min-heap of expiry
+times, so items that are never read again do not stay in the persisted cache forever.
+"""
+
+import atexit
+import fcntl
+import hashlib
+import heapq
+import hmac
+import json
+import math
+import os
+import pickle
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from abc import ABC
+from abc import abstractmethod
+from contextlib import contextmanager
+from time import sleep
+from time import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+except ImportError:
+    # only required for the redis long term cache backend
+    redis = None
+
+# registry of LongTermCache objects keyed by app_name
+_caches = dict()
+_caches_lock = threading.Lock()
+
+# thread locks used by single_flight keyed by (app_name, name)
+_flight_locks = dict()
+
+# number of seconds to wait after a change before flushing to disk. All changes made in this window are coalesced
+# into a single journal write
+FLUSH_DELAY = 2.0
+
+# always allow the journal to grow to at least this size before compacting
+JOURNAL_MIN_COMPACT_SIZE = 1024 * 1024
+
+# minimum number of seconds between checks for changes made by other processes
+COHERENCE_CHECK_INTERVAL = 0.5
+
+# number of generations of changed keys the sqlite backend keeps for other processes to catch up with
+CHANGE_LOG_GENERATIONS = 1000
+
+# number of seconds between sweeps for expired items
+SWEEP_INTERVAL = 300
+
+_sweeper = None
+
+# header prefixed to every serialized value, followed by one byte each for the serializer and compression used
+SERIALIZED_MAGIC = b'CNC\x01'
+
+# length of the HMAC-SHA256 signature following the header of pickled values, and of the key it is made with
+SIGNATURE_LENGTH = 32
+
+# file in $HOME/.pan_cnc holding the key pickled values are signed with, see _get_signing_key
+SIGNING_KEY_FILE = 'cache.key'
+
+_signing_keys = dict()
+
+# each journal record is framed by a marker, the payload length, and a crc32 of the payload
+JOURNAL_MAGIC = b'CNCj'
+JOURNAL_HEADER = struct.Struct('>4sII')
+
+_flush_timer = None
+
+
+class LongTermCache:
+    """
+    Holds all long term cached values for a single CNC application along with the metadata needed to age them out
+    """
+
+    # exceptions raised by the backing store that should be reported but not propagated
+    storage_errors = (OSError,)
+
+    def __init__(self, app_name: str, location=''):
+        self.app_name = app_name
+        # backend specific storage location, unused by the file backend which always uses $HOME/.pan_cnc/app_name
+        self.location = location
+        self.values = dict()
+        self.meta = dict()
+        # secondary index of cache_type to the set of keys of that type
+        self.type_index = dict()
+        # absolute expiry time of each key, math.inf for items that never expire
+        self.expiry = dict()
+        # min-heap of (expiry, key) for items that do expire. Entries are not removed when a key is overwritten or
+        # deleted, so each popped entry is checked against self.expiry before it is acted on
+        self.expiry_heap = list()
+        # keys that have changed since the last flush
+        self.dirty_keys = set()
+        # set when the entire cache has been cleared and must be re-written as a new snapshot
+        self.cleared = False
+        self.lock = threading.RLock()
+        # time of the last check for changes made by other processes
+        self.last_refresh = 0
+        # identifies the snapshot and journal this cache was loaded from and how much of the journal has been read
+        self.snapshot_id = None
+        self.journal_id = None
+        self.journal_offset = 0
+
+    @property
+    def dirty(self) -> bool:
+        return self.cleared or len(self.dirty_keys) > 0
+
+    @staticmethod
+    def _expiry_of(meta: dict) -> float:
+        try:
+            life = int(meta['life'])
+            time_added = float(meta['time'])
+        except (KeyError, TypeError, ValueError):
+            print('could not parse life value from cache entry')
+            return 0
+
+        # Allow -1 to indicate cached items that should stay cached forever
+        if life == -1:
+            return math.inf
+
+        return time_added + life
+
+    def _put(self, key: str, value: any, meta: dict) -> None:
+        self._remove(key)
+        self.values[key] = value
+        self.meta[key] = meta
+        self.type_index.setdefault(meta.get('cache_type', None), set()).add(key)
+
+        expires = self._expiry_of(meta)
+        self.expiry[key] = expires
+        if expires != math.inf:
+            heapq.heappush(self.expiry_heap, (expires, key))
+
+    def _remove(self, key: str) -> None:
+        self.values.pop(key, None)
+        self.expiry.pop(key, None)
+        meta = self.meta.pop(key, None)
+        if meta is not None:
+            keys = self.type_index.get(meta.get('cache_type', None), None)
+            if keys is not None:
+                keys.discard(key)
+
+    def get(self, key: str) -> any:
+        """
+        Return the live cached value for key, or None if not found or expired
+
+        :param key: name of the cached item
+        :return: cached value or None
+        """
+        expires = self.expiry.get(key, None)
+        if expires is None or expires < time():
+            return None
+
+        return self.values.get(key, None)
+
+    def set(self, key: str, value: any, life=3600, cache_type='snippet') -> None:
+        """
+        Store value under key. Setting a value of None removes the key from the cache
+
+        :param key: name of the cached item
+        :param value: value to cache. This object is stored by reference and must not be modified afterwards
+        :param life: number of seconds this item is valid for, -1 to cache forever
+        :param cache_type: type of the item, used to evict groups of items from the cache
+        :return: None
+        """
+        with self.lock:
+            if value is None:
+                self._remove(key)
+            else:
+                self._put(key, value, {
+                    'time': time(),
+                    'life': life,
+                    'cache_type': cache_type
+                })
+
+            self.dirty_keys.add(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.values = dict()
+            self.meta = dict()
+            self.type_index = dict()
+            self.expiry = dict()
+            self.expiry_heap = list()
+            self.dirty_keys = set()
+            self.cleared = True
+
+    def keys_of_type(self, cache_type: str) -> list:
+        return list(self.type_index.get(cache_type, set()))
+
+    def evict_type(self, cache_type: str) -> list:
+        """
+        Removes every key of the given cache_type in a single pass over the type index
+
+        :param cache_type: type of cached items to remove
+        :return: list of evicted keys
+        """
+        with self.lock:
+            keys = self.keys_of_type(cache_type)
+            for key in keys:
+                self._remove(key)
+                self.dirty_keys.add(key)
+
+            return keys
+
+    def sweep(self) -> int:
+        """
+        Removes all expired items. Only heap entries that have already expired are visited
+
+        :return: number of items removed
+        """
+        now = time()
+        removed = 0
+
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] < now:
+                (expires, key) = heapq.heappop(self.expiry_heap)
+                # skip stale heap entries for keys that have since been overwritten or removed
+                if self.expiry.get(key, None) != expires:
+                    continue
+
+                self._remove(key)
+                self.dirty_keys.add(key)
+                removed += 1
+
+            # drop stale entries if overwrites have let the heap grow well beyond the number of live keys
+            if len(self.expiry_heap) > 2 * len(self.expiry) + 64:
+                self.expiry_heap = [(e, k) for (k, e) in self.expiry.items() if e != math.inf]
+                heapq.heapify(self.expiry_heap)
+
+        return removed
+
+    def load_dict(self, contents: dict) -> None:
+        """
+        Populate this cache from the legacy dict format, where each key is stored at the top level and all metadata
+        is found under the 'meta' key
+
+        :param contents: dict as loaded from the cache file
+        :return: None
+        """
+        with self.lock:
+            meta = contents.pop('meta', dict())
+            if not isinstance(meta, dict):
+                meta = dict()
+
+            self.values = dict()
+            self.meta = dict()
+            self.type_index = dict()
+            self.expiry = dict()
+            self.expiry_heap = list()
+            for key, entry_meta in meta.items():
+                if key in contents and isinstance(entry_meta, dict):
+                    self._put(key, contents[key], entry_meta)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the contents of this cache in the legacy dict format suitable for serializing to the cache file
+
+        :return: dict of all cached values with a 'meta' key holding all metadata
+        """
+        with self.lock:
+            contents = dict(self.values)
+            contents['meta'] = dict(self.meta)
+            return contents
+
+    def apply_journal_record(self, record: dict) -> None:
+        """
+        Replays a single journal record onto this cache. Records older than what is already loaded for that key
+        are ignored, which makes replaying a journal over a newer snapshot harmless
+
+        :param record: dict with 'key', 'time', and optionally 'value' and 'meta'. Records without 'meta' are deletes
+        :return: None
+        """
+        key = record.get('key', None)
+        if key is None or key == 'meta':
+            return None
+
+        current = self.meta.get(key, None)
+        if current is not None and current.get('time', 0) >= record.get('time', 0):
+            return None
+
+        if 'meta' in record:
+            self._put(key, record.get('value', None), record['meta'])
+        else:
+            self._remove(key)
+
+    def take_journal_records(self) -> list:
+        """
+        Returns journal records for every key changed since the last call and marks those keys clean
+
+        :return: list of journal record dicts
+        """
+        with self.lock:
+            records = list()
+            now = time()
+            for key in self.dirty_keys:
+                if key in self.meta:
+                    records.append({'key': key, 'time': self.meta[key]['time'], 'meta': self.meta[key],
+                                    'value': self.values.get(key, None)})
+                else:
+                    records.append({'key': key, 'time': now})
+
+            self.dirty_keys = set()
+            return records
+
+    def maybe_refresh(self, force=False) -> None:
+        """
+        Pick up changes written by other processes, at most once every COHERENCE_CHECK_INTERVAL seconds
+
+        :param force: check for changes now regardless of when the last check was
+        :return: None
+        """
+        now = time()
+        if not force and now - self.last_refresh < COHERENCE_CHECK_INTERVAL:
+            return None
+
+        self.last_refresh = now
+
+        with self.lock:
+            # a pending clear will overwrite everything anyway
+            if self.cleared:
+                return None
+
+            try:
+                self.refresh()
+            except self.storage_errors as e:
+                print('Could not check long term cache for changes')
+                print(e)
+
+    def _file_ids(self, cache_dir: str) -> (tuple, int):
+        snapshot_stat = os.stat(os.path.join(cache_dir, 'cache'))
+        try:
+            journal_id = os.stat(os.path.join(cache_dir, 'cache.journal')).st_ino
+        except FileNotFoundError:
+            journal_id = None
+
+        return (snapshot_stat.st_ino, snapshot_stat.st_mtime_ns), journal_id
+
+    def _read_journal_tail(self, cache_dir: str) -> None:
+        (records, self.journal_offset) = _read_journal(cache_dir, self.journal_offset)
+        for record in records:
+            self.apply_journal_record(record)
+
+    def load(self) -> None:
+        """
+        Populate this cache from the snapshot file and replay any journal entries written since
+
+        :return: None
+        """
+        cache_dir = _ensure_cache_dir(self.app_name)
+        if cache_dir is None:
+            return None
+
+        try:
+            with self.lock, _CacheFileLock(cache_dir):
+                self.load_dict(load_cache_file(self.app_name))
+                (self.snapshot_id, self.journal_id) = self._file_ids(cache_dir)
+                self.journal_offset = 0
+                self._read_journal_tail(cache_dir)
+        except OSError as ose:
+            print('Could not load long term cache')
+            print(ose)
+
+    def refresh(self) -> None:
+        """
+        Apply journal entries appended by other processes since the last refresh. If another process has compacted
+        the cache into a new snapshot, reload it while keeping any of our own changes that have not been saved yet
+
+        :return: None
+        """
+        cache_dir = get_cache_dir(self.app_name)
+        (snapshot_id, journal_id) = self._file_ids(cache_dir)
+
+        if snapshot_id == self.snapshot_id and journal_id == self.journal_id:
+            self._read_journal_tail(cache_dir)
+            return None
+
+        print(f'Reloading long term cache for {self.app_name}')
+        pending = {k: (self.values.get(k, None), self.meta.get(k, None)) for k in self.dirty_keys}
+        self.load()
+
+        for key, (value, meta) in pending.items():
+            if meta is None:
+                self._remove(key)
+            else:
+                self._put(key, value, meta)
+
+    def _compact(self, cache_dir: str) -> None:
+        _write_snapshot(cache_dir, self.to_dict())
+        (self.snapshot_id, self.journal_id) = self._file_ids(cache_dir)
+        self.journal_offset = 0
+
+    def save(self) -> None:
+        """
+        Persist all changes made since the last save. Changed keys are appended to the journal, and the journal is
+        compacted into a new snapshot once it grows larger than the snapshot itself
+
+        :return: None
+        """
+        cache_dir = _ensure_cache_dir(self.app_name)
+        if cache_dir is None:
+            return None
+
+        # always take self.lock before the file lock, see load()
+        with self.lock:
+            cleared = self.cleared
+            self.cleared = False
+            records = self.take_journal_records()
+
+            try:
+                with _CacheFileLock(cache_dir):
+                    if cleared:
+                        self._compact(cache_dir)
+                        return None
+
+                    if not records:
+                        return None
+
+                    journal_size = _append_journal(cache_dir, records)
+
+                    try:
+                        snapshot_size = os.path.getsize(os.path.join(cache_dir, 'cache'))
+                    except OSError:
+                        snapshot_size = 0
+
+                    if journal_size > max(snapshot_size, JOURNAL_MIN_COMPACT_SIZE):
+                        print(f'Compacting long term cache for {self.app_name}')
+                        # pick up anything other processes have written so it is not lost from the new snapshot
+                        self._read_journal_tail(cache_dir)
+                        self._compact(cache_dir)
+
+            except OSError as ose:
+                print('Could not save long term cache')
+                print(ose)
+
+        return None
+
+
+class LazyLongTermCache(LongTermCache, ABC):
+    """
+    Base class for backends that keep each entry in an external store and fetch it the first time it is requested.
+    Nothing is read at load time, so startup cost does not depend on how large the cache has grown.
+
+    Subclasses must implement _fetch, _stored_keys, _stored_keys_of_type, refresh, and save
+    """
+
+    def __init__(self, app_name: str, location=''):
+        super().__init__(app_name, location)
+        # keys whose current state, present or not, is known in memory
+        self.loaded_keys = set()
+
+    @abstractmethod
+    def _fetch(self, key: str) -> (tuple, None):
+        """
+        Read a single entry from the backing store
+
+        :param key: name of the cached item
+        :return: tuple of (value, meta) or None if not found
+        """
+
+    @abstractmethod
+    def _stored_keys(self) -> list:
+        """
+        :return: list of every key in the backing store
+        """
+
+    @abstractmethod
+    def _stored_keys_of_type(self, cache_type: str) -> list:
+        """
+        :param cache_type: type of cached items
+        :return: list of the keys of this type in the backing store
+        """
+
+    @abstractmethod
+    def refresh(self) -> None:
+        """
+        Forget any loaded keys that other processes have changed in the backing store, so they are fetched again
+
+        :return: None
+        """
+
+    @abstractmethod
+    def save(self) -> None:
+        """
+        Write every changed key to the backing store
+
+        :return: None
+        """
+
+    def _load_key(self, key: str) -> None:
+        try:
+            found = self._fetch(key)
+        except self.storage_errors as e:
+            print(f'Could not load {key} from long term cache')
+            print(e)
+            return None
+
+        self.loaded_keys.add(key)
+
+        if found is not None:
+            (value, meta) = found
+            self._put(key, value, meta)
+
+    def get(self, key: str) -> any:
+        if key not in self.loaded_keys and not self.cleared:
+            with self.lock:
+                if key not in self.loaded_keys:
+                    self._load_key(key)
+
+        return super().get(key)
+
+    def set(self, key: str, value: any, life=3600, cache_type='snippet') -> None:
+        with self.lock:
+            super().set(key, value, life, cache_type)
+            self.loaded_keys.add(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            super().clear()
+            self.loaded_keys = set()
+
+    def keys_of_type(self, cache_type: str) -> list:
+        with self.lock:
+            keys = set()
+            if not self.cleared:
+                try:
+                    keys.update(k for k in self._stored_keys_of_type(cache_type) if k not in self.loaded_keys)
+                except self.storage_errors as e:
+                    print(e)
+
+            keys.update(super().keys_of_type(cache_type))
+            return list(keys)
+
+    def evict_type(self, cache_type: str) -> list:
+        with self.lock:
+            keys = super().evict_type(cache_type)
+            # evicted keys are now known to be absent, no need to look for them in the backing store
+            self.loaded_keys.update(keys)
+            return keys
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            if not self.cleared:
+                try:
+                    stored_keys = self._stored_keys()
+                except self.storage_errors as e:
+                    print(e)
+                    stored_keys = list()
+
+                for key in stored_keys:
+                    if key not in self.loaded_keys:
+                        self._load_key(key)
+
+            return super().to_dict()
+
+    def load(self) -> None:
+        # values are loaded on demand in get()
+        return None
+
+    def _forget(self, key: str) -> None:
+        # unsaved local changes win over changes from other processes
+        if key in self.dirty_keys:
+            return None
+
+        self._remove(key)
+        self.loaded_keys.discard(key)
+
+    def _forget_all(self) -> None:
+        for key in list(self.loaded_keys):
+            self._forget(key)
+
+
+class SqliteLongTermCache(LazyLongTermCache):
+    """
+    LongTermCache stored in an indexed SQLite table. The database is LOCATION/app_name.sqlite3 if LOCATION is set,
+    otherwise $HOME/.pan_cnc/app_name/cache.sqlite3
+    """
+
+    storage_errors = (OSError, sqlite3.Error)
+
+    def __init__(self, app_name: str, location=''):
+        super().__init__(app_name, location)
+        self.connection = None
+        # last generation of changes seen, and the generations written by this process
+        self.generation = 0
+        self.own_generations = set()
+        self.data_version = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self.connection is None:
+            if self.location:
+                db_file = os.path.join(self.location, f'{self.app_name}.sqlite3')
+            else:
+                cache_dir = _ensure_cache_dir(self.app_name)
+                if cache_dir is None:
+                    raise OSError('Could not create application cache dir')
+
+                db_file = os.path.join(cache_dir, 'cache.sqlite3')
+
+            # all access is serialized via self.lock
+            connection = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+            os.chmod(db_file, mode=0o600)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS ltc ('
+                               'key TEXT PRIMARY KEY, value BLOB, time REAL, life INTEGER, expires REAL, '
+                               'cache_type TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ltc_cache_type ON ltc (cache_type)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ltc_expires ON ltc (expires)')
+            # generation counter and log of which keys changed in each generation, used by other processes to find
+            # out what they need to reload
+            connection.execute('CREATE TABLE IF NOT EXISTS ltc_state (id INTEGER PRIMARY KEY, generation INTEGER)')
+            connection.execute('INSERT OR IGNORE INTO ltc_state (id, generation) VALUES (0, 0)')
+            connection.execute('CREATE TABLE IF NOT EXISTS ltc_changes (generation INTEGER, key TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ltc_changes_generation ON ltc_changes (generation)')
+            connection.commit()
+
+            # nothing has been loaded yet, so there is nothing older than this for us to catch up on
+            (self.generation,) = connection.execute('SELECT generation FROM ltc_state WHERE id = 0').fetchone()
+            (self.data_version,) = connection.execute('PRAGMA data_version').fetchone()
+            self.connection = connection
+
+        return self.connection
+
+    def _fetch(self, key: str) -> (tuple, None):
+        connection = self._get_connection()
+        row = connection.execute('SELECT value, time, life, cache_type FROM ltc WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        (value, time_added, life, cache_type) = row
+        try:
+            return deserialize(value), {'time': time_added, 'life': life, 'cache_type': cache_type}
+        except ValueError:
+            print(f'Could not parse long term cache value for {key}')
+            return None
+
+    def _stored_keys(self) -> list:
+        return [k for (k,) in self._get_connection().execute('SELECT key FROM ltc')]
+
+    def _stored_keys_of_type(self, cache_type: str) -> list:
+        connection = self._get_connection()
+        return [k for (k,) in connection.execute('SELECT key FROM ltc WHERE cache_type = ?', (cache_type,))]
+
+    def sweep(self) -> int:
+        with self.lock:
+            removed = super().sweep()
+
+            # rows that were never loaded in this process can be removed directly via the expires index. Other
+            # processes never return expired items, so they do not need to be told about this
+            try:
+                connection = self._get_connection()
+                with connection:
+                    cursor = connection.execute('DELETE FROM ltc WHERE expires IS NOT NULL AND expires < ?', (time(),))
+                    removed += cursor.rowcount
+            except (OSError, sqlite3.Error) as e:
+                print('Could not remove expired items from long term cache')
+                print(e)
+
+            return removed
+
+    def refresh(self) -> None:
+        """
+        Drop any loaded keys that other processes have changed so they are reloaded on next access. PRAGMA
+        data_version only changes when another connection commits, so this is a single cheap query when nothing changed
+
+        :return: None
+        """
+        connection = self._get_connection()
+        (data_version,) = connection.execute('PRAGMA data_version').fetchone()
+        if data_version == self.data_version:
+            return None
+
+        self.data_version = data_version
+
+        (oldest,) = connection.execute('SELECT MIN(generation) FROM ltc_changes').fetchone()
+        if oldest is not None and oldest > self.generation + 1:
+            # we have fallen too far behind and the change log no longer covers everything we missed
+            self._forget_all()
+
+        rows = connection.execute('SELECT generation, key FROM ltc_changes WHERE generation > ? '
+                                  'ORDER BY generation', (self.generation,)).fetchall()
+        for (generation, key) in rows:
+            self.generation = max(self.generation, generation)
+            if generation in self.own_generations:
+                continue
+
+            if key is None:
+                self._forget_all()
+            else:
+                self._forget(key)
+
+        self.own_generations = {g for g in self.own_generations if g > self.generation}
+
+    def save(self) -> None:
+        """
+        Writes all changed keys to the database in a single transaction
+
+        :return: None
+        """
+        with self.lock:
+            cleared = self.cleared
+            self.cleared = False
+            records = self.take_journal_records()
+
+            try:
+                connection = self._get_connection()
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    (generation,) = connection.execute('SELECT generation FROM ltc_state WHERE id = 0').fetchone()
+                    generation += 1
+                    connection.execute('UPDATE ltc_state SET generation = ? WHERE id = 0', (generation,))
+
+                    if cleared:
+                        connection.execute('DELETE FROM ltc')
+                        # a NULL key tells other processes to drop everything
+                        connection.execute('INSERT INTO ltc_changes (generation, key) VALUES (?, NULL)', (generation,))
+
+                    for record in records:
+                        connection.execute('INSERT INTO ltc_changes (generation, key) VALUES (?, ?)',
+                                           (generation, record['key']))
+
+                        if 'meta' not in record:
+                            connection.execute('DELETE FROM ltc WHERE key = ?', (record['key'],))
+                            continue
+
+                        meta = record['meta']
+                        life = int(meta['life'])
+                        expires = None if life == -1 else meta['time'] + life
+                        connection.execute('INSERT OR REPLACE INTO ltc (key, value, time, life, expires, cache_type) '
+                                           'VALUES (?, ?, ?, ?, ?, ?)',
+                                           (record['key'], serialize(record['value']), meta['time'], life, expires,
+                                            meta.get('cache_type', 'snippet')))
+
+                    connection.execute('DELETE FROM ltc_changes WHERE generation <= ?',
+                                       (generation - CHANGE_LOG_GENERATIONS,))
+
+                self.own_generations.add(generation)
+
+            except (OSError, sqlite3.Error) as e:
+                print('Could not save long term cache')
+                print(e)
+
+        return None
+
+
+class RedisLongTermCache(LazyLongTermCache):
+    """
+    LongTermCache stored in any server that speaks the Redis protocol, which lets every web and worker process on a
+    host share one warm cache. LOCATION is a redis url such as redis://localhost:6379/0 or unix:///run/cnc/redis.sock
+
+    Each entry is a hash at pan_cnc:app_name:entry:key and expires via the server's own EXPIREAT. A set of all keys and
+    one set per cache_type act as indexes, and every change is logged to the pan_cnc:app_name:changes stream so
+    other processes know which keys to reload
+    """
+
+    storage_errors = (OSError,) if redis is None else (OSError, redis.RedisError)
+
+    def __init__(self, app_name: str, location=''):
+        super().__init__(app_name, location or 'redis://localhost:6379/0')
+        self.client = None
+        self.prefix = f'pan_cnc:{app_name}:'
+        self.changes_key = f'{self.prefix}changes'
+        # id of the last change stream entry seen, and the ids of entries written by this process
+        self.last_id = b'0-0'
+        self.own_ids = set()
+
+    def _get_client(self):
+        if self.client is None:
+            client = redis.Redis.from_url(self.location)
+            latest = client.xrevrange(self.changes_key, count=1)
+            # nothing has been loaded yet, so there is nothing older than this for us to catch up on
+            if latest:
+                self.last_id = latest[0][0]
+
+            self.client = client
+
+        return self.client
+
+    def _entry_key(self, key: str) -> str:
+        return f'{self.prefix}entry:{key}'
+
+    def _live_members(self, set_key: str) -> list:
+        """
+        Returns the members of an index set whose entries still exist, removing those the server has expired
+
+        :param set_key: name of the index set
+        :return: list of keys
+        """
+        client = self._get_client()
+        members = [m.decode('utf-8') for m in client.smembers(set_key)]
+        if not members:
+            return members
+
+        pipe = client.pipeline(transaction=False)
+        for key in members:
+            pipe.exists(self._entry_key(key))
+
+        live = list()
+        stale = list()
+        for (key, exists) in zip(members, pipe.execute()):
+            if exists:
+                live.append(key)
+            else:
+                stale.append(key)
+
+        if stale:
+            client.srem(set_key, *stale)
+
+        return live
+
+    def _fetch(self, key: str) -> (tuple, None):
+        entry = self._get_client().hgetall(self._entry_key(key))
+        if not entry:
+            return None
+
+        try:
+            meta = {'time': float(entry[b'time']), 'life': int(entry[b'life']),
+                    'cache_type': entry[b'cache_type'].decode('utf-8')}
+            return deserialize(entry[b'value']), meta
+        except (KeyError, ValueError):
+            print(f'Could not parse long term cache value for {key}')
+            return None
+
+    def _stored_keys(self) -> list:
+        return self._live_members(f'{self.prefix}keys')
+
+    def _stored_keys_of_type(self, cache_type: str) -> list:
+        return self._live_members(f'{self.prefix}type:{cache_type}')
+
+    def refresh(self) -> None:
+        """
+        Drop any loaded keys that other processes have changed so they are reloaded on next access. Checking the
+        newest change stream id is a single round trip when nothing has changed
+
+        :return: None
+        """
+        client = self._get_client()
+        latest = client.xrevrange(self.changes_key, count=1)
+        if not latest or latest[0][0] == self.last_id:
+            return None
+
+        if not client.xrange(self.changes_key, min=self.last_id, max=self.last_id):
+            # the stream has been trimmed past the last change we saw, so we may have missed some
+            self._forget_all()
+
+        for (stream, entries) in client.xread({self.changes_key: self.last_id}) or list():
+            for (entry_id, fields) in entries:
+                self.last_id = entry_id
+                if entry_id in self.own_ids:
+                    self.own_ids.discard(entry_id)
+                    continue
+
+                if b'all' in fields:
+                    self._forget_all()
+                else:
+                    self._forget(fields[b'key'].decode('utf-8'))
+
+    def save(self) -> None:
+        """
+        Writes all changed keys to the server in a single MULTI / EXEC transaction
+
+        :return: None
+        """
+        with self.lock:
+            cleared = self.cleared
+            self.cleared = False
+            records = self.take_journal_records()
+
+            try:
+                client = self._get_client()
+                pipe = client.pipeline(transaction=True)
+                # positions of the XADD commands in the pipeline, so we can find the ids of our own changes
+                change_positions = list()
+
+                if cleared:
+                    stale_keys = [self._entry_key(k) for k in self._stored_keys()]
+                    stale_keys.extend(f'{self.prefix}type:{t.decode("utf-8")}'
+                                      for t in client.smembers(f'{self.prefix}types'))
+                    stale_keys.extend([f'{self.prefix}keys', f'{self.prefix}types'])
+                    pipe.delete(*stale_keys)
+                    change_positions.append(len(pipe))
+                    pipe.xadd(self.changes_key, {'all': '1'}, maxlen=CHANGE_LOG_GENERATIONS, approximate=True)
+
+                for record in records:
+                    key = record['key']
+                    entry_key = self._entry_key(key)
+
+                    if 'meta' not in record:
+                        # type index sets are cleaned up lazily in _live_members
+                        pipe.delete(entry_key)
+                        pipe.srem(f'{self.prefix}keys', key)
+                    else:
+                        meta = record['meta']
+                        cache_type = meta.get('cache_type', 'snippet')
+                        pipe.delete(entry_key)
+                        pipe.hset(entry_key, mapping={'value': serialize(record['value']), 'time': meta['time'],
+                                                      'life': int(meta['life']), 'cache_type': cache_type})
+                        expires = self._expiry_of(meta)
+                        if expires != math.inf:
+                            pipe.expireat(entry_key, int(expires) + 1)
+
+                        pipe.sadd(f'{self.prefix}keys', key)
+                        pipe.sadd(f'{self.prefix}type:{cache_type}', key)
+                        pipe.sadd(f'{self.prefix}types', cache_type)
+
+                    change_positions.append(len(pipe))
+                    pipe.xadd(self.changes_key, {'key': key}, maxlen=CHANGE_LOG_GENERATIONS, approximate=True)
+
+                if change_positions:
+                    results = pipe.execute()
+                    self.own_ids.update(results[i] for i in change_positions)
+
+            except self.storage_errors as e:
+                print('Could not save long term cache')
+                print(e)
+
+        return None
+
+
+# available long term cache backends, selected via settings.LONG_TERM_CACHE['BACKEND']
+BACKENDS = {
+    'file': LongTermCache,
+    'sqlite': SqliteLongTermCache,
+    'redis': RedisLongTermCache,
+}
+
+
+def get_cache_dir(app_name: str) -> str:
+    return os.path.join(os.path.expanduser('~'), '.pan_cnc', app_name)
+
+
+def _ensure_cache_dir(app_name: str) -> (str, None):
+    cache_dir = get_cache_dir(app_name)
+
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+    except OSError as ose:
+        print('Could not create application cache dir!')
+        print(ose)
+        return None
+
+    return cache_dir
+
+
+def atomic_write(file_path: str, data: bytes) -> None:
+    """
+    Replace file_path with data such that readers only ever see the old or the new contents, never a partial write
+
+    :param file_path: full path of the file to write
+    :param data: bytes to write
+    :return: None
+    """
+    dir_name = os.path.dirname(file_path)
+    (fd, tmp_path) = tempfile.mkstemp(dir=dir_name, prefix=f'.{os.path.basename(file_path)}.')
+    try:
+        with os.fdopen(fd, 'wb') as tf:
+            tf.write(data)
+            tf.flush()
+            os.fsync(tf.fileno())
+
+        os.chmod(tmp_path, mode=0o600)
+        os.replace(tmp_path, file_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # ensure the rename itself is durable
+    dir_fd = os.open(dir_name, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class _CacheFileLock:
+    """
+    Exclusive lock on $HOME/.pan_cnc/app_name/cache.lock to serialize journal writes and compaction between processes
+    """
+
+    def __init__(self, cache_dir: str, lock_name='cache.lock'):
+        self.lock_file = os.path.join(cache_dir, lock_name)
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+@contextmanager
+def single_flight(app_name: str, name: str):
+    """
+    Allow only one thread in any process to run the enclosed block for this app_name and name at a time. Used around
+    expensive rebuilds of a cached value so that callers who find it missing wait for the one rebuild in progress and
+    then re-check the cache, instead of all rebuilding it at once. Uses a thread lock within this process and a lock
+    file named name.lock in the app cache dir across processes
+
+    :param app_name: name of the CNC application
+    :param name: name of the value being rebuilt
+    :return: None
+    """
+    with _caches_lock:
+        thread_lock = _flight_locks.setdefault((app_name, name), threading.Lock())
+
+    with thread_lock:
+        file_lock = None
+        cache_dir = _ensure_cache_dir(app_name)
+        if cache_dir is not None:
+            try:
+                file_lock = _CacheFileLock(cache_dir, f'{name}.lock').__enter__()
+            except OSError as ose:
+                # still single flight within this process
+                print(f'Could not lock {name} for {app_name}')
+                print(ose)
+
+        try:
+            yield
+        finally:
+            if file_lock is not None:
+                file_lock.__exit__(None, None, None)
+
+
+def serialize(value: any) -> bytes:
+    """
+    Serialize a cached value using the SERIALIZER ('pickle' or 'json') and COMPRESSION ('zlib' or 'none') configured in
+    settings.LONG_TERM_CACHE. SERIALIZER defaults to 'pickle' for the file backend, which is only readable by the
+    current user. The shared sqlite and redis backends always use 'json'. Pickled values are signed, see deserialize
+
+    :param value: value to serialize
+    :return: bytes prefixed with a header describing how they were written
+    """
+    config = getattr(settings, 'LONG_TERM_CACHE', dict())
+
+    key = None
+    if _allows_pickle() and config.get('SERIALIZER', '') != 'json':
+        try:
+            key = _get_signing_key()
+        except OSError as ose:
+            print(f'Could not load long term cache signing key, writing json instead: {ose}')
+
+    if key is None:
+        serializer = b'j'
+        payload = json.dumps(value).encode('utf-8')
+    else:
+        serializer = b's'
+        payload = pickle.dumps(value, protocol=5)
+
+    if config.get('COMPRESSION', 'zlib') == 'zlib':
+        (compression, payload) = (b'z', zlib.compress(payload, 3))
+    else:
+        compression = b'-'
+
+    if serializer == b's':
+        return SERIALIZED_MAGIC + serializer + compression + _sign(key, payload) + payload
+
+    return SERIALIZED_MAGIC + serializer + compression + payload
+
+
+def _allows_pickle() -> bool:
+    """
+    Pickled values are only written to and read from the file backend. Anyone able to write to a shared sqlite or redis
+    backend could otherwise run arbitrary code in every process reading from it
+    """
+    return getattr(settings, 'LONG_TERM_CACHE', dict()).get('BACKEND', 'file') == 'file'
+
+
+def _sign(key: bytes, payload: bytes) -> bytes:
+    return hmac.new(key, payload, hashlib.sha256).digest()
+
+
+def _get_signing_key() -> bytes:
+    """
+    Returns the random key pickled values are signed with, creating it on first use. The key is kept in
+    $HOME/.pan_cnc/cache.key and is only readable by the current user
+
+    :return: key bytes
+    :raises OSError: if the key cannot be read or created
+    """
+    key_path = os.path.join(os.path.expanduser('~'), '.pan_cnc', SIGNING_KEY_FILE)
+    key = _signing_keys.get(key_path, None)
+    if key is not None:
+        return key
+
+    if not os.path.exists(key_path):
+        os.makedirs(os.path.dirname(key_path), mode=0o700, exist_ok=True)
+        # mkstemp creates the file with mode 0600, link it into place so no reader sees a partially written key and
+        # only the first of several processes creating one at the same time wins
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(key_path), prefix=f'.{SIGNING_KEY_FILE}.')
+        try:
+            with os.fdopen(fd, 'wb') as kf:
+                kf.write(os.urandom(SIGNATURE_LENGTH))
+                kf.flush()
+                os.fsync(kf.fileno())
+
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    with open(key_path, 'rb') as kf:
+        key = kf.read()
+
+    if len(key) != SIGNATURE_LENGTH:
+        raise OSError(f'Malformed long term cache signing key in {key_path}')
+
+    _signing_keys[key_path] = key
+    return key
+
+
+def deserialize(data: (bytes, str)) -> any:
+    """
+    Load a value written by serialize(). Data without the serialize() header is treated as plain JSON as written by
+    older versions. Pickled data is only loaded from the file backend, and only when signed with the key of this
+    install, as unpickling data written by anyone else could run arbitrary code
+
+    :param data: serialized value
+    :return: loaded value
+    :raises ValueError: if the data cannot be loaded
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    if not data.startswith(SERIALIZED_MAGIC):
+        return json.loads(data)
+
+    header_length = len(SERIALIZED_MAGIC)
+    serializer = data[header_length:header_length + 1]
+    compression = data[header_length + 1:header_length + 2]
+    payload = data[header_length + 2:]
+
+    if serializer == b's':
+        if not _allows_pickle():
+            raise ValueError('Pickled long term cache values are only loaded from the file backend')
+
+        try:
+            key = _get_signing_key()
+        except OSError as ose:
+            raise ValueError(f'Could not load long term cache signing key: {ose}')
+
+        (signature, payload) = (payload[:SIGNATURE_LENGTH], payload[SIGNATURE_LENGTH:])
+        if not hmac.compare_digest(signature, _sign(key, payload)):
+            raise ValueError('Long term cache value is not signed with the key of this install')
+
+    elif serializer == b'p':
+        raise ValueError('Unsigned pickled long term cache values are no longer loaded')
+
+    try:
+        if compression == b'z':
+            payload = zlib.decompress(payload)
+
+        if serializer == b's':
+            return pickle.loads(payload)
+
+        if serializer == b'j':
+            return json.loads(payload)
+
+    except Exception as e:
+        raise ValueError(f'Could not deserialize long term cache value: {e}')
+
+    raise ValueError(f'Unknown long term cache serializer {serializer}')
+
+
+def load_cache_file(app_name: str) -> dict:
+    """
+    Loads the cache snapshot file from the current users $HOME dir/.pan_cnc/app_name/cache
+
+    :param app_name: name of the current CNC application
+    :return: dict of cache contents, blank dict if the file could not be found or loaded
+    """
+    cache_dir = _ensure_cache_dir(app_name)
+    if cache_dir is None:
+        return dict()
+
+    cache_file = os.path.join(cache_dir, 'cache')
+    cache_contents = dict()
+    try:
+        if not os.path.exists(cache_file):
+            atomic_write(cache_file, serialize(dict()))
+            return cache_contents
+
+        with open(cache_file, 'rb') as cf:
+            cache_contents = deserialize(cf.read())
+
+    except OSError as ose:
+        print('Could not open cache file')
+        print(ose)
+
+    except ValueError as ve:
+        print('Could not load long term cache')
+        print(ve)
+
+    if not isinstance(cache_contents, dict):
+        return dict()
+
+    return cache_contents
+
+
+def _read_journal(cache_dir: str, offset: int) -> (list, int):
+    """
+    Loads all complete records from the cache journal starting at offset. A record that is still being written is
+    left for the next read, and records torn by an interrupted write are skipped
+
+    :param cache_dir: application cache directory
+    :param offset: byte offset in the journal to start reading from
+    :return: tuple of list of journal record dicts and the offset following the last complete record
+    """
+    journal_file = os.path.join(cache_dir, 'cache.journal')
+    records = list()
+
+    if not os.path.exists(journal_file):
+        return records, offset
+
+    with open(journal_file, 'rb') as jf:
+        jf.seek(offset)
+        data = jf.read()
+
+    position = 0
+    complete = 0
+    while position + JOURNAL_HEADER.size <= len(data):
+        (magic, length, crc) = JOURNAL_HEADER.unpack_from(data, position)
+        start = position + JOURNAL_HEADER.size
+        end = start + length
+
+        if magic == JOURNAL_MAGIC and end <= len(data) and zlib.crc32(data[start:end]) == crc:
+            try:
+                record = deserialize(data[start:end])
+                if isinstance(record, dict):
+                    records.append(record)
+            except ValueError as ve:
+                print('Skipping malformed long term cache journal entry')
+                print(ve)
+
+            position = end
+            complete = position
+            continue
+
+        next_record = data.find(JOURNAL_MAGIC, position + 1)
+        if next_record == -1:
+            # the last record is still being written, check again on the next read
+            break
+
+        print('Skipping corrupt long term cache journal entry')
+        position = next_record
+        complete = position
+
+    return records, offset + complete
+
+
+def save_cache_file(app_name: str, contents: dict) -> None:
+    """
+    Writes a complete snapshot of the cache and truncates the journal
+
+    :param app_name: name of the current CNC application
+    :param contents: dict of cache contents in the legacy format
+    :return: None
+    """
+    cache_dir = _ensure_cache_dir(app_name)
+    if cache_dir is None:
+        return None
+
+    try:
+        with _CacheFileLock(cache_dir):
+            _write_snapshot(cache_dir, contents)
+    except OSError:
+        print('Could not save long term cache')
+
+    return None
+
+
+def _write_snapshot(cache_dir: str, contents: dict) -> None:
+    atomic_write(os.path.join(cache_dir, 'cache'), serialize(contents))
+    # journal records are only ever applied when newer than the snapshot, so a crash before this point is harmless
+    atomic_write(os.path.join(cache_dir, 'cache.journal'), b'')
+
+
+def _append_journal(cache_dir: str, records: list) -> int:
+    """
+    Appends records to the journal file, each framed with JOURNAL_HEADER
+
+    :param cache_dir: application cache directory
+    :param records: list of journal records
+    :return: size of the journal after this write
+    """
+    frames = list()
+    for record in records:
+        payload = serialize(record)
+        frames.append(JOURNAL_HEADER.pack(JOURNAL_MAGIC, len(payload), zlib.crc32(payload)))
+        frames.append(payload)
+
+    fd = os.open(os.path.join(cache_dir, 'cache.journal'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(fd, b''.join(frames))
+        os.fsync(fd)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def get_cache(app_name: str) -> LongTermCache:
+    """
+    Returns the LongTermCache for this app, loading it from disk the first time it is requested in this process
+
+    :param app_name: name of the current CNC application
+    :return: LongTermCache object
+    """
+    ltc = _caches.get(app_name, None)
+    if ltc is not None:
+        ltc.maybe_refresh()
+        return ltc
+
+    with _caches_lock:
+        # another thread may have loaded it while we were waiting on the lock
+        if app_name not in _caches:
+            config = getattr(settings, 'LONG_TERM_CACHE', dict())
+            ltc = _get_backend_class(config.get('BACKEND', 'file'))(app_name, config.get('LOCATION', ''))
+            ltc.load()
+            _caches[app_name] = ltc
+            _start_sweeper()
+
+        return _caches[app_name]
+
+
+def _get_backend_class(backend: str) -> type:
+    """
+    Resolve the configured backend name or dotted class path, falling back to the file backend
+
+    :param backend: key of BACKENDS or dotted path to a LongTermCache subclass
+    :return: LongTermCache class
+    """
+    if backend == 'redis' and redis is None:
+        print('The redis package is required for the redis long term cache backend, using file')
+        return LongTermCache
+
+    if backend in BACKENDS:
+        return BACKENDS[backend]
+
+    try:
+        backend_class = import_string(backend)
+    except ImportError:
+        print(f'Unknown long term cache backend {backend}, using file')
+        return LongTermCache
+
+    if not isinstance(backend_class, type) or not issubclass(backend_class, LongTermCache):
+        print(f'Long term cache backend {backend} is not a LongTermCache, using file')
+        return LongTermCache
+
+    return backend_class
+
+
+def get_dirty_caches() -> list:
+    """
+    Returns a list of all LongTermCache objects with unsaved changes
+
+    :return: list of LongTermCache objects
+    """
+    return [c for c in list(_caches.values()) if c.dirty]
+
+
+def flush_dirty_caches() -> None:
+    """
+    Saves all LongTermCaches with unsaved changes
+
+    :return: None
+    """
+    for ltc in get_dirty_caches():
+        ltc.save()
+
+
+def _flush_timer_fired() -> None:
+    global _flush_timer
+
+    with _caches_lock:
+        _flush_timer = None
+
+    flush_dirty_caches()
+
+
+def schedule_flush() -> None:
+    """
+    Schedules a flush of all dirty caches FLUSH_DELAY seconds from now, unless one is already pending. Every change made
+    before the flush fires, from any number of requests, is written out together
+
+    :return: None
+    """
+    global _flush_timer
+
+    with _caches_lock:
+        if _flush_timer is not None:
+            return None
+
+        _flush_timer = threading.Timer(FLUSH_DELAY, _flush_timer_fired)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def sweep_expired_caches() -> None:
+    """
+    Removes expired items from all loaded caches and schedules a flush if anything was removed
+
+    :return: None
+    """
+    removed = 0
+    for ltc in list(_caches.values()):
+        removed += ltc.sweep()
+
+    if removed:
+        print(f'Removed {removed} expired items from the long term cache')
+        schedule_flush()
+
+
+def _sweep_forever() -> None:
+    while True:
+        sleep(SWEEP_INTERVAL)
+        try:
+            sweep_expired_caches()
+        except Exception as e:
+            # never let the sweeper thread die
+            print('Caught error sweeping long term cache')
+            print(e)
+
+
+def _start_sweeper() -> None:
+    """
+    Starts the background sweeper thread if it is not already running. Must be called with _caches_lock held
+
+    :return: None
+    """
+    global _sweeper
+
+    if _sweeper is not None:
+        return None
+
+    _sweeper = threading.Thread(target=_sweep_forever, name='long_term_cache_sweeper', daemon=True)
+    _sweeper.start()
+
+
+def deep_sizeof(value: any, seen: set) -> int:
+    """
+    Returns the approximate number of bytes held by value and everything it references. Objects whose id is already
+    in seen are not counted again, so passing the same set across several calls counts shared objects only once
+
+    :param value: object to measure
+    :param seen: set of ids of objects that have already been counted, updated in place
+    :return: size in bytes
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+
+    return size
+
+
+def memory_usage() -> dict:
+    """
+    Returns the approximate resident size of every loaded cache, keyed by app_name. Objects shared between keys or
+    between apps are attributed to the first cache that references them, so the sum of all apps is the real footprint
+
+    :return: dict of app_name to size in bytes
+    """
+    seen = set()
+    usage = dict()
+    for ltc in list(_caches.values()):
+        with ltc.lock:
+            usage[ltc.app_name] = deep_sizeof(ltc.values, seen)
+
+    return usage
+
+
+# do not lose pending changes on shutdown
+atexit.register(flush_dirty_caches)
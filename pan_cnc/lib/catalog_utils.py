@@ -0,0 +1,210 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Export and import of the fully indexed skillet catalog as a single file
+
+The file holds every indexed repository with the commit it was indexed from and its skillets, along with the long
+term cache entries of the 'cnc' app and each installed app. A container image can ship this file next to its cloned
+repositories, and set settings.CATALOG_SNAPSHOT so the first start imports it instead of loading every skillet file.
+The catalog is only imported when every repository in the file is checked out at the same commit without any local
+changes, otherwise the repositories are indexed as usual. Create the file with
+'python manage.py catalog_snapshot export <path>'. The file is plain JSON, so importing one never runs any code from it,
+and cache entries whose values cannot be written as JSON are left out.
+"""
+
+import json
+import math
+import os
+from time import time
+
+from django.conf import settings
+from django.db import transaction
+
+from cnc.models import RepositoryDetails
+from pan_cnc.lib import cache_utils
+from pan_cnc.lib import cnc_utils
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import dependency_utils
+from pan_cnc.lib import git_utils
+from pan_cnc.lib import snapshot_utils
+
+# bump whenever the layout of the catalog file changes
+CATALOG_VERSION = 1
+
+# cache entries that only describe this host, such as when a repository was last pulled or the inodes of scanned
+# directories, are not exported
+HOST_CACHE_TYPES = ('imported_repos', 'scan_manifest')
+
+
+def export_catalog(file_path: str) -> bool:
+    """
+    Writes every indexed repository, its skillets and the long term caches to file_path. Every repository must be
+    indexed from a clean checkout of the commit it is currently at, see db_utils.refresh_skillets_from_all_repos
+
+    :param file_path: path of the catalog file to write
+    :return: True if the catalog was written
+    """
+    repositories = list()
+    for repo_object in RepositoryDetails.objects.order_by('id'):
+        repo_dir = db_utils.get_repository_dir(repo_object.name)
+        if not _is_clean_checkout(repo_dir, repo_object.indexed_commit) or repo_object.indexed_local_changes != '[]':
+            print(f'Repository {repo_object.name} is not indexed from a clean checkout, could not export the catalog')
+            return False
+
+        repositories.append({
+            'name': repo_object.name,
+            'url': repo_object.url,
+            'details_json': repo_object.details_json,
+            'repo_dir': repo_dir,
+            'commit': repo_object.indexed_commit,
+            'skillets': list(repo_object.skillet_set.order_by('id').values_list('skillet_json', 'content_hash')),
+        })
+
+    caches = dict()
+    for app_name in ['cnc', *settings.INSTALLED_APPS_CONFIG]:
+        caches[app_name] = _export_cache(app_name)
+
+    catalog = {
+        'version': CATALOG_VERSION,
+        'snapshot_version': snapshot_utils.SNAPSHOT_VERSION,
+        'created': time(),
+        'repositories': repositories,
+        'caches': caches,
+    }
+
+    try:
+        cache_utils.atomic_write(os.path.abspath(file_path), json.dumps(catalog).encode('utf-8'))
+    except OSError as ose:
+        print(f'Could not write catalog to {file_path}: {ose}')
+        return False
+
+    print(f'Exported {sum(len(r["skillets"]) for r in repositories)} skillets from {len(repositories)} '
+          f'repositories to {file_path}')
+    return True
+
+
+def import_catalog(file_path: str) -> bool:
+    """
+    Replaces the skillets of every repository in the catalog file with those found there, then loads its long term
+    cache entries. Nothing is imported unless every repository is checked out at the commit it was exported from,
+    without local changes, or if the db is already indexed from those commits
+
+    :param file_path: path of the catalog file to read
+    :return: True if the catalog was imported
+    """
+    try:
+        with open(file_path, 'rb') as cf:
+            catalog = json.loads(cf.read())
+    except FileNotFoundError:
+        print(f'Catalog file {file_path} not found')
+        return False
+    except (OSError, ValueError) as e:
+        print(f'Could not load catalog file {file_path}: {e}')
+        return False
+
+    if not isinstance(catalog, dict) or catalog.get('version', None) != CATALOG_VERSION \
+            or catalog.get('snapshot_version', None) != snapshot_utils.SNAPSHOT_VERSION:
+        print(f'Catalog file {file_path} is from an incompatible version, skipping import')
+        return False
+
+    repositories = catalog['repositories']
+    indexed_commits = dict(RepositoryDetails.objects.filter(indexed_local_changes='[]')
+                           .values_list('name', 'indexed_commit'))
+    if all(indexed_commits.get(r['name'], None) == r['commit'] for r in repositories):
+        print('Skillet catalog is already indexed from the same commits, skipping import')
+        return False
+
+    for repository in repositories:
+        repo_dir = db_utils.get_repository_dir(repository['name'])
+        # skillet_json holds absolute paths, so the repositories must be found in the same place as well
+        if repo_dir != repository['repo_dir'] or not _is_clean_checkout(repo_dir, repository['commit']):
+            print(f'Repository {repository["name"]} is not at commit {repository["commit"]}, skipping import')
+            return False
+
+    with cache_utils.single_flight('cnc', db_utils.INDEX_LOCK), transaction.atomic():
+        for repository in repositories:
+            (repo_object, _) = RepositoryDetails.objects.get_or_create(
+                name=repository['name'],
+                defaults={'url': repository['url'], 'details_json': repository['details_json']}
+            )
+            db_utils.restore_skillets_from_snapshot(repo_object, repository['repo_dir'], repository['commit'],
+                                                    repository['skillets'])
+
+    exported_names = {r['name'] for r in repositories}
+    if RepositoryDetails.objects.exclude(name__in=exported_names).filter(skillet__isnull=False).exists():
+        # other repositories were indexed here as well, the exported catalog would leave out their skillets
+        db_utils.update_skillet_cache()
+    else:
+        # drop anything cached from the previous catalog before loading the new one
+        for app_name in {'cnc', db_utils.get_default_app_name()}:
+            cnc_utils.clear_long_term_cache(app_name)
+
+        for (app_name, entries) in catalog['caches'].items():
+            _import_cache(app_name, entries)
+
+        # rebuilds the catalog from the db if it was not cached when the file was exported
+        dependency_utils.report_dependency_problems(db_utils.load_all_skillets())
+
+    print(f'Imported {sum(len(r["skillets"]) for r in repositories)} skillets from {len(repositories)} '
+          f'repositories in {file_path}')
+    return True
+
+
+def _is_clean_checkout(repo_dir: str, commit: str) -> bool:
+    if not commit or git_utils.get_head_commit(repo_dir) != commit:
+        return False
+
+    return git_utils.get_changed_files(repo_dir, commit) == []
+
+
+def _export_cache(app_name: str) -> list:
+    """
+    Returns the entries of a long term cache as (key, value, remaining life, cache_type) tuples, leaving out expired
+    entries, those of HOST_CACHE_TYPES and those that cannot be written as JSON
+
+    :param app_name: name of the CNC application
+    :return: list of tuples
+    """
+    contents = cache_utils.get_cache(app_name).to_dict()
+    now = time()
+    entries = list()
+    for (key, meta) in contents.pop('meta').items():
+        if key not in contents or meta.get('cache_type', None) in HOST_CACHE_TYPES:
+            continue
+
+        try:
+            json.dumps(contents[key])
+        except (TypeError, ValueError):
+            print(f'Not exporting long term cache value {key} of {app_name}, it cannot be written as JSON')
+            continue
+
+        expires = cache_utils.LongTermCache._expiry_of(meta)
+        if expires == math.inf:
+            entries.append((key, contents[key], -1, meta.get('cache_type', None)))
+        elif expires > now:
+            entries.append((key, contents[key], int(expires - now), meta.get('cache_type', None)))
+
+    return entries
+
+
+def _import_cache(app_name: str, entries: list) -> None:
+    ltc = cache_utils.get_cache(app_name)
+    for (key, value, life, cache_type) in entries:
+        ltc.set(key, value, life, cache_type)
+
+    # save now so other processes pick up the imported catalog rather than rebuilding it
+    ltc.save()
@@ -15,18 +15,17 @@
 # Author: Nathan Embery nembery@paloaltonetworks.com
 
 import io
-import json
 import logging
 import os
 import pickle
 import re
 from pathlib import Path
-from time import time
 
 import pyAesCrypt
 from django.conf import settings
 from django.core.cache import cache
 
+from pan_cnc.lib import cache_utils
 from pan_cnc.lib import git_utils
 from pan_cnc.lib import snippet_utils
 
@@ -209,184 +208,43 @@ def set_cached_value(key, val):
     cache.set(key, val)
 
 
-def _load_long_term_cache(app_name: str) -> None:
+def save_long_term_cache(app_name: str, contents: dict) -> None:
     """
-    Loads the cache file from the current users $HOME dir/.pan_cnc/app_name/cache
+    Writes the long term cache contents to $HOME/.pan_cnc/app_name/cache
     :param app_name: name of the current CNC application
+    :param contents: dict of cached values in the legacy file format
     :return: None
     """
-    path = os.path.expanduser('~')
-
-    cache_dir = os.path.join(path, '.pan_cnc', app_name)
-
-    try:
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir, mode=0o700)
-    except OSError as ose:
-        print('Could not create application cache dir!')
-        print(ose)
-        return None
-
-    cache_file = os.path.join(cache_dir, 'cache')
-    cache_contents = dict()
-    try:
-        if not os.path.exists(cache_file):
-            with open(cache_file, 'w') as cf:
-                cf.write(json.dumps(dict()))
-
-            os.chmod(cache_file, mode=0o600)
-            return None
-
-        with open(cache_file, 'r+') as cf:
-            cache_contents_str = cf.read()
-            cache_contents = json.loads(cache_contents_str)
-
-    except OSError as ose:
-        print('Could not open cache file')
-        print(ose)
-
-    except ValueError as ve:
-        print('Could not load long term cache')
-        print(ve)
-
-    # always set something in the in-memory cache, even if it's only a blank dict
-    cache.set(f'{app_name}_cache', cache_contents)
-    return None
-
-
-def save_long_term_cache(app_name: str, contents: dict) -> None:
-    json_string = json.dumps(contents)
-
-    path = os.path.expanduser('~')
-    cache_dir = os.path.join(path, '.pan_cnc', app_name)
-
-    try:
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir, mode=0o700)
-
-        cache_file = os.path.join(cache_dir, 'cache')
-
-        with open(cache_file, 'w+') as cf:
-            cf.write(json_string)
-    except OSError:
-        print('Could not save long term cache')
-
-    return None
+    cache_utils.save_cache_file(app_name, contents)
 
 
 def get_long_term_cached_value(app_name: str, key: str) -> any:
-    cache_key = f'{app_name}_cache'
-
-    if cache_key not in cache:
-        _load_long_term_cache(app_name)
-
-    ltc = cache.get(cache_key, dict())
-
-    if 'meta' not in ltc:
-        return None
-
-    if key not in ltc['meta']:
-        return None
-
-    now = time()
-
-    if 'time' not in ltc['meta'][key]:
-        return None
-    if 'life' not in ltc['meta'][key]:
-        return None
-
-    time_added = ltc['meta'][key]['time']
-    try:
-        life = int(ltc['meta'][key]['life'])
-    except ValueError:
-        print('could not parse life value from cache entry')
-        return None
-
-    # Allow -1 to indicate cached items that should stay cached forever
-    if life == -1:
-        return ltc.get(key, None)
-
-    if (now - time_added) > life:
-        print(f'Aging out cache item for {key}')
-        return None
-
-    # print(f'Cache hit for {key}')
-    return ltc.get(key, None)
+    """
+    Returns a value from the long term cache. The returned object is shared with every other caller in this process
+    and must be treated as read-only. Use set_long_term_cached_value to store a modified copy.
+    :param app_name: name of the current CNC application
+    :param key: name of the cached item
+    :return: cached value or None if not found or expired
+    """
+    return cache_utils.get_cache(app_name).get(key)
 
 
 def set_long_term_cached_value(app_name: str, key: str, value: any, life=3600, cache_type='snippet') -> None:
-    cache_key = f'{app_name}_cache'
-
-    if cache_key not in cache:
-        _load_long_term_cache(app_name)
-
-    ltc = cache.get(cache_key, dict())
-
-    if key in ltc and value is None:
-        ltc.pop(key)
-        if 'meta' in ltc and key in ltc['meta']:
-            ltc['meta'].pop(key)
-
-    else:
-        ltc[key] = value
-
-        # Ensure all meta values are kept around so we can evict items from the cache
-        if 'meta' not in ltc:
-            ltc['meta'] = dict()
-
-        ltc['meta'][key] = dict()
-        ltc['meta'][key]['time'] = time()
-        ltc['meta'][key]['life'] = life
-        ltc['meta'][key]['cache_type'] = cache_type
-
-    cache.set(cache_key, ltc)
-
-    apps_to_save = cache.get('ltc_dirty', list())
-
-    if type(apps_to_save) is not list:
-        apps_to_save = list()
-
-    if app_name not in apps_to_save:
-        apps_to_save.append(app_name)
-
-    cache.set('ltc_dirty', apps_to_save)
-    # save_long_term_cache(app_name, ltc)
+    cache_utils.get_cache(app_name).set(key, value, life, cache_type)
     return None
 
 
 def clear_long_term_cache(app_name: str) -> None:
-    ltc = dict()
-    cache_key = f'{app_name}_cache'
-    cache.set(cache_key, ltc)
-
-    apps_to_save = cache.get('ltc_dirty', list())
-
-    if type(apps_to_save) is not list:
-        apps_to_save = list()
-
-    if app_name not in apps_to_save:
-        apps_to_save.append(app_name)
-
-    cache.set('ltc_dirty', apps_to_save)
-    save_long_term_cache(app_name, ltc)
-    # print('Cleared')
+    ltc = cache_utils.get_cache(app_name)
+    ltc.clear()
+    ltc.save()
     return None
 
 
 def evict_cache_items_of_type(app_name, cache_type):
-    cache_key = f'{app_name}_cache'
-
-    if cache_key not in cache:
-        _load_long_term_cache(app_name)
-
-    ltc = cache.get(cache_key, dict())
-    if 'meta' in ltc:
-        for key in ltc['meta']:
-            if 'cache_type' in ltc['meta'][key]:
-                if ltc['meta'][key]['cache_type'] == cache_type:
-                    if key in ltc:
-                        print(f'Evicting item {key}')
-                        set_long_term_cached_value(app_name, key, None, 0, cache_type)
+    evicted = cache_utils.get_cache(app_name).evict_type(cache_type)
+    if evicted:
+        print(f'Evicted {len(evicted)} items of type {cache_type}')
 
 
 def init_app(app_cnc_config):
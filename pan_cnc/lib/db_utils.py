@@ -1,13 +1,46 @@
+import hashlib
 import json
 import os
+from fnmatch import fnmatch
+from pathlib import Path
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Min
+from django.db.models import QuerySet
 from skilletlib import SkilletLoader
+from skilletlib.exceptions import SkilletLoaderException
+from yaml.error import YAMLError
 
 from cnc.models import RepositoryDetails
 from cnc.models import Skillet
+from cnc.models import SkilletLabel
+from pan_cnc.lib import cache_utils
 from pan_cnc.lib import cnc_utils
+from pan_cnc.lib import dependency_utils
+from pan_cnc.lib import git_utils
+from pan_cnc.lib import parallel_utils
+from pan_cnc.lib import search_utils
+from pan_cnc.lib import snapshot_utils
+from pan_cnc.lib import yaml_utils
+
+# Skillet columns summarizing skillet_json, see get_skillet_summary_fields
+SUMMARY_FIELDS = ('type', 'label', 'description', 'collection', 'labels_json', 'extends')
+
+# records per UPDATE statement in bulk_update, which builds a CASE expression per field and record
+UPDATE_BATCH_SIZE = 50
+
+# longest label value held in SkilletLabel.value
+LABEL_VALUE_MAX_LENGTH = 512
+
+# single_flight lock held in the 'cnc' cache dir from reading the existing skillet records of a repository until the
+# changes are written, so two indexers never both create the same new skillet
+INDEX_LOCK = 'skillet_index'
+
+# most files edited since the last full index that refresh_skillets_in_paths keeps track of, past this the entire
+# repository is indexed again
+MAX_LOCAL_CHANGES = 500
 
 
 def initialize_default_repositories(app_name) -> None:
@@ -53,44 +86,35 @@ def initialize_repo(repo_detail: dict) -> list:
 
 def load_skillets_from_repo(repo_name: str) -> list:
     """
-    returns a list of skillets from the repository as found in the db
+    returns a summary of each skillet from the repository as found in the db, see load_skillet_summaries
     :param repo_name: name of the repository to search
-    :return: list of skillet dictionary objects
+    :return: list of skillet summary dicts
     """
-    all_skillets = list()
-
     try:
         repo_object = RepositoryDetails.objects.get(name=repo_name)
-
-        repo_skillet_qs = repo_object.skillet_set.all()
-        for skillet in repo_skillet_qs:
-            all_skillets.append(json.loads(skillet.skillet_json))
-
-        return all_skillets
-
     except ObjectDoesNotExist:
-        return all_skillets
-    except ValueError:
-        return all_skillets
+        return list()
+
+    return load_skillet_summaries(repo_object.skillet_set.all())
 
 
 def update_skillet_cache() -> None:
     """
     Updates the 'all_snippets' key in the cnc cache. This gets called whenever a repository is initialized or updated
-    to ensure the legacy cache is always kept up to date
+    to ensure the legacy cache is always kept up to date. The catalog is only held under the 'cnc' app name, every
+    app reads it from there via snippet_utils.load_all_snippets
     :return: None
     """
-    all_skillets = load_all_skillets(refresh=True)
     # FIXME - this can and will break if every more than one app tries to do this...
     app_name = get_default_app_name()
 
-    # ensure everything gets removed!
-    cnc_utils.clear_long_term_cache(app_name)
+    # the new catalog is built in full before it replaces the old one, readers keep using the old one until then
+    catalog = load_all_skillets(refresh=True)
+    # builds the extends graph for the new catalog now, reporting any cycles at index time rather than on first use
+    dependency_utils.report_dependency_problems(catalog)
 
-    cnc_utils.set_long_term_cached_value(app_name, 'all_snippets', all_skillets, -1)
-    # db_utils.load_add_skillets saves all_skillets under 'cnc' app name, ensure this is updated here as well...
-    cnc_utils.set_long_term_cached_value('cnc', 'all_snippets', all_skillets, -1)
-    # remove it all!
+    # ensure everything gets removed! This also drops any copy of the catalog left under the app name by older versions
+    cnc_utils.clear_long_term_cache(app_name)
 
 
 def get_repository_details(repository_name: str) -> (dict, None):
@@ -136,54 +160,727 @@ def update_repository_details(repo_name: str, repo_detail: dict) -> None:
 
 
 def refresh_skillets_from_repo(repo_name: str) -> list:
+    """
+    Re-index the skillets found in a repository. If the repository was indexed before from a commit that still exists,
+    only the skillet directories containing files that changed since then are loaded again, otherwise the entire
+    repository is loaded
+
+    :param repo_name: name of the repository to index
+    :return: list of skillet dictionary objects from this repository
+    """
     all_skillets = list()
 
-    user_dir = os.path.expanduser('~/.pan_cnc')
+    with cache_utils.single_flight('cnc', INDEX_LOCK):
+        try:
+            repo_object = RepositoryDetails.objects.get(name=repo_name)
+        except ObjectDoesNotExist:
+            return all_skillets
 
-    app_name = get_default_app_name()
-    snippets_dir = os.path.join(user_dir, app_name, 'repositories')
-    repo_dir = os.path.join(snippets_dir, repo_name)
+        changes = _load_repo_changes(repo_object)
 
-    try:
-        repo_object = RepositoryDetails.objects.get(name=repo_name)
+        # all skillet changes and the commit they were indexed from are written together or not at all
+        with transaction.atomic():
+            _save_repo_changes(repo_object, changes)
+
+    if changes['changed']:
+        update_skillet_cache()
+
+    return load_skillets_from_repo(repo_name)
 
-        sl = SkilletLoader()
 
-        found_skillets = sl.load_all_skillets_from_dir(repo_dir)
-
-        for skillet_object in found_skillets:
-            skillet_name = skillet_object.name
-            (skillet_record, created) = Skillet.objects.get_or_create(
-                name=skillet_name,
-                defaults={
-                    'skillet_json': json.dumps(skillet_object.skillet_dict),
-                    'repository_id': repo_object.id,
-                }
-            )
-
-            if not created:
-                # check if skillet contents have been updated
-                found_skillet_json = json.dumps(skillet_object.skillet_dict)
-                if skillet_record.skillet_json != found_skillet_json:
-                    skillet_record.skillet_json = found_skillet_json
-                    skillet_record.save()
+def _load_repo_changes(repo_object: RepositoryDetails) -> dict:
+    """
+    Loads everything that changed in a repository since it was last indexed, without writing anything to the db
 
+    :param repo_object: RepositoryDetails db record
+    :return: dict of the changes to pass to _save_repo_changes
+    """
+    repo_dir = get_repository_dir(repo_object.name)
+
+    head_commit = git_utils.get_head_commit(repo_dir)
+
+    local_changes = list()
+    if head_commit is not None:
+        local_changes = git_utils.get_changed_files(repo_dir, head_commit) or list()
+
+    changes = {
+        'changed': True,
+        'repo_dir': repo_dir,
+        'head_commit': head_commit,
+        'local_changes': local_changes,
+        'content_hashes': None,
+    }
+
+    if head_commit is not None and head_commit != repo_object.indexed_commit and not local_changes:
+        snapshot = snapshot_utils.load_snapshot(repo_object.name, repo_dir, head_commit)
+        if snapshot is not None:
+            print(f'Restoring skillets in {repo_object.name} at {head_commit} from the index snapshot')
+            changes.update(_get_snapshot_changes(repo_object, snapshot))
+            return changes
+
+    changed_dirs = _get_changed_skillet_dirs(repo_object, repo_dir, head_commit)
+
+    if changed_dirs is None and not repo_object.skillet_set.exclude(content_hash='').exists():
+        # nothing to compare against yet, load the entire repository
+        if parallel_utils.get_worker_count() > 1:
+            found_skillets = _load_skillet_files(_find_skillet_definitions(Path(repo_dir)), repo_dir)
+        else:
+            sl = SkilletLoader()
+            found_skillets = [skillet.skillet_dict for skillet in sl.load_all_skillets_from_dir(repo_dir)]
+
+        expected_paths = dict()
         for db_skillet in repo_object.skillet_set.all():
-            found = False
-            for found_skillet in found_skillets:
-                if db_skillet.name == found_skillet.name:
-                    found = True
-                    continue
+            skillet_dict = json.loads(db_skillet.skillet_json)
+            expected_paths[_get_definition_path(skillet_dict)] = db_skillet.name
+
+        unchanged_names = _get_unloaded_names(expected_paths, found_skillets)
+        expected_skillets = repo_object.skillet_set.all()
+    elif changed_dirs is None:
+        definitions = _find_skillet_definitions(Path(repo_dir))
+        (found_skillets, unchanged_names, expected_skillets) = _load_changed_skillets(repo_object, definitions)
+    elif changed_dirs:
+        (found_skillets, unchanged_names, expected_skillets) = _load_skillet_dirs(repo_object, changed_dirs)
+    else:
+        changes['changed'] = False
+        return changes
+
+    changes['found_skillets'] = found_skillets
+    changes['unchanged_names'] = unchanged_names
+    changes['expected_skillets'] = expected_skillets
+    return changes
+
+
+def _get_snapshot_changes(repo_object: RepositoryDetails, snapshot: list) -> dict:
+    """
+    Replace every skillet of a repository with those of a snapshot
+
+    :param repo_object: RepositoryDetails db record
+    :param snapshot: list of (skillet_json, content_hash) tuples
+    :return: dict of the found, unchanged and expected skillets to add to the changes of _load_repo_changes
+    """
+    found_skillets = [json.loads(skillet_json) for (skillet_json, _) in snapshot]
+    return {
+        'found_skillets': found_skillets,
+        'content_hashes': {d['name']: h for (d, (_, h)) in zip(found_skillets, snapshot)},
+        'unchanged_names': list(),
+        'expected_skillets': repo_object.skillet_set.all(),
+    }
+
+
+def restore_skillets_from_snapshot(repo_object: RepositoryDetails, repo_dir: str, head_commit: str,
+                                   snapshot: list) -> None:
+    """
+    Index a clean checkout of a repository from a snapshot of its skillets taken at the same commit, without loading
+    any skillet files. Call inside a transaction while holding the INDEX_LOCK, then update_skillet_cache once the
+    transaction is committed
+
+    :param repo_object: RepositoryDetails db record
+    :param repo_dir: full path to the repository
+    :param head_commit: SHA of the commit currently checked out, which the snapshot was taken from
+    :param snapshot: list of (skillet_json, content_hash) tuples of every skillet in the repository
+    :return: None
+    """
+    changes = {
+        'changed': True,
+        'repo_dir': repo_dir,
+        'head_commit': head_commit,
+        'local_changes': list(),
+    }
+    changes.update(_get_snapshot_changes(repo_object, snapshot))
+    _save_repo_changes(repo_object, changes)
+
+
+def get_repository_dir(repo_name: str) -> str:
+    """
+    Returns the full path of an imported repository of the default app
+
+    :param repo_name: name of the repository
+    :return: absolute path, which may not exist
+    """
+    return os.path.join(os.path.expanduser('~/.pan_cnc'), get_default_app_name(), 'repositories', repo_name)
+
+
+def _save_repo_changes(repo_object: RepositoryDetails, changes: dict) -> None:
+    """
+    Writes the changes found by _load_repo_changes along with the commit they were indexed from. Call inside a
+    transaction
+
+    :param repo_object: RepositoryDetails db record
+    :param changes: dict as returned from _load_repo_changes
+    :return: None
+    """
+    if changes['changed']:
+        _save_skillets(repo_object, changes['found_skillets'], changes['unchanged_names'],
+                       changes['expected_skillets'], changes['content_hashes'])
+
+    head_commit = changes['head_commit']
+    repo_object.indexed_commit = head_commit or ''
+    repo_object.indexed_local_changes = json.dumps(changes['local_changes'])
+    repo_object.save(update_fields=['indexed_commit', 'indexed_local_changes'])
+
+    # the skillets of a clean checkout are exactly those of the commit, keep them for the next time it is checked out
+    if head_commit is not None and not changes['local_changes'] \
+            and not snapshot_utils.has_snapshot(repo_object.name, head_commit):
+        skillets = list(repo_object.skillet_set.order_by('id').values_list('skillet_json', 'content_hash'))
+        snapshot_utils.save_snapshot(repo_object.name, changes['repo_dir'], head_commit, skillets)
+
+
+def _get_changed_skillet_dirs(repo_object: RepositoryDetails, repo_dir: str, head_commit: str) -> (set, None):
+    """
+    Find the skillet directories that contain changes since this repository was last indexed. Each changed file is
+    attributed to the closest directory above it that holds a skillet definition now or did when last indexed
+
+    :param repo_object: RepositoryDetails db record
+    :param repo_dir: full path to the repository
+    :param head_commit: SHA of the commit currently checked out
+    :return: set of absolute skillet directory paths, or None if the entire repository must be indexed
+    """
+    if not repo_object.indexed_commit or head_commit is None:
+        return None
+
+    changed_files = git_utils.get_changed_files(repo_dir, repo_object.indexed_commit)
+    if changed_files is None:
+        return None
+
+    try:
+        changed_files.extend(json.loads(repo_object.indexed_local_changes))
+    except ValueError:
+        return None
+
+    return _get_skillet_dirs_of_files(repo_object, repo_dir, changed_files)
+
+
+def refresh_skillets_in_paths(repo_name: str, changed_files: list) -> None:
+    """
+    Re-index only the skillet directories holding the given files, for example after they were edited in place. Falls
+    back to refresh_skillets_from_repo whenever the changes could affect skillets outside those directories
 
-            if not found:
-                db_skillet.delete()
+    :param repo_name: name of the repository
+    :param changed_files: paths of the changed files, relative to the repository directory
+    :return: None
+    """
+    with cache_utils.single_flight('cnc', INDEX_LOCK):
+        changed = _refresh_skillets_in_paths(repo_name, changed_files)
 
+    if changed is None:
+        refresh_skillets_from_repo(repo_name)
+    elif changed:
         update_skillet_cache()
 
-        return load_skillets_from_repo(repo_name)
 
+def _refresh_skillets_in_paths(repo_name: str, changed_files: list) -> (bool, None):
+    """
+    Does the work of refresh_skillets_in_paths while holding the INDEX_LOCK
+
+    :param repo_name: name of the repository
+    :param changed_files: paths of the changed files, relative to the repository directory
+    :return: whether any skillets were indexed again, or None if the entire repository must be indexed instead
+    """
+    repo_dir = get_repository_dir(repo_name)
+
+    try:
+        repo_object = RepositoryDetails.objects.get(name=repo_name)
     except ObjectDoesNotExist:
-        return all_skillets
+        return False
+
+    # the next refresh_skillets_from_repo must check these files again, as they may since have been reverted
+    try:
+        local_changes = set(json.loads(repo_object.indexed_local_changes))
+    except ValueError:
+        local_changes = set()
+
+    local_changes.update(changed_files)
+    if len(local_changes) > MAX_LOCAL_CHANGES:
+        # index the entire repository instead, which records only the files git currently reports as changed
+        return None
+
+    changed_dirs = _get_skillet_dirs_of_files(repo_object, repo_dir, changed_files)
+    if changed_dirs is None:
+        return None
+
+    if not changed_dirs:
+        return False
+
+    (found_skillets, unchanged_names, expected_skillets) = _load_skillet_dirs(repo_object, changed_dirs)
+
+    with transaction.atomic():
+        _save_skillets(repo_object, found_skillets, unchanged_names, expected_skillets)
+        repo_object.indexed_local_changes = json.dumps(sorted(local_changes))
+        repo_object.save(update_fields=['indexed_local_changes'])
+
+    return True
+
+
+def _load_skillet_dirs(repo_object: RepositoryDetails, changed_dirs: set) -> tuple:
+    print(f'Indexing {len(changed_dirs)} changed skillet directories in {repo_object.name}')
+    definitions = list()
+    for changed_dir in changed_dirs:
+        path = Path(changed_dir)
+        if path.is_dir():
+            definitions.extend(path.glob('*.skillet.y*ml'))
+            definitions.extend(path.glob('.meta-cnc.y*ml'))
+
+    return _load_changed_skillets(repo_object, definitions, changed_dirs)
+
+
+def _get_skillet_dirs_of_files(repo_object: RepositoryDetails, repo_dir: str, changed_files: list) -> (set, None):
+    """
+    Attribute each changed file to the closest directory above it that holds a skillet definition now or did when last
+    indexed
+
+    :param repo_object: RepositoryDetails db record
+    :param repo_dir: full path to the repository
+    :param changed_files: paths of the changed files, relative to the repository directory
+    :return: set of absolute skillet directory paths, or None if the entire repository must be indexed
+    """
+    if not changed_files:
+        return set()
+
+    # skillet directories as of the last index, keyed by the name of the skillet found there
+    skillet_dirs = dict()
+    skillet_dicts = list()
+    for skillet in repo_object.skillet_set.all():
+        try:
+            skillet_dict = json.loads(skillet.skillet_json)
+        except ValueError:
+            return None
+
+        if 'skillet_path' not in skillet_dict:
+            return None
+
+        skillet_dirs[skillet.name] = skillet_dict['skillet_path']
+        skillet_dicts.append(skillet_dict)
+
+    known_dirs = set(skillet_dirs.values())
+    changed_dirs = set()
+    repo_path = os.path.abspath(repo_dir)
+
+    for changed_file in changed_files:
+        if changed_file == '.gitmodules':
+            # submodules are loaded along with the skillets that include them
+            return None
+
+        changed_path = os.path.join(repo_path, changed_file)
+        if os.path.isdir(changed_path):
+            # a submodule commit was updated
+            return None
+
+        # a directory that was removed or moved away, along with any skillets in it
+        removed_dirs = {d for d in known_dirs if d == changed_path or d.startswith(changed_path + os.sep)}
+        if removed_dirs:
+            changed_dirs.update(removed_dirs)
+            continue
+
+        file_name = os.path.basename(changed_file)
+        if file_name.startswith('.meta-cnc.y') or '.skillet.y' in file_name:
+            changed_dirs.add(os.path.dirname(changed_path))
+            continue
+
+        parent = os.path.dirname(changed_path)
+        while len(parent) >= len(repo_path):
+            if parent in known_dirs or _has_skillet_definition(parent):
+                changed_dirs.add(parent)
+                break
+
+            parent = os.path.dirname(parent)
+
+    # skillets that include a changed skillet have its snippets compiled in, fall back to a full index for those
+    changed_names = {name for (name, path) in skillet_dirs.items() if path in changed_dirs}
+    for skillet_dict in skillet_dicts:
+        for snippet in skillet_dict.get('snippets', []):
+            included_name = str(snippet.get('name', '')).split('.')[0]
+            if included_name in changed_names and included_name != skillet_dict.get('name', ''):
+                return None
+
+    return changed_dirs
+
+
+def _has_skillet_definition(directory: str) -> bool:
+    path = Path(directory)
+    return any(path.glob('.meta-cnc.y*ml')) or any(path.glob('*.skillet.y*ml'))
+
+
+def _find_skillet_definitions(directory: Path) -> list:
+    """
+    Returns the paths of all skillet definition files below directory without parsing them. Skips the same
+    directories as SkilletLoader as well as submodules, which SkilletLoader does not index either
+
+    :param directory: directory to begin searching
+    :return: list of absolute Paths
+    """
+    definitions = list()
+    try:
+        entries = list(os.scandir(directory))
+    except OSError as ose:
+        print(f'Could not access {directory}')
+        print(ose)
+        return definitions
+
+    for entry in entries:
+        if entry.is_file() and (entry.name.startswith('.meta-cnc.y') or fnmatch(entry.name, '*.skillet.y*ml')):
+            definitions.append(Path(entry.path).absolute())
+
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False) or entry.name in SkilletLoader.skip_dirs:
+            continue
+
+        if os.path.exists(os.path.join(entry.path, '.git')):
+            continue
+
+        definitions.extend(_find_skillet_definitions(Path(entry.path)))
+
+    return definitions
+
+
+def _get_content_hash(skillet_dict: dict, skillet_dicts=None, including_names=frozenset()) -> str:
+    """
+    Hash the source of a skillet: the bytes of its definition file and of every file its snippets load. The result
+    only changes when one of those files does, so matching hashes mean the skillet does not need to be loaded again.
+    Skillets that include snippets from other skillets depend on those as well, so the hashes of the included skillets
+    are added in
+
+    :param skillet_dict: loaded skillet dictionary
+    :param skillet_dicts: dict of skillet name to skillet dictionary, used to find the included skillets
+    :param including_names: names of the skillets that include this one, to stop at include cycles
+    :return: hex sha256 digest, or an empty str if the skillet must always be loaded
+    """
+    skillet_name = skillet_dict.get('name', '')
+    skillet_path = skillet_dict.get('skillet_path', None)
+    skillet_filename = skillet_dict.get('skillet_filename', None)
+
+    if skillet_path is None or skillet_filename is None:
+        return ''
+
+    included_names = _get_included_names(skillet_dict)
+    files = [skillet_filename]
+    for snippet in skillet_dict.get('snippets', []):
+        if not isinstance(snippet, dict):
+            continue
+
+        # the files of included snippets are relative to the included skillet, and are part of its hash
+        if str(snippet.get('name', '')).split('.')[0] in included_names:
+            continue
+
+        if snippet.get('file', None):
+            files.append(str(snippet['file']))
+
+    content_hash = hashlib.sha256()
+    for file_name in files:
+        content_hash.update(file_name.encode('utf-8') + b'\0')
+        try:
+            with open(os.path.join(skillet_path, file_name), 'rb') as source_file:
+                content_hash.update(source_file.read())
+        except OSError:
+            content_hash.update(b'\0missing\0')
+
+    for included_name in included_names:
+        included_dict = (skillet_dicts or dict()).get(included_name, None)
+        if included_dict is None or included_name in including_names:
+            return ''
+
+        included_hash = _get_content_hash(included_dict, skillet_dicts, including_names.union([skillet_name]))
+        if not included_hash:
+            return ''
+
+        content_hash.update(f'\0include\0{included_name}\0{included_hash}'.encode('utf-8'))
+
+    return content_hash.hexdigest()
+
+
+def _get_included_names(skillet_dict: dict) -> list:
+    """
+    Returns the names of the skillets this skillet includes snippets from. Included snippets are named for the skillet
+    they come from
+
+    :param skillet_dict: loaded skillet dictionary
+    :return: list of skillet names
+    """
+    skillet_name = skillet_dict.get('name', '')
+    included_names = list()
+    for snippet in skillet_dict.get('snippets', []):
+        if not isinstance(snippet, dict):
+            continue
+
+        snippet_name = str(snippet.get('name', ''))
+        included_name = snippet_name.split('.')[0]
+        if '.' in snippet_name and included_name != skillet_name and included_name not in included_names:
+            included_names.append(included_name)
+
+    return included_names
+
+
+def _load_changed_skillets(repo_object: RepositoryDetails, definitions: list, changed_dirs=None) -> tuple:
+    """
+    Load the skillets from the given definition files, skipping any whose content hash matches the db record
+
+    :param repo_object: RepositoryDetails db record
+    :param definitions: list of Paths of skillet definition files
+    :param changed_dirs: set of directories the definitions were found in, or None if they cover the entire repository
+    :return: tuple of the list of skillet dictionaries loaded, the list of names of unchanged skillets, and the Skillet
+    db records that were expected to be found
+    """
+    records = dict()
+    expected_ids = list()
+    expected_paths = dict()
+
+    for db_skillet in repo_object.skillet_set.all():
+        skillet_dict = json.loads(db_skillet.skillet_json)
+        skillet_path = skillet_dict.get('skillet_path', '')
+        definition_path = _get_definition_path(skillet_dict)
+        if changed_dirs is None or skillet_path in changed_dirs:
+            expected_ids.append(db_skillet.id)
+            expected_paths[definition_path] = db_skillet.name
+
+        records[definition_path] = (db_skillet, skillet_dict)
+
+    changed_definitions = list()
+    unchanged_names = list()
+    skillet_dicts = {skillet_dict['name']: skillet_dict for (_, skillet_dict) in records.values()}
+
+    for definition in definitions:
+        (db_skillet, skillet_dict) = records.get(str(definition.absolute()), (None, None))
+        if db_skillet is not None and db_skillet.content_hash \
+                and db_skillet.content_hash == _get_content_hash(skillet_dict, skillet_dicts):
+            unchanged_names.append(db_skillet.name)
+            continue
+
+        changed_definitions.append(definition)
+
+    found_skillets = _load_skillet_files(changed_definitions, get_repository_dir(repo_object.name))
+    unchanged_names.extend(_get_unloaded_names(expected_paths, found_skillets))
+    return found_skillets, unchanged_names, Skillet.objects.filter(id__in=expected_ids)
+
+
+def _get_definition_path(skillet_dict: dict) -> str:
+    return os.path.join(skillet_dict.get('skillet_path', ''), skillet_dict.get('skillet_filename', ''))
+
+
+def _get_unloaded_names(expected_paths: dict, found_skillets: list) -> list:
+    """
+    Find the indexed skillets whose definition file is still there but could not be loaded again, for example while
+    it holds a syntax error. These keep their last indexed version rather than being deleted
+
+    :param expected_paths: dict of definition file path to the name of the skillet indexed from it
+    :param found_skillets: list of skillet dictionaries that were loaded
+    :return: list of skillet names
+    """
+    found_paths = {_get_definition_path(d) for d in found_skillets}
+    unloaded_names = list()
+    for (definition_path, skillet_name) in expected_paths.items():
+        if definition_path not in found_paths and os.path.isfile(definition_path):
+            print(f'Keeping the last indexed version of skillet {skillet_name}')
+            unloaded_names.append(skillet_name)
+
+    return unloaded_names
+
+
+def _load_skillet_files(definitions: list, repo_dir: str) -> list:
+    """
+    Load the skillets from the given definition files, in parallel if settings.SKILLET_INDEX_WORKERS allows. Skillets
+    that include other skillets are then compiled by a SkilletLoader holding every skillet of the repository, as the
+    included skillets may be found in any directory
+
+    :param definitions: list of Paths of skillet definition files
+    :param repo_dir: full path to the repository holding the definitions
+    :return: list of loaded skillet dictionaries in the same order, leaving out any that could not be loaded
+    """
+    loaded_skillets = parallel_utils.map_in_processes(_load_skillet_file, definitions)
+
+    if any(skillet_dict is not None and _has_includes(skillet_dict) for skillet_dict in loaded_skillets):
+        sl = SkilletLoader()
+        repo_skillets = dict()
+        for skillet in sl.load_all_skillets_from_dir(repo_dir):
+            skillet_dict = skillet.skillet_dict
+            repo_skillets[_get_definition_path(skillet_dict)] = skillet_dict
+
+        for (i, definition) in enumerate(definitions):
+            if loaded_skillets[i] is None or not _has_includes(loaded_skillets[i]):
+                continue
+
+            skillet_name = loaded_skillets[i].get('name', '')
+            loaded_skillets[i] = repo_skillets.get(str(definition.absolute()), None)
+            if loaded_skillets[i] is None:
+                print(f'Could not load skillet from {definition}')
+                for error in sl.skillet_errors:
+                    if error.get('path', None) == skillet_name:
+                        print(error.get('error', ''))
+
+    return [skillet_dict for skillet_dict in loaded_skillets if skillet_dict is not None]
+
+
+def _has_includes(skillet_dict: dict) -> bool:
+    return any('include' in snippet for snippet in skillet_dict.get('snippets', []) if isinstance(snippet, dict))
+
+
+def _load_skillet_file(definition: Path) -> (dict, None):
+    """
+    Load a single skillet definition file. Runs in the worker processes used by _load_skillet_files. The metadata is
+    read with yaml_utils, then normalized and compiled by skilletlib exactly as SkilletLoader.load_skillet_from_path
+    would. Skillets that include other skillets are returned normalized but not compiled, for _load_skillet_files to
+    resolve against the whole repository
+
+    :param definition: Path of the skillet definition file
+    :return: skillet dictionary or None if it could not be loaded
+    """
+    sl = SkilletLoader()
+    try:
+        with definition.open(mode='r', encoding='utf-8') as sc:
+            skillet_dict = sl.normalize_skillet_dict(yaml_utils.safe_load(sc.read()))
+
+        if _has_includes(skillet_dict):
+            return skillet_dict
+
+        skillet_path = str(definition.parent.absolute())
+        skillet_dict['snippet_path'] = skillet_path
+        skillet_dict['skillet_path'] = skillet_path
+        skillet_dict['skillet_filename'] = definition.name
+
+        return sl.create_skillet(sl.compile_skillet_dict(skillet_dict)).skillet_dict
+
+    except (OSError, YAMLError) as e:
+        print(f'Could not parse skillet metadata file {definition}')
+        print(e)
+        return None
+    except SkilletLoaderException as sle:
+        print(f'Could not load skillet from {definition}')
+        print(sle)
+        return None
+
+
+def _save_skillets(repo_object: RepositoryDetails, found_skillets: list, unchanged_names: list,
+                   expected_skillets: QuerySet, content_hashes=None) -> None:
+    """
+    Create or update a db record for each found skillet, and delete any expected record that was neither found again
+    nor unchanged. Uses a fixed number of bulk statements regardless of the number of skillets
+
+    :param repo_object: RepositoryDetails db record
+    :param found_skillets: list of skillet dictionaries loaded from the repository
+    :param unchanged_names: names of skillets that were not loaded as their content hash has not changed
+    :param expected_skillets: Skillet db records that should be deleted unless they were found
+    :param content_hashes: dict of skillet name to content hash when already known, such as from an index snapshot
+    :return: None
+    """
+    # if the same name is found more than once, the last one wins
+    skillet_dicts = {skillet_dict['name']: skillet_dict for skillet_dict in found_skillets}
+    if content_hashes is None:
+        # included skillets that were not loaded again are hashed from their db record
+        included_names = {n for d in found_skillets for n in _get_included_names(d)}.difference(skillet_dicts)
+        for (skillet_name, skillet_json) in Skillet.objects.filter(name__in=included_names) \
+                .values_list('name', 'skillet_json'):
+            skillet_dicts[skillet_name] = json.loads(skillet_json)
+
+    found_json = dict()
+    for skillet_dict in found_skillets:
+        if content_hashes is not None:
+            content_hash = content_hashes.get(skillet_dict['name'], '')
+        else:
+            content_hash = _get_content_hash(skillet_dict, skillet_dicts)
+
+        found_json[skillet_dict['name']] = (json.dumps(skillet_dict), content_hash)
+
+    existing_records = Skillet.objects.filter(name__in=found_json.keys()).only('id', 'name', 'skillet_json',
+                                                                               'content_hash')
+    existing = {skillet_record.name: skillet_record for skillet_record in existing_records}
+
+    new_records = list()
+    updated_records = list()
+
+    for (skillet_name, (skillet_json, content_hash)) in found_json.items():
+        skillet_record = existing.get(skillet_name, None)
+        if skillet_record is None:
+            summary = get_skillet_summary_fields(json.loads(skillet_json))
+            new_records.append(Skillet(name=skillet_name, skillet_json=skillet_json, content_hash=content_hash,
+                                       repository_id=repo_object.id, **summary))
+
+        # check if skillet contents have been updated
+        elif skillet_record.skillet_json != skillet_json or skillet_record.content_hash != content_hash:
+            skillet_record.skillet_json = skillet_json
+            skillet_record.content_hash = content_hash
+            for (field, value) in get_skillet_summary_fields(json.loads(skillet_json)).items():
+                setattr(skillet_record, field, value)
+
+            updated_records.append(skillet_record)
+
+    Skillet.objects.bulk_create(new_records)
+    Skillet.objects.bulk_update(updated_records, ['skillet_json', 'content_hash', *SUMMARY_FIELDS],
+                                batch_size=UPDATE_BATCH_SIZE)
+    expected_skillets.exclude(name__in=list(found_json.keys()) + unchanged_names).delete()
+
+    # bulk_create does not set the primary key on sqlite, look up the ids of new and updated records by name
+    changed_names = [r.name for r in new_records] + [r.name for r in updated_records]
+    changed_ids = dict(Skillet.objects.filter(name__in=changed_names).values_list('name', 'id'))
+
+    label_records = list()
+    indexed_skillets = dict()
+    for (skillet_name, skillet_id) in changed_ids.items():
+        skillet_dict = json.loads(found_json[skillet_name][0])
+        indexed_skillets[skillet_id] = skillet_dict
+        for (key, value) in get_label_pairs(skillet_dict):
+            label_records.append(SkilletLabel(skillet_id=skillet_id, key=key, value=value))
+
+    SkilletLabel.objects.filter(skillet_id__in=changed_ids.values()).delete()
+    SkilletLabel.objects.bulk_create(label_records)
+    search_utils.update_search_index(indexed_skillets)
+
+
+def get_skillet_summary_fields(skillet_dict: dict) -> dict:
+    """
+    Returns the values of the Skillet summary columns for a skillet. These hold everything a listing page needs, so
+    the full skillet_json only has to be loaded once a skillet is opened
+
+    :param skillet_dict: loaded skillet dictionary
+    :return: dict of Skillet field name to value, one for each of SUMMARY_FIELDS
+    """
+    labels = skillet_dict.get('labels', None)
+    if labels is not None and not isinstance(labels, dict):
+        labels = dict()
+
+    collection = labels.get('collection', '') if labels is not None else ''
+    if isinstance(collection, list):
+        collection = next((c for c in collection if isinstance(c, str)), '')
+
+    extends = skillet_dict.get('extends', '')
+
+    return {
+        'type': str(skillet_dict.get('type', '') or '')[:64],
+        'label': str(skillet_dict.get('label', '') or ''),
+        'description': str(skillet_dict.get('description', '') or ''),
+        'collection': collection[:200] if isinstance(collection, str) else '',
+        # null for skillets without any labels
+        'labels_json': json.dumps(labels),
+        'extends': extends[:200] if isinstance(extends, str) else '',
+    }
+
+
+def get_label_pairs(skillet_dict: dict) -> list:
+    """
+    Returns the (key, value) rows to index for the labels of a skillet. A label with a list value gets one row per
+    string in the list. Labels with any value that cannot be indexed, such as a number, or without any values at all
+    also get a row with a value of None, so they can still be found by key and their values read from skillet_json
+
+    :param skillet_dict: loaded skillet dictionary
+    :return: list of (key, value) tuples
+    """
+    labels = skillet_dict.get('labels', dict())
+    if not isinstance(labels, dict):
+        return list()
+
+    label_pairs = list()
+    for (key, value) in labels.items():
+        values = value if isinstance(value, list) else [value]
+        # keep the first of any duplicates
+        indexed_values = list(dict.fromkeys(v for v in values if _is_indexed_label_value(v)))
+        if not indexed_values or not all(_is_indexed_label_value(v) for v in values):
+            indexed_values.append(None)
+
+        for v in indexed_values:
+            label_pairs.append((str(key), v))
+
+    return label_pairs
+
+
+def _is_indexed_label_value(value) -> bool:
+    return isinstance(value, str) and len(value) <= LABEL_VALUE_MAX_LENGTH
 
 
 def refresh_skillets_from_all_repos() -> None:
@@ -195,9 +892,48 @@ def refresh_skillets_from_all_repos() -> None:
     :return: None
     """
 
-    all_repos = RepositoryDetails.objects.all()
-    for repository in all_repos:
-        refresh_skillets_from_repo(repository.name)
+    # load every repository first, then write them all in one transaction and publish a single new catalog, so
+    # readers go straight from the old catalog to the new one without seeing any repository half way
+    all_changes = list()
+    with cache_utils.single_flight('cnc', INDEX_LOCK):
+        for repository in RepositoryDetails.objects.all():
+            all_changes.append((repository, _load_repo_changes(repository)))
+
+        with transaction.atomic():
+            for (repository, changes) in all_changes:
+                _save_repo_changes(repository, changes)
+
+    if any(changes['changed'] for (_, changes) in all_changes):
+        update_skillet_cache()
+
+
+def load_skillet_summaries(skillet_qs=None) -> list:
+    """
+    Returns a summary of each skillet, read from the summary columns without loading any skillet_json. Use
+    load_skillet_by_name to load the full definition of a skillet once it is opened
+
+    :param skillet_qs: Skillet queryset to summarize, defaults to every skillet
+    :return: list of dicts with the name, label, type, description, collection, labels and extends of each skillet.
+        labels is left out for skillets without any labels, as it is from their full definition
+    """
+    if skillet_qs is None:
+        skillet_qs = Skillet.objects.all()
+
+    summaries = list()
+    for summary in skillet_qs.order_by('id').values('name', *SUMMARY_FIELDS):
+        try:
+            labels = json.loads(summary.pop('labels_json'))
+        except ValueError:
+            labels = dict()
+
+        if labels is not None:
+            summary['labels'] = labels
+
+        # same as a skillet without any extends attribute
+        summary['extends'] = summary['extends'] or None
+        summaries.append(summary)
+
+    return summaries
 
 
 def load_skillet_by_name(skillet_name: str) -> (dict, None):
@@ -211,69 +947,133 @@ def load_skillet_by_name(skillet_name: str) -> (dict, None):
         return None
 
 
-def load_all_skillet_label_values(label_name):
-    labels_list = list()
-    skillets = load_all_skillets()
+def load_all_skillet_label_values(label_name: str) -> list:
+    """
+    Returns the distinct values of a label across all skillets, in the order they are first found. A label with a list
+    value adds every item of the list, including those that are not strings
 
-    for skillet in skillets:
-        if 'labels' not in skillet:
+    :param label_name: name of the label key
+    :return: list of label values
+    """
+    label_values = SkilletLabel.objects.filter(key=label_name, value__isnull=False) \
+        .values('value') \
+        .annotate(first_skillet=Min('skillet_id'), first_label=Min('id')) \
+        .order_by('first_skillet', 'first_label')
+
+    # only the string values are indexed, take the values of skillets with any other value from their labels
+    other_skillets = dict()
+    for (skillet_id, labels_json) in Skillet.objects.filter(labels__key=label_name, labels__value__isnull=True) \
+            .values_list('id', 'labels_json'):
+        try:
+            label_value = json.loads(labels_json).get(label_name, None)
+        except (ValueError, AttributeError):
+            print('Could not parse Skillet metadata')
             continue
 
-        labels = skillet.get('labels', [])
+        if isinstance(label_value, str):
+            other_skillets[skillet_id] = [label_value]
+        elif isinstance(label_value, list):
+            other_skillets[skillet_id] = label_value
+        else:
+            other_skillets[skillet_id] = list()
+
+    ordered_values = [(v['first_skillet'], v['first_label'], v['value']) for v in label_values
+                      if v['first_skillet'] not in other_skillets]
+    for (skillet_id, values) in other_skillets.items():
+        ordered_values.extend((skillet_id, index, value) for (index, value) in enumerate(values))
 
-        for label_key in labels:
-            if label_key == label_name:
+    labels_list = list()
+    seen_values = set()
+    for (_, _, label_value) in sorted(ordered_values, key=lambda v: v[:2]):
+        try:
+            if label_value in seen_values:
+                continue
 
-                if type(labels[label_name]) is str:
-                    label_value = labels[label_name]
-                    if label_value not in labels_list:
-                        labels_list.append(label_value)
+            seen_values.add(label_value)
+        except TypeError:
+            # values such as dicts cannot be hashed
+            if label_value in labels_list:
+                continue
 
-                elif type(labels[label_name]) is list:
-                    for label_list_value in labels[label_name]:
-                        if label_list_value not in labels_list:
-                            labels_list.append(label_list_value)
+        labels_list.append(label_value)
 
     return labels_list
 
 
+def load_all_skillet_label_keys() -> list:
+    """
+    Returns the distinct label keys used across all skillets, in the order they are first found
+
+    :return: list of label keys
+    """
+    label_keys = SkilletLabel.objects.values('key') \
+        .annotate(first_skillet=Min('skillet_id'), first_label=Min('id')) \
+        .order_by('first_skillet', 'first_label')
+
+    return [label_key['key'] for label_key in label_keys]
+
+
+def load_skillets_with_label_key(label_name: str) -> list:
+    """
+    Returns a summary of all skillets that have a label with this key, regardless of its value
+
+    :param label_name: name of the label key
+    :return: list of skillet summary dicts, see load_skillet_summaries
+    """
+    return load_skillet_summaries(Skillet.objects.filter(labels__key=label_name).distinct())
+
+
+def load_skillets_without_label_key(label_name: str) -> list:
+    """
+    Returns a summary of all skillets that do not have a label with this key
+
+    :param label_name: name of the label key
+    :return: list of skillet summary dicts, see load_skillet_summaries
+    """
+    return load_skillet_summaries(Skillet.objects.exclude(labels__key=label_name))
+
+
 def load_all_skillets(refresh=False) -> list:
     """
-    Returns a list of skillet dictionaries
+    Returns a summary of every skillet, see load_skillet_summaries. Only one thread in any process rebuilds the list
+    from the db at a time, any others that find it missing wait for that rebuild and use its result
     :param refresh: Boolean flag whether to use the cache or force a cache refresh
-    :return: skillet dictionaries
+    :return: skillet summary dicts
     """
     if refresh is False:
         cached_skillets = cnc_utils.get_long_term_cached_value('cnc', 'all_snippets')
         if cached_skillets is not None:
             return cached_skillets
 
-    skillet_dicts = list()
-    skillets = Skillet.objects.all()
-    for skillet in skillets:
-        skillet_dicts.append(json.loads(skillet.skillet_json))
+    with cache_utils.single_flight('cnc', 'all_snippets'):
+        ltc = cache_utils.get_cache('cnc')
 
-    cnc_utils.set_long_term_cached_value('cnc', 'all_snippets', skillet_dicts, -1)
-    return skillet_dicts
+        if refresh is False:
+            # check again now that we hold the lock, another thread or process may have just rebuilt it
+            ltc.maybe_refresh(force=True)
+            cached_skillets = ltc.get('all_snippets')
+            if cached_skillets is not None:
+                return cached_skillets
 
+        skillet_dicts = load_skillet_summaries()
 
-def load_skillets_with_label(label_name, label_value):
-    filtered_skillets = list()
-    all_skillets = load_all_skillets()
+        ltc.set('all_snippets', skillet_dicts, -1)
+        # save now rather than on the next flush so other processes waiting on the lock can use it
+        ltc.save()
 
-    for skillet in all_skillets:
-        if 'labels' in skillet and label_name in skillet['labels']:
-            if type(skillet['labels'][label_name]) is str:
+    return skillet_dicts
 
-                if skillet['labels'][label_name] == label_value:
-                    filtered_skillets.append(skillet)
 
-            elif type(skillet['labels'][label_name]) is list:
-                for label_list_value in skillet['labels'][label_name]:
-                    if label_list_value == label_value:
-                        filtered_skillets.append(skillet)
+def load_skillets_with_label(label_name: str, label_value: str) -> list:
+    """
+    Returns a summary of all skillets with a label of this key and value, or whose list of values for this key
+    includes value
 
-    return filtered_skillets
+    :param label_name: name of the label key
+    :param label_value: value to match
+    :return: list of skillet summary dicts, see load_skillet_summaries
+    """
+    return load_skillet_summaries(Skillet.objects.filter(labels__key=label_name, labels__value=label_value))
 
 
 def get_default_app_name():
@@ -0,0 +1,148 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Dependency graph of the skillet catalog, following the 'extends' attribute of each skillet
+
+The graph is built once for each version of the catalog list and reused until the catalog is replaced, in the same
+way as the name index in snippet_utils. Building it visits each skillet once, after which the lineage and ancestors
+of any skillet are simple lookups.
+"""
+
+import threading
+
+# the catalog list the graph was built from and the graph itself, see get_dependency_graph
+_graph = (None, None)
+_graph_lock = threading.Lock()
+
+
+class DependencyGraph:
+    """
+    Extends graph of a catalog of skillets. When several skillets share a name the first one wins, same as
+    snippet_utils.load_snippet_with_name
+
+    parents: dict of skillet name to the name it extends, for skillets that extend another
+    lineage: dict of skillet name to a tuple of that name followed by the name it extends, the name that one extends
+        and so on. The tuple stops before any name that would repeat, or after the first name that is not in the
+        catalog
+    ancestors: dict of skillet name to a frozenset of every name in its lineage other than itself
+    order: names of the skillets not involved in a cycle, each after the skillet it extends
+    cycles: list of cycles found, each a list of the names in the cycle
+    missing: dict of skillet name to the name it extends when that skillet is not in the catalog
+    """
+
+    def __init__(self, catalog: list):
+        self.parents = dict()
+        for skillet in catalog:
+            if not isinstance(skillet, dict) or 'name' not in skillet or skillet['name'] in self.parents:
+                continue
+
+            extends = skillet.get('extends', None)
+            self.parents[skillet['name']] = extends if isinstance(extends, str) and extends != '' else None
+
+        self.lineage = dict()
+        self.cycles = list()
+        self.missing = dict()
+        cyclic = set()
+
+        for name in self.parents:
+            # walk up until we reach a skillet we have already seen, the top of the chain, or a missing skillet
+            path = list()
+            on_path = set()
+            current = name
+            while current in self.parents and current not in self.lineage and current not in on_path:
+                path.append(current)
+                on_path.add(current)
+                current = self.parents[current]
+
+            if current in on_path:
+                cycle = path[path.index(current):]
+                self.cycles.append(cycle)
+                cyclic.update(cycle)
+                for i in range(len(cycle)):
+                    self.lineage[cycle[i]] = tuple(cycle[i:] + cycle[:i])
+
+                path = path[:path.index(current)]
+                tail = self.lineage.get(current, ())
+            elif current is None:
+                tail = ()
+            elif current in self.lineage:
+                tail = self.lineage[current]
+            else:
+                self.missing[path[-1]] = current
+                tail = (current,)
+
+            # fill in the lineage on the way back down the path
+            for skillet_name in reversed(path):
+                tail = (skillet_name,) + tail
+                self.lineage[skillet_name] = tail
+
+        self.ancestors = {skillet_name: frozenset(lineage[1:]) for (skillet_name, lineage) in self.lineage.items()}
+
+        # a skillet that is not in a cycle comes after everything in its lineage, so sorting by length is a
+        # topological order. Skillets extending a skillet in a cycle are left out along with the cycle
+        ordered = [n for n in self.parents if cyclic.isdisjoint(self.lineage[n])]
+        self.order = sorted(ordered, key=lambda n: len(self.lineage[n]))
+
+    def extends(self, skillet_name: str, ancestor_name: str) -> bool:
+        """
+        Checks whether a skillet extends another, either directly or through any number of other skillets
+
+        :param skillet_name: name of the skillet to check
+        :param ancestor_name: name of the possible ancestor
+        :return: True if ancestor_name is in the lineage of skillet_name
+        """
+        return ancestor_name in self.ancestors.get(skillet_name, ())
+
+
+def get_dependency_graph(catalog: list) -> DependencyGraph:
+    """
+    Returns the dependency graph of the given catalog. The graph is rebuilt whenever the catalog list is replaced,
+    and is otherwise reused across calls
+
+    :param catalog: catalog list as returned from snippet_utils.load_all_snippets
+    :return: DependencyGraph
+    """
+    global _graph
+
+    (source, graph) = _graph
+    if source is catalog:
+        return graph
+
+    with _graph_lock:
+        (source, graph) = _graph
+        if source is not catalog:
+            graph = DependencyGraph(catalog)
+            _graph = (catalog, graph)
+
+    return graph
+
+
+def report_dependency_problems(catalog: list) -> None:
+    """
+    Prints any cycles and missing skillets in the extends graph of the catalog. Called after the catalog is indexed
+    so problems are found then rather than when a skillet is rendered
+
+    :param catalog: catalog list as returned from snippet_utils.load_all_snippets
+    :return: None
+    """
+    graph = get_dependency_graph(catalog)
+
+    for cycle in graph.cycles:
+        print(f'Found a cycle in skillet extends: {" -> ".join(cycle + cycle[:1])}')
+
+    for (skillet_name, parent_name) in graph.missing.items():
+        print(f'Skillet {skillet_name} extends {parent_name} which could not be found')
@@ -144,7 +144,8 @@ def get_repo_details(repo_name, repo_dir, app_name='cnc'):
 
     repo_detail = cnc_utils.get_long_term_cached_value(app_name, f'{repo_name}_detail')
     if repo_detail:
-        return repo_detail
+        # return a copy so callers may freely modify it without changing the cached value
+        return dict(repo_detail)
 
     repo_detail = dict()
     repo_detail['name'] = repo_name
@@ -712,10 +713,8 @@ def update_repo_detail_in_cache(repo_detail: dict, app_dir: str) -> None:
 
     # fix for crash when long term cached values may be blank or None
     if repos is not None:
-        for r in repos:
-            if r.get('name', '') == repo_name:
-                repos.remove(r)
-                break
+        # cached values are shared, build a new list rather than modifying the cached one in place
+        repos = [r for r in repos if r.get('name', '') != repo_name]
     else:
         repos = list()
 
@@ -863,6 +862,43 @@ def get_git_status(repo_dir) -> str:
         return ''
 
 
+def get_head_commit(repo_dir: str) -> (str, None):
+    """
+    Returns the SHA of the commit currently checked out in the repository
+
+    :param repo_dir: directory to a valid git repo
+    :return: hex SHA or None if it could not be found
+    """
+    try:
+        repo = Repo(repo_dir)
+        return repo.head.commit.hexsha
+    except (GitError, ValueError) as git_error:
+        # ValueError is raised for repositories without any commits
+        print(git_error)
+        return None
+
+
+def get_changed_files(repo_dir: str, since_commit: str) -> (list, None):
+    """
+    Returns the paths of all files that differ between since_commit and the working tree, including local
+    modifications and untracked files. Renames are reported as both the old and new paths
+
+    :param repo_dir: directory to a valid git repo
+    :param since_commit: SHA of the commit to compare against
+    :return: list of paths relative to repo_dir or None if the diff could not be computed
+    """
+    try:
+        repo = Repo(repo_dir)
+        diff_output = repo.git.diff('--name-only', '--no-renames', since_commit)
+        changed_files = [f for f in diff_output.splitlines() if f]
+        changed_files.extend(repo.untracked_files)
+        return changed_files
+    except GitError as git_error:
+        # since_commit may no longer exist after a force push or a shallow fetch
+        print(git_error)
+        return None
+
+
 def ensure_known_host(url: str) -> (Union[bool, None], str):
     """
     Perform an ssh-keyscan against the target domain and add the results into the known_hosts files if not found
@@ -0,0 +1,87 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Helpers to spread CPU bound work such as parsing skillet metadata files across a pool of worker processes
+
+The number of workers is set by settings.SKILLET_INDEX_WORKERS. With 1 worker, or with fewer than
+PARALLEL_MIN_ITEMS items, everything runs serially in the calling process, as starting the pool costs more than it
+saves. Workers are started by a forkserver rather than forked from the calling process, which may be a threaded web
+server where forking while another thread holds a lock can deadlock the child. Each worker sets up Django itself.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+# below this number of items the pool start up time outweighs any gain
+PARALLEL_MIN_ITEMS = 50
+
+
+def get_worker_count() -> int:
+    """
+    Returns the configured number of worker processes. 0 means one per cpu
+
+    :return: number of workers, always at least 1
+    """
+    workers = getattr(settings, 'SKILLET_INDEX_WORKERS', 1)
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        print(f'Invalid SKILLET_INDEX_WORKERS {workers}, using 1')
+        return 1
+
+    if workers <= 0:
+        return os.cpu_count() or 1
+
+    return workers
+
+
+def map_in_processes(func: callable, items: list, workers=None) -> list:
+    """
+    Returns [func(item) for item in items], computed in a pool of worker processes when there are enough items to make
+    it worthwhile. Results are always in the same order as items. func must be a module level function and both the
+    items and the results must be picklable
+
+    :param func: function to apply to each item
+    :param items: list of arguments to func
+    :param workers: number of worker processes, defaults to get_worker_count()
+    :return: list of results
+    """
+    if workers is None:
+        workers = get_worker_count()
+
+    workers = min(workers, len(items))
+    if workers <= 1 or len(items) < PARALLEL_MIN_ITEMS:
+        return [func(item) for item in items]
+
+    # send each worker several items at a time to keep the pickling round trips down
+    chunk_size = max(1, len(items) // (workers * 4))
+
+    try:
+        # workers set up Django from DJANGO_SETTINGS_MODULE before unpickling func, as its module may need the app
+        # registry. Anything importing pan_cnc.lib does, so the initializer cannot live here
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'),
+                                 initializer=django.setup) as executor:
+            return list(executor.map(func, items, chunksize=chunk_size))
+    except (OSError, BrokenProcessPool) as e:
+        print('Could not process items in parallel, continuing serially')
+        print(e)
+        return [func(item) for item in items]
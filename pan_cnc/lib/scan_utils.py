@@ -0,0 +1,291 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Directory walker for finding skillet metadata files in large trees
+
+Each walk records the mtime, device and inode of every directory it visits, along with the sub directories and
+matching files found there, in a manifest kept in the 'cnc' long term cache. Adding, removing or renaming an entry
+always changes the mtime of its directory, so on the next walk a directory that still matches its manifest entry is
+not listed again, only checked with a single stat. Directories matching settings.SKILLET_SCAN_IGNORE are never entered.
+
+The mtime of a directory does not change with the directories below it, so every directory is still checked unless
+something reports the changes. A watch_utils.SkilletRepositoryWatcher running in this process reports them to a
+ChangeTracker. Once a walk has checked the manifest while the tracker was running, later walks below the tracked
+directory trust the manifest entry of every directory not reported as changed, without any stat.
+"""
+
+import os
+import threading
+import time
+import uuid
+from fnmatch import fnmatchcase
+
+from django.conf import settings
+
+from pan_cnc.lib import cnc_utils
+
+# used when settings.SKILLET_SCAN_IGNORE is not set, the directories the original walkers skipped
+DEFAULT_IGNORE = ('*.git*', '*.venv*', '*.terraform*')
+
+# directories modified this recently may change again within the same mtime tick, do not trust them on the next scan
+RACY_SECONDS = 2
+
+# bump whenever the layout of a manifest entry changes
+MANIFEST_VERSION = 2
+
+# a tracker forgets all changes past this many changed directories, after which the next walk checks them all again
+MAX_TRACKED_CHANGES = 10000
+
+_trackers = list()
+_trackers_lock = threading.Lock()
+
+
+def get_ignore_globs() -> tuple:
+    """
+    Returns the configured glob patterns of directory names that are never scanned
+
+    :return: tuple of glob patterns
+    """
+    return tuple(getattr(settings, 'SKILLET_SCAN_IGNORE', DEFAULT_IGNORE))
+
+
+class ChangeTracker:
+    """
+    Directories whose entries changed below root since tracking started. The reporter must watch every directory
+    below root other than those matching ignore or reached through a symbolic link, and hold lock while it reads
+    events and reports the changes they hold, so a walk never misses a change that happened before it started
+    """
+
+    def __init__(self, root: str, ignore: tuple, has_unread_changes):
+        """
+        :param root: directory being watched
+        :param ignore: glob patterns of the directory names that are not watched
+        :param has_unread_changes: callable returning True while there are changes the reporter has not read yet
+        """
+        self.root = os.path.abspath(root)
+        self.ignore = tuple(ignore)
+        self.has_unread_changes = has_unread_changes
+        self.lock = threading.Lock()
+        self.token = uuid.uuid4().hex
+        self.sequence = 0
+        # directory path to the sequence number of its last change
+        self.changed_dirs = dict()
+
+    def mark_changed(self, directory: str) -> None:
+        """
+        Records that an entry was added to, removed from or renamed in directory. Call while holding lock
+
+        :param directory: absolute path of the changed directory
+        :return: None
+        """
+        if len(self.changed_dirs) >= MAX_TRACKED_CHANGES:
+            self.reset()
+
+        self.sequence += 1
+        self.changed_dirs[directory] = self.sequence
+
+    def reset(self) -> None:
+        """
+        Forgets every change, so the next walk checks each directory again. Call while holding lock, for example after
+        changes were lost
+
+        :return: None
+        """
+        self.token = uuid.uuid4().hex
+        self.sequence = 0
+        self.changed_dirs = dict()
+
+    def covers(self, directory: str, ignore: tuple) -> bool:
+        """
+        Checks whether every directory a walk of directory would enter is watched
+
+        :param directory: absolute path of the directory to walk
+        :param ignore: glob patterns of the directory names the walk skips
+        :return: True if the changes below directory are all reported
+        """
+        if tuple(ignore) != self.ignore:
+            return False
+
+        if directory != self.root and not directory.startswith(self.root + os.sep):
+            return False
+
+        # the watched tree does not follow symbolic links or enter ignored directories on the way down to directory
+        path = directory
+        while path != self.root:
+            if os.path.islink(path) or any(fnmatchcase(os.path.basename(path), i) for i in ignore):
+                return False
+
+            path = os.path.dirname(path)
+
+        return True
+
+    def snapshot(self) -> (tuple, None):
+        """
+        Returns the changes reported so far, or None if there are changes that were not read yet
+
+        :return: tuple of the token of this tracking session, the sequence number of the last change, and a dict of
+            directory path to the sequence number of its last change
+        """
+        with self.lock:
+            if self.has_unread_changes():
+                return None
+
+            return self.token, self.sequence, dict(self.changed_dirs)
+
+
+def start_tracking(tracker: ChangeTracker) -> None:
+    with _trackers_lock:
+        _trackers.append(tracker)
+
+
+def stop_tracking(tracker: ChangeTracker) -> None:
+    with _trackers_lock:
+        if tracker in _trackers:
+            _trackers.remove(tracker)
+
+
+def _get_tracker(directory: str, ignore: tuple) -> (ChangeTracker, None):
+    with _trackers_lock:
+        trackers = list(_trackers)
+
+    return next((t for t in trackers if t.covers(directory, ignore)), None)
+
+
+def walk(directory: str, patterns: tuple, ignore=None):
+    """
+    Walks directory top down like os.walk, yielding a (path, sub_dirs, matches) tuple for each directory, where
+    sub_dirs lists the names of its sub directories and matches those of its files matching any of the patterns. As
+    with os.walk, remove names from sub_dirs to skip those directories. Directories are visited in the same order as a
+    recursive walk using os.scandir
+
+    :param directory: directory to walk
+    :param patterns: tuple of glob patterns to match against file names
+    :param ignore: tuple of glob patterns of directory names to skip, defaults to get_ignore_globs()
+    :return: generator of (path, sub_dirs, matches) tuples
+    """
+    if ignore is None:
+        ignore = get_ignore_globs()
+
+    root = os.path.abspath(directory)
+    manifest_key = f'scan_manifest_{root}_{"|".join(patterns)}'
+    options = f'{MANIFEST_VERSION}|{"|".join(ignore)}'
+    manifest = cnc_utils.get_long_term_cached_value('cnc', manifest_key)
+    if manifest is None or manifest.get('options', None) != options:
+        manifest = {'options': options, 'dirs': dict()}
+
+    (token, sequence, changed_dirs) = (None, 0, dict())
+    tracker = _get_tracker(root, ignore)
+    if tracker is not None:
+        (token, sequence, changed_dirs) = tracker.snapshot() or (None, 0, dict())
+
+    # the manifest was checked while the tracker was running, anything changed since then has been reported
+    trust_manifest = token is not None and manifest.get('token', None) == token
+    checked_sequence = manifest.get('sequence', 0)
+
+    known_dirs = manifest['dirs']
+    scanned_dirs = dict()
+    racy_before = time.time_ns() - RACY_SECONDS * 1000000000
+    visited = set()
+    changed = False
+
+    # directory paths, with whether they are reached without following any symbolic link
+    stack = [(root, True)]
+    while stack:
+        (path, direct) = stack.pop()
+        entry = known_dirs.get(path, None)
+        if trust_manifest and direct and entry is not None and entry[0] is not None \
+                and changed_dirs.get(path, 0) <= checked_sequence:
+            # manifests written as JSON hold lists rather than tuples
+            identity = tuple(entry[1])
+        else:
+            try:
+                stat = os.stat(path)
+            except OSError as oe:
+                print(f'Could not access {path}: {oe}')
+                continue
+
+            identity = (stat.st_dev, stat.st_ino)
+            if entry is None or entry[0] != stat.st_mtime_ns or tuple(entry[1]) != identity:
+                entry = _scan_dir(path, patterns, ignore, stat, racy_before)
+                changed = True
+
+        # guard against symlink loops
+        if identity in visited:
+            continue
+
+        visited.add(identity)
+        scanned_dirs[path] = entry
+        (_, _, sub_dirs, links, matches) = entry
+        sub_dirs = list(sub_dirs)
+        yield path, sub_dirs, list(matches)
+
+        # reversed so they are popped in the order they were found
+        stack.extend((os.path.join(path, d), direct and d not in links) for d in reversed(sub_dirs))
+
+    if changed or len(scanned_dirs) != len(known_dirs) \
+            or (token, sequence) != (manifest.get('token', None), checked_sequence):
+        cnc_utils.set_long_term_cached_value('cnc', manifest_key, {'options': options, 'dirs': scanned_dirs,
+                                                                   'token': token, 'sequence': sequence}, -1,
+                                             'scan_manifest')
+
+
+def find_files(directory: str, patterns: tuple, stop_at_match=False, ignore=None) -> list:
+    """
+    Walks directory and returns the paths of all files with a name matching any of the patterns, in the order of walk
+
+    :param directory: directory to scan
+    :param patterns: tuple of glob patterns to match against file names
+    :param stop_at_match: do not descend into the sub directories of a directory where a matching file was found
+    :param ignore: tuple of glob patterns of directory names to skip, defaults to get_ignore_globs()
+    :return: list of absolute file paths
+    """
+    found_files = list()
+    for (path, sub_dirs, matches) in walk(directory, patterns, ignore):
+        found_files.extend(os.path.join(path, m) for m in matches)
+        if matches and stop_at_match:
+            sub_dirs.clear()
+
+    return found_files
+
+
+def _scan_dir(path: str, patterns: tuple, ignore: tuple, stat: os.stat_result, racy_before: int) -> tuple:
+    sub_dirs = list()
+    links = list()
+    matches = list()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+
+                if is_dir:
+                    if not any(fnmatchcase(entry.name, i) for i in ignore):
+                        sub_dirs.append(entry.name)
+                        if entry.is_symlink():
+                            links.append(entry.name)
+
+                elif any(fnmatchcase(entry.name, p) for p in patterns):
+                    matches.append(entry.name)
+
+    except OSError as oe:
+        print(f'Could not scan {path}: {oe}')
+        return None, (stat.st_dev, stat.st_ino), (), (), ()
+
+    mtime = stat.st_mtime_ns if stat.st_mtime_ns < racy_before else None
+    return mtime, (stat.st_dev, stat.st_ino), tuple(sub_dirs), tuple(links), tuple(matches)
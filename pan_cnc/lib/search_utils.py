@@ -0,0 +1,212 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Full text search over the skillet catalog
+
+Skillets are indexed in an SQLite FTS5 table, created by the cnc 0005 migration, with one row per Skillet keyed by its
+id. The rows are kept in step with the Skillet table by db_utils._save_skillets inside the same transaction, and
+searches only return rows whose Skillet still exists. When the database has no FTS5 support the table does not exist,
+and searches fall back to scanning every skillet definition in the db with the same weights instead.
+"""
+
+import json
+import re
+
+from django.db import connection
+from django.db import OperationalError
+
+from cnc.models import Skillet
+
+# virtual table created by the cnc 0005_skillet_search migration
+SEARCH_TABLE = 'cnc_skillet_search'
+
+# indexed columns in table order and the weight of a match in each when ranking results
+SEARCH_COLUMNS = ('name', 'label', 'description', 'labels', 'variables')
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 3.0, 1.0)
+
+MAX_PAGE_SIZE = 100
+
+_search_available = None
+
+
+def search_available() -> bool:
+    """
+    Checks whether the FTS5 search table exists in the default database. The result is remembered for the life of
+    the process
+
+    :return: True if searches can use the FTS5 index
+    """
+    global _search_available
+
+    if _search_available is None:
+        _search_available = SEARCH_TABLE in connection.introspection.table_names()
+
+    return _search_available
+
+
+def get_search_document(skillet_dict: dict) -> tuple:
+    """
+    Returns the text indexed for a skillet, one string for each of SEARCH_COLUMNS
+
+    :param skillet_dict: loaded skillet dictionary
+    :return: tuple of strings
+    """
+    labels = skillet_dict.get('labels', dict())
+    label_words = list()
+    if isinstance(labels, dict):
+        for (key, value) in labels.items():
+            label_words.append(str(key))
+            values = value if isinstance(value, list) else [value]
+            label_words.extend(v for v in values if isinstance(v, str))
+
+    variables = skillet_dict.get('variables', list())
+    variable_names = list()
+    if isinstance(variables, list):
+        variable_names = [str(v['name']) for v in variables if isinstance(v, dict) and 'name' in v]
+
+    return (
+        str(skillet_dict.get('name', '')),
+        str(skillet_dict.get('label', '') or ''),
+        str(skillet_dict.get('description', '') or ''),
+        ' '.join(label_words),
+        ' '.join(variable_names),
+    )
+
+
+def update_search_index(indexed_skillets: dict) -> None:
+    """
+    Replaces the search rows of the given skillets, and removes the rows of any skillet that no longer exists. Call
+    inside the transaction that changed the Skillet table so searches never see a partial update
+
+    :param indexed_skillets: dict of Skillet id to skillet dictionary for each new or updated skillet
+    :return: None
+    """
+    if not search_available():
+        return
+
+    rows = list()
+    for (skillet_id, skillet_dict) in indexed_skillets.items():
+        rows.append((skillet_id, str(skillet_dict.get('type', '')), *get_search_document(skillet_dict)))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT id FROM cnc_skillet)')
+
+        ids = list(indexed_skillets.keys())
+        # stay well below the sqlite bound parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+        columns = ', '.join(SEARCH_COLUMNS)
+        placeholders = ', '.join(['%s'] * (len(SEARCH_COLUMNS) + 2))
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, type, {columns}) VALUES ({placeholders})', rows)
+
+
+def get_query_terms(query: str) -> list:
+    """
+    Splits a user supplied query into lower case search terms. All punctuation is dropped, so the query can never be
+    interpreted as FTS5 query syntax
+
+    :param query: free text query
+    :return: list of terms
+    """
+    return re.findall(r'[^\W_]+', query.lower())
+
+
+def search_skillets(query: str, page=1, page_size=20) -> dict:
+    """
+    Finds the skillets matching every term of the query. Each term also matches words it is a prefix of. Results are
+    ranked by relevance, with matches in the name counting most, followed by the label, labels, description and
+    variable names
+
+    :param query: free text query
+    :param page: page of results to return, starting at 1
+    :param page_size: number of results per page, at most MAX_PAGE_SIZE
+    :return: dict with the query, page, page_size, total number of matches, and a list of results for this page. Each
+        result has the name, label, description and type of the skillet
+    """
+    page = max(1, page)
+    page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+    response = {'query': query, 'page': page, 'page_size': page_size, 'total': 0, 'results': list()}
+
+    terms = get_query_terms(query)
+    if not terms:
+        return response
+
+    if search_available():
+        try:
+            (total, results) = _search_index(terms, page, page_size)
+        except OperationalError as oe:
+            print(f'Could not search skillet index: {oe}')
+            (total, results) = _search_catalog(terms, page, page_size)
+    else:
+        (total, results) = _search_catalog(terms, page, page_size)
+
+    response['total'] = total
+    response['results'] = results
+    return response
+
+
+def _search_index(terms: list, page: int, page_size: int) -> tuple:
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(w) for w in SEARCH_WEIGHTS)
+
+    # skillets deleted outside of _save_skillets, such as with their repository, keep their rows until the next update
+    where = f'{SEARCH_TABLE} MATCH %s AND rowid IN (SELECT id FROM cnc_skillet)'
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE {where}', [match])
+        total = cursor.fetchone()[0]
+
+        # bm25 scores are negative, the best match has the lowest score
+        cursor.execute(f'SELECT name, label, description, type FROM {SEARCH_TABLE} '
+                       f'WHERE {where} ORDER BY bm25({SEARCH_TABLE}, {weights}), name '
+                       f'LIMIT %s OFFSET %s', [match, page_size, (page - 1) * page_size])
+        results = [{'name': name, 'label': label, 'description': description, 'type': skillet_type}
+                   for (name, label, description, skillet_type) in cursor.fetchall()]
+
+    return total, results
+
+
+def _search_catalog(terms: list, page: int, page_size: int) -> tuple:
+    # the cached catalog only holds summaries, variable names are read from the full definitions
+    scored = list()
+    for skillet_json in Skillet.objects.order_by('id').values_list('skillet_json', flat=True):
+        try:
+            skillet_dict = json.loads(skillet_json)
+        except ValueError:
+            continue
+
+        fields = [get_query_terms(text) for text in get_search_document(skillet_dict)]
+        score = 0.0
+        for term in terms:
+            term_score = sum(weight for (words, weight) in zip(fields, SEARCH_WEIGHTS)
+                             if any(word.startswith(term) for word in words))
+            if term_score == 0:
+                break
+
+            score += term_score
+        else:
+            scored.append((-score, str(skillet_dict.get('name', '')), skillet_dict))
+
+    scored.sort(key=lambda s: (s[0], s[1]))
+    start = (page - 1) * page_size
+    results = [{'name': s.get('name', ''), 'label': s.get('label', ''), 'description': s.get('description', ''),
+                'type': s.get('type', '')} for (_, _, s) in scored[start:start + page_size]]
+
+    return len(scored), results
@@ -3,11 +3,10 @@ import os
 from django.conf import settings
 from django.contrib.auth.signals import user_logged_in
 from django.contrib.auth.signals import user_logged_out
-from django.core.cache import cache
 from django.core.signals import request_finished
 from django.dispatch import receiver
 
-from . import cnc_utils
+from . import cache_utils
 
 
 @receiver(user_logged_in)
@@ -36,11 +35,6 @@ def handle_logout(user, request, **kwargs) -> None:
 
 @receiver(request_finished)
 def save_long_term_cache(sender, **kwargs) -> None:
-    apps_to_save = cache.get('ltc_dirty', list())
-    for app_name in apps_to_save:
-        cache_key = f"{app_name}_cache"
-        ltc = cache.get(cache_key, dict())
-        # print(f'Saving {app_name} to long term cache')
-        cnc_utils.save_long_term_cache(app_name, ltc)
-
-    cache.set('ltc_dirty', list())
+    if cache_utils.get_dirty_caches():
+        # coalesce writes from all requests that finish within the flush window
+        cache_utils.schedule_flush()
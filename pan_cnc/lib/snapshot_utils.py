@@ -0,0 +1,151 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+On disk snapshots of the indexed skillets of a repository at a given commit
+
+A snapshot is saved whenever a repository is indexed from a clean checkout, holding the skillet_json and content hash
+of every skillet found. Checking out a commit that has a snapshot restores the skillets from it without loading any
+skillet files. Snapshots are kept in $HOME/.pan_cnc/cnc/index_snapshots, and only the settings.SKILLET_INDEX_SNAPSHOTS
+most recently used are kept.
+"""
+
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+
+from pan_cnc.lib import cache_utils
+
+# bump whenever the contents of skillet_json change, so snapshots from older versions are not restored
+SNAPSHOT_VERSION = 1
+
+
+def get_snapshot_limit() -> int:
+    """
+    Returns the configured number of snapshots to keep. 0 disables snapshots
+
+    :return: number of snapshots
+    """
+    try:
+        return max(0, int(getattr(settings, 'SKILLET_INDEX_SNAPSHOTS', 20)))
+    except (TypeError, ValueError):
+        print('Invalid SKILLET_INDEX_SNAPSHOTS, index snapshots are disabled')
+        return 0
+
+
+def get_snapshot_dir() -> str:
+    return os.path.join(cache_utils.get_cache_dir('cnc'), 'index_snapshots')
+
+
+def _get_snapshot_path(repo_name: str, commit: str) -> str:
+    return os.path.join(get_snapshot_dir(), f'{quote(repo_name, safe="")}@{commit}')
+
+
+def has_snapshot(repo_name: str, commit: str) -> bool:
+    """
+    Checks for a snapshot of this repository at this commit, marking it as recently used when found
+
+    :param repo_name: name of the repository
+    :param commit: commit SHA
+    :return: True if a snapshot exists
+    """
+    if get_snapshot_limit() == 0:
+        return False
+
+    try:
+        os.utime(_get_snapshot_path(repo_name, commit))
+        return True
+    except OSError:
+        return False
+
+
+def load_snapshot(repo_name: str, repo_dir: str, commit: str) -> (list, None):
+    """
+    Loads the snapshot of this repository at this commit
+
+    :param repo_name: name of the repository
+    :param repo_dir: full path of the repository, snapshots taken from any other path are not used
+    :param commit: commit SHA
+    :return: list of (skillet_json, content_hash) tuples, or None if there is no usable snapshot
+    """
+    if get_snapshot_limit() == 0:
+        return None
+
+    snapshot_path = _get_snapshot_path(repo_name, commit)
+    try:
+        with open(snapshot_path, 'rb') as sf:
+            snapshot = cache_utils.deserialize(sf.read())
+
+        # mark as recently used
+        os.utime(snapshot_path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f'Could not load index snapshot {snapshot_path}: {e}')
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version', None) != SNAPSHOT_VERSION \
+            or snapshot.get('repo_dir', None) != repo_dir:
+        return None
+
+    return [tuple(s) for s in snapshot['skillets']]
+
+
+def save_snapshot(repo_name: str, repo_dir: str, commit: str, skillets: list) -> None:
+    """
+    Saves a snapshot of this repository at this commit, then removes the least recently used snapshots over the limit
+
+    :param repo_name: name of the repository
+    :param repo_dir: full path of the repository
+    :param commit: commit SHA
+    :param skillets: list of (skillet_json, content_hash) tuples of every skillet in the repository
+    :return: None
+    """
+    limit = get_snapshot_limit()
+    if limit == 0:
+        return None
+
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'repo_dir': repo_dir,
+        'commit': commit,
+        'skillets': skillets,
+    }
+
+    try:
+        os.makedirs(get_snapshot_dir(), mode=0o700, exist_ok=True)
+        cache_utils.atomic_write(_get_snapshot_path(repo_name, commit), cache_utils.serialize(snapshot))
+    except OSError as ose:
+        print(f'Could not save index snapshot of {repo_name}: {ose}')
+        return None
+
+    _prune_snapshots(limit)
+
+
+def _prune_snapshots(limit: int) -> None:
+    try:
+        with os.scandir(get_snapshot_dir()) as entries:
+            snapshots = [(e.stat().st_mtime_ns, e.path) for e in entries if e.is_file() and not e.name.startswith('.')]
+    except OSError:
+        return None
+
+    snapshots.sort(reverse=True)
+    for (_, snapshot_path) in snapshots[limit:]:
+        try:
+            os.remove(snapshot_path)
+        except OSError:
+            pass
@@ -18,7 +18,6 @@ import os
 from collections import OrderedDict
 from pathlib import Path
 
-import oyaml
 from django.conf import settings
 from jinja2 import Environment
 from jinja2.loaders import BaseLoader
@@ -31,10 +30,20 @@ from yaml.scanner import ScannerError
 
 from . import cnc_utils
 from . import db_utils
+from . import dependency_utils
 from . import jinja_filters
+from . import parallel_utils
+from . import scan_utils
+from . import yaml_utils
 from .exceptions import CCFParserError
 from .exceptions import SnippetNotFoundException
 
+# views of each snippet_type into the cached skillets of a directory, keyed by (app_name, directory)
+_type_views = dict()
+
+# the catalog list the name index was built from and the index itself, see _get_name_index
+_name_index = (None, dict())
+
 
 def load_service_snippets() -> list:
     """
@@ -58,15 +67,14 @@ def load_template_snippets() -> list:
 
 
 def load_all_snippets(app_dir) -> list:
-    all_snippets = cnc_utils.get_long_term_cached_value(app_dir, 'all_snippets')
-    if all_snippets is not None:
-        return all_snippets
-
-    print('Getting all snippets again')
-    # snippet_list = load_snippets_of_type(snippet_type=None, app_dir=app_dir)
-    snippet_list = db_utils.load_all_skillets()
-    cnc_utils.set_long_term_cached_value(app_dir, 'all_snippets', snippet_list, -1)
-    return snippet_list
+    """
+    Returns the skillet catalog. There is a single catalog shared by every app, held in the 'cnc' long term cache by
+    db_utils.load_all_skillets. It holds a summary of each skillet, use load_snippet_with_name for the full definition.
+    The returned list is shared with every other caller and must not be modified
+    :param app_dir: name of the CNC application
+    :return: list of skillet summary dicts
+    """
+    return db_utils.load_all_skillets()
 
 
 def load_snippets_by_label(label_name, label_value, app_dir) -> list:
@@ -133,48 +141,66 @@ def load_snippets_of_type_from_dir(app_name: str, directory: str, snippet_type=N
         print(f'Could not find meta-cnc files in dir {directory}')
         return snippet_list
 
-    snippet_dirs_dict = cnc_utils.get_long_term_cached_value(app_name, f'snippet_types_in_{directory}')
+    # every skillet found in this dir is parsed and cached once, each snippet_type is a view into that list
+    skillets = cnc_utils.get_long_term_cached_value(app_name, f'skillets_in_{directory}')
 
-    if snippet_dirs_dict is not None:
-        # snippet_types is a dict with a key for each directory
-        # each directory value is another dict with keys for each snippet_type
-        # snippet_dirs_dict = cache.get('snippet_types')
-        if str(snippets_dir) in snippet_dirs_dict:
-            snippet_types_dict = snippet_dirs_dict[str(snippets_dir)]
+    if skillets is None:
+        print(f'Rebuilding Skillet cache for dir {directory}')
+        if parallel_utils.get_worker_count() > 1:
+            skillets = _check_dir_parallel(snippets_dir)
         else:
-            snippet_types_dict = dict()
+            skillets = _check_tree(snippets_dir, list())
+        # cache these items indefinitely
+        cnc_utils.set_long_term_cached_value(app_name, f'skillets_in_{directory}', skillets, -1)
 
-        if snippet_type in snippet_types_dict:
-            # print(f'Cache hit for {snippet_type}')
-            return snippet_types_dict[snippet_type]
+    return _get_type_view(app_name, str(directory), skillets, snippet_type)
 
-        if snippet_type is None:
-            # check for JSON deserialized None value. Will appear here as string 'null'
-            if 'null' in snippet_types_dict:
-                # print(f'Cache hit for {snippet_type}')
-                return snippet_types_dict['null']
 
-        snippet_types_dict[snippet_type] = dict()
+def _get_type_view(app_name: str, directory: str, skillets: list, snippet_type: str) -> list:
+    """
+    Returns the skillets of the given type from the cached list of all skillets in a directory, the same skillets
+    _check_dir(directory, snippet_type) would find. Views hold references to the same skillet dicts and are kept only
+    as long as that cached list is current
+    :param app_name: CNC application name
+    :param directory: directory the skillets were loaded from
+    :param skillets: cached list of all skillets found in directory
+    :param snippet_type: type of skillet to return, or None for all
+    :return: list of skillet dicts
+    """
+    view_key = (app_name, directory)
+    (source, views) = _type_views.get(view_key, (None, None))
+    if source is not skillets:
+        views = dict()
+        _type_views[view_key] = (skillets, views)
 
-    else:
-        snippet_types_dict = dict()
-        snippet_dirs_dict = dict()
+    if snippet_type not in views:
+        if snippet_type is None:
+            views[snippet_type] = _remove_nested(skillets)
+        else:
+            views[snippet_type] = _remove_nested([s for s in skillets
+                                                  if s.get('type', None) == snippet_type and 'name' in s])
 
-    print(f'Rebuilding Skillet cache for dir {directory}')
+    return views[snippet_type]
 
-    snippet_list = _check_dir(snippets_dir, snippet_type, list())
-    snippet_types_dict[snippet_type] = snippet_list
-    snippet_dirs_dict[str(snippets_dir)] = snippet_types_dict
-    # cache these items indefinitely
-    cnc_utils.set_long_term_cached_value(app_name, f'snippet_types_in_{directory}', snippet_dirs_dict, -1)
-    return snippet_list
+
+def _remove_nested(skillets: list) -> list:
+    """
+    Drops the skillets found below the directory of another skillet in the list, as _check_dir does not descend any
+    further once a matching skillet is loaded
+    :param skillets: list of skillet dicts in the order they were found
+    :return: list of skillet dicts
+    """
+    skillet_dirs = {s['snippet_path'] for s in skillets}
+    return [s for s in skillets
+            if not any(str(parent) in skillet_dirs for parent in Path(s['snippet_path']).parents)]
 
 
 def _check_dir(directory: Path, snippet_type: str, snippet_list: list) -> list:
     """
-    Recursive function to look for all files in the current directory with a name matching '.meta-cnc.yaml'
-    otherwise, iterate through all sub-dirs and skip dirs with name that match '.git', '.venv', and '.terraform'
-    will descend into all other dirs and call itself again.
+    Look for all files in the directory tree with a name matching '.meta-cnc.yaml'. Does not descend any further into
+    a directory once a skillet is loaded from it, or one fails to load, and skips dirs matching
+    settings.SKILLET_SCAN_IGNORE such as '.git', '.venv', and '.terraform'. Directories that have not changed since
+    the last scan are not listed again.
     Returns a list of compiled skillets
     :param directory: PosixPath of directory to begin searching
     :param snippet_type: type of skillet to match
@@ -182,79 +208,127 @@ def _check_dir(directory: Path, snippet_type: str, snippet_list: list) -> list:
     :return: list of dicts containing loaded skillets
     """
 
-    err_condition = False
-    for d in directory.glob('.meta-cnc.y*'):
-        snippet_path = str(d.parent.absolute())
-        # print(f'snippet_path is {snippet_path}')
-        try:
-            with d.open(mode='r') as sc:
-                raw_service_config = oyaml.safe_load(sc.read())
-                service_config = _normalize_snippet_structure(raw_service_config)
-                service_config['snippet_path'] = snippet_path
-                if snippet_type is not None:
-                    if 'type' in service_config and service_config['type'] == snippet_type \
-                            and 'name' in service_config:
-                        snippet_list.append(service_config)
-                else:
+    for (path, sub_dirs, matches) in scan_utils.walk(str(directory), ('.meta-cnc.y*',)):
+        err_condition = False
+        found_count = len(snippet_list)
+        for match in matches:
+            (service_config, err) = _load_snippet_file(Path(path, match))
+            if err:
+                err_condition = True
+
+            if service_config is None:
+                continue
+
+            if snippet_type is not None:
+                if 'type' in service_config and service_config['type'] == snippet_type \
+                        and 'name' in service_config:
                     snippet_list.append(service_config)
+            else:
+                snippet_list.append(service_config)
 
-        except IOError as ioe:
-            print('Could not open metadata file in dir %s' % d.parent)
-            print(ioe)
-            err_condition = True
-            continue
-        except ParserError as pe:
-            print('Could not parse metadata file in dir %s' % d.parent)
-            print(pe)
-            err_condition = True
-            continue
-        except ScannerError as se:
-            print('Could not parse meta-cnc file in dir %s' % d.parent)
-            print(se)
-            continue
-        except ConstructorError as ce:
-            print('Could not parse metadata file in dir %s' % d.parent)
-            print(ce)
-            err_condition = True
-            continue
-        except ReaderError as re:
-            print('Could not parse metadata file in dir %s' % d.parent)
-            print(re)
-            err_condition = True
-            continue
-        except YAMLError as ye:
-            print('YAMLError: Could not parse metadata file in dir %s' % d.parent)
-            print(ye)
-            err_condition = True
-            continue
-        except Exception as ex:
-            print('Caught unknown exception!')
-            print(ex)
-            err_condition = True
-            continue
-
-    # Do not descend into sub dirs after a .meta-cnc file has already been found
-    if snippet_list:
-        return snippet_list
+        # Do not descend into sub dirs after a .meta-cnc file has already been found
+        if len(snippet_list) > found_count or err_condition:
+            sub_dirs.clear()
 
-    if err_condition:
-        return snippet_list
+    return snippet_list
 
-    for d in directory.iterdir():
-        if d.is_file():
-            continue
-        if '.git' in d.name:
-            continue
-        if '.venv' in d.name:
-            continue
-        if '.terraform' in d.name:
-            continue
-        if d.is_dir():
-            snippet_list.extend(_check_dir(d, snippet_type, list()))
+
+def _check_tree(directory: Path, snippet_list: list) -> list:
+    """
+    Load every '.meta-cnc.yaml' file in the directory tree, including those nested below another skillet, so each
+    snippet_type can be served from the one list. Only stops descending below a metadata file that fails to load
+    :param directory: PosixPath of directory to begin searching
+    :param snippet_list: combined list of all loaded skillets
+    :return: list of dicts containing loaded skillets
+    """
+
+    for (path, sub_dirs, matches) in scan_utils.walk(str(directory), ('.meta-cnc.y*',)):
+        err_condition = False
+        for match in matches:
+            (service_config, err) = _load_snippet_file(Path(path, match))
+            if err:
+                err_condition = True
+
+            if service_config is not None:
+                snippet_list.append(service_config)
+
+        if err_condition:
+            sub_dirs.clear()
 
     return snippet_list
 
 
+def _check_dir_parallel(directory: Path) -> list:
+    """
+    Same as _check_tree, but parses all found metadata files across the worker processes configured by
+    settings.SKILLET_INDEX_WORKERS. Results are in the same order
+    :param directory: PosixPath of directory to begin searching
+    :return: list of dicts containing loaded skillets
+    """
+    snippet_files = _find_snippet_files(directory, list())
+    results = parallel_utils.map_in_processes(_load_snippet_file, snippet_files)
+
+    # _check_tree does not descend below a metadata file that fails to load
+    error_dirs = {str(f.parent.absolute()) for (f, (service_config, err)) in zip(snippet_files, results) if err}
+    return [service_config for (f, (service_config, err)) in zip(snippet_files, results)
+            if service_config is not None
+            and not any(str(parent) in error_dirs for parent in f.parent.absolute().parents)]
+
+
+def _find_snippet_files(directory: Path, snippet_files: list) -> list:
+    """
+    Collect the paths of all '.meta-cnc.yaml' files in the directory tree, without loading them
+    :param directory: PosixPath of directory to begin searching
+    :param snippet_files: combined list of all found files
+    :return: list of PosixPaths
+    """
+    found_files = scan_utils.find_files(str(directory), ('.meta-cnc.y*',))
+    snippet_files.extend(Path(f) for f in found_files)
+    return snippet_files
+
+
+def _load_snippet_file(d: Path) -> (dict, bool):
+    """
+    Load and normalize a single '.meta-cnc.yaml' file
+    :param d: PosixPath of the metadata file
+    :return: tuple of the skillet dict or None if it could not be loaded, and whether an error should stop _check_dir
+    from descending any further
+    """
+    snippet_path = str(d.parent.absolute())
+    # print(f'snippet_path is {snippet_path}')
+    try:
+        with d.open(mode='r') as sc:
+            raw_service_config = yaml_utils.safe_load(sc.read())
+            service_config = _normalize_snippet_structure(raw_service_config)
+            service_config['snippet_path'] = snippet_path
+            return service_config, False
+
+    except IOError as ioe:
+        print('Could not open metadata file in dir %s' % d.parent)
+        print(ioe)
+    except ParserError as pe:
+        print('Could not parse metadata file in dir %s' % d.parent)
+        print(pe)
+    except ScannerError as se:
+        print('Could not parse meta-cnc file in dir %s' % d.parent)
+        print(se)
+        return None, False
+    except ConstructorError as ce:
+        print('Could not parse metadata file in dir %s' % d.parent)
+        print(ce)
+    except ReaderError as re:
+        print('Could not parse metadata file in dir %s' % d.parent)
+        print(re)
+    except YAMLError as ye:
+        print('YAMLError: Could not parse metadata file in dir %s' % d.parent)
+        print(ye)
+    except Exception as ex:
+        print('Caught unknown exception!')
+        print(ex)
+
+    return None, True
+
+
 def debug_snippets_in_repo(directory: Path, err_list: list) -> list:
     sl = SkilletLoader()
 
@@ -294,14 +368,38 @@ def load_snippet_with_name(snippet_name, app_dir) -> (dict, None):
     """
     print(f'checking in app_dir {app_dir} for snippet {snippet_name}')
     services = load_all_snippets(app_dir)
-    for service in services:
-        if service['name'] == snippet_name:
+    if snippet_name in _get_name_index(services):
+        # the catalog only holds summaries, the full definition is loaded once a skillet is opened
+        service = db_utils.load_skillet_by_name(snippet_name)
+        if service is not None:
             return service
 
     print('Could not find service with name: %s' % snippet_name)
     return None
 
 
+def _get_name_index(services: list) -> dict:
+    """
+    Returns a dict of skillet name to skillet for the given catalog. The index is rebuilt whenever the catalog list
+    is replaced, for example after a rebuild or an eviction, and is otherwise reused across calls
+    :param services: catalog list as returned from load_all_snippets
+    :return: dict of skillet name to skillet dict
+    """
+    global _name_index
+
+    (source, index) = _name_index
+    if source is not services:
+        index = dict()
+        # reversed so that the first skillet with a given name wins, same as a linear scan
+        for service in reversed(services):
+            if 'name' in service:
+                index[service['name']] = service
+
+        _name_index = (services, index)
+
+    return index
+
+
 def get_snippet_metadata(snippet_name, app_name) -> (str, None):
     """
     Returns the snippet metadata as a str
@@ -345,7 +443,7 @@ def read_skillet_metadata(skillet: dict) -> (str, None):
                             print('metadata file is blank!')
                             return None
 
-                        snippet_data = oyaml.safe_load(data)
+                        snippet_data = yaml_utils.safe_load(data)
 
                         if 'name' in snippet_data and snippet_data['name'] == skillet_name:
                             print(f'Found {skillet_name} at {parent.absolute()}')
@@ -434,18 +532,21 @@ def resolve_dependencies(snippet, app_dir, dependencies) -> list:
         dependencies = list()
 
     if 'extends' in snippet and snippet['extends'] is not None:
+        services = load_all_snippets(app_dir)
+        graph = dependency_utils.get_dependency_graph(services)
         parent_snippet_name = snippet['extends']
         print(parent_snippet_name)
-        if parent_snippet_name not in dependencies:
-            dependencies.append(parent_snippet_name)
-            parent_snippet = load_snippet_with_name(snippet['extends'], app_dir)
-            if parent_snippet is None:
+
+        # same walk as following each extends in turn, but using the lineage precomputed for this catalog
+        for ancestor_name in graph.lineage.get(parent_snippet_name, (parent_snippet_name,)):
+            if ancestor_name in dependencies:
+                break
+
+            dependencies.append(ancestor_name)
+            if ancestor_name not in graph.parents:
                 print(f"Could not load the snippet named by the extends from {snippet['name']}")
                 raise SnippetNotFoundException
 
-            # inception time
-            return resolve_dependencies(parent_snippet, app_dir, dependencies)
-
     # always reverse the list as we need to walk this list from deep to shallow
     dependencies.reverse()
     return dependencies
@@ -479,17 +580,7 @@ def load_all_labels(app_dir: str) -> list:
     :param app_dir: application directory where to search all snippets
     :return: list of strings representing all found label keys
     """
-    labels = list()
-    snippets = load_all_snippets(app_dir)
-    for snippet in snippets:
-        if 'labels' not in snippet:
-            continue
-
-        labels = snippet.get('labels', [])
-        for label_name in labels:
-            labels.append(label_name)
-
-    return labels
+    return db_utils.load_all_skillet_label_keys()
 
 
 def load_all_label_values(app_dir: str, label_name: str) -> list:
@@ -499,31 +590,13 @@ def load_all_label_values(app_dir: str, label_name: str) -> list:
     labels:
         label_name: label_value
 
-    will add 'label_name' to the list
+    will add 'label_value' to the list
 
     :param app_dir: application directory where to search all snippets
     :param label_name: name of the label to search for
     :return: list of strings representing all found label values for given key
     """
-    labels_list = list()
-    snippets = load_all_snippets_with_label_key(app_dir, label_name)
-    for snippet in snippets:
-        if 'labels' not in snippet:
-            continue
-
-        labels = snippet.get('labels', [])
-        for label_key in labels:
-            if label_key == label_name:
-                if type(labels[label_name]) is str:
-                    label_value = labels[label_name]
-                    if label_value not in labels_list:
-                        labels_list.append(label_value)
-                elif type(labels[label_name]) is list:
-                    for label_list_value in labels[label_name]:
-                        if label_list_value not in labels_list:
-                            labels_list.append(label_list_value)
-
-    return labels_list
+    return db_utils.load_all_skillet_label_values(label_name)
 
 
 def load_all_snippets_with_label_key(app_dir: str, label: str):
@@ -533,18 +606,7 @@ def load_all_snippets_with_label_key(app_dir: str, label: str):
     :param label: name of the label key to search
     :return: list of dicts representing loaded .meta-cnc definitions
     """
-    snippets_with_label = list()
-    snippets = load_all_snippets(app_dir)
-    for snippet in snippets:
-        if 'labels' not in snippet:
-            continue
-
-        labels = snippet.get('labels', [])
-        for label_name in labels:
-            if label_name == label:
-                snippets_with_label.append(snippet)
-
-    return snippets_with_label
+    return db_utils.load_skillets_with_label_key(label)
 
 
 def load_all_snippets_without_label_key(app_dir: str, label: str) -> list:
@@ -554,24 +616,9 @@ def load_all_snippets_without_label_key(app_dir: str, label: str) -> list:
     :param label: name of the label key to search
     :return: list of dicts representing loaded .meta-cnc definitions
     """
-    snippets_with_label = list()
-    snippets = load_all_snippets(app_dir)
-    for snippet in snippets:
-        if 'labels' not in snippet:
-            continue
-
-        labels = snippet.get('labels', [])
-        found = False
-        for label_name in labels:
-            if label_name == label:
-                found = True
-
-        if not found:
-            # ignore meta-cnc files with a type of 'app'
-            if 'type' in snippet and snippet['type'] != 'app':
-                snippets_with_label.append(snippet)
-
-    return snippets_with_label
+    snippets = db_utils.load_skillets_without_label_key(label)
+    # ignore meta-cnc files without any labels, or without a type or with a type of 'app'
+    return [snippet for snippet in snippets if 'labels' in snippet and snippet['type'] not in ('', 'app')]
 
 
 def _normalize_snippet_structure(skillet: dict) -> dict:
@@ -0,0 +1,359 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+Watches the imported skillet repositories for local edits and re-indexes the affected skillet directories
+
+Uses the Linux inotify API directly through ctypes, so no extra packages are needed. On other platforms the watcher
+reports that it is unavailable and does nothing. Enable it in the web process with settings.SKILLET_WATCHER, or run it
+on its own with 'python manage.py watch_skillets'. Only one watcher runs per install at a time, any others started by
+further web worker processes wait on a lock file and take over once the process holding it exits.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import select
+import struct
+import threading
+import time
+from fnmatch import fnmatchcase
+
+from django.db import close_old_connections
+
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import scan_utils
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+# seconds without any further change before the changed skillets are indexed
+DEBOUNCE_SECONDS = 0.3
+
+# index at least this often, even while files keep changing
+MAX_DELAY_SECONDS = 3.0
+
+# lock file in $HOME/.pan_cnc/app_name held by the one running watcher of the app
+WATCHER_LOCK_FILE = 'watcher.lock'
+
+# seconds between attempts to take the lock while another process holds it
+LOCK_RETRY_SECONDS = 10.0
+
+_watchers = dict()
+_watchers_lock = threading.Lock()
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def watcher_available() -> bool:
+    """
+    Checks whether this platform supports inotify
+
+    :return: True if a SkilletRepositoryWatcher can be started
+    """
+    return _libc is not None
+
+
+class SkilletRepositoryWatcher(threading.Thread):
+    """
+    Background thread watching every directory of the imported repositories of an app. Changed files are collected per
+    repository until no further change arrives for DEBOUNCE_SECONDS, then only the skillet directories holding them
+    are indexed again with db_utils.refresh_skillets_in_paths
+    """
+
+    def __init__(self, app_name: str, debounce=DEBOUNCE_SECONDS):
+        super().__init__(name=f'skillet-watcher-{app_name}', daemon=True)
+        self.app_name = app_name
+        self.debounce = debounce
+        self.repositories_dir = os.path.join(os.path.expanduser('~/.pan_cnc'), app_name, 'repositories')
+        # directories that are never scanned for skillets are not watched either
+        self.ignore = scan_utils.get_ignore_globs()
+        self.stop_event = threading.Event()
+        self.fd = -1
+        # watch descriptor to the absolute path of the watched directory
+        self.watched_dirs = dict()
+        # repository name to the set of changed paths relative to that repository
+        self.pending = dict()
+        self.first_change = 0.0
+        self.last_change = 0.0
+        # lets scan_utils skip the directories that have not changed, as long as every directory is watched
+        self.tracker = scan_utils.ChangeTracker(self.repositories_dir, self.ignore, self._has_unread_events)
+        self.watching_all = True
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def run(self) -> None:
+        if _libc is None:
+            print('inotify is not available on this platform, skillet repositories will not be watched')
+            return
+
+        lock_fd = self._lock_watcher()
+        if lock_fd is None:
+            return
+
+        try:
+            self._watch()
+        finally:
+            os.close(lock_fd)
+
+    def _watch(self) -> None:
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            print(f'Could not start skillet watcher: {os.strerror(ctypes.get_errno())}')
+            return
+
+        try:
+            os.makedirs(self.repositories_dir, exist_ok=True)
+            with self.tracker.lock:
+                self._watch_tree(self.repositories_dir)
+
+            print(f'Watching {len(self.watched_dirs)} directories in {self.repositories_dir} for skillet changes')
+            if self.watching_all:
+                scan_utils.start_tracking(self.tracker)
+
+            while not self.stop_event.is_set():
+                timeout = 1.0
+                if self.pending:
+                    timeout = max(0.0, min(self.last_change + self.debounce,
+                                           self.first_change + MAX_DELAY_SECONDS) - time.monotonic())
+
+                (readable, _, _) = select.select([self.fd], [], [], timeout)
+                if readable:
+                    self._read_events()
+                    continue
+
+                if self.pending:
+                    self._index_pending()
+
+        finally:
+            scan_utils.stop_tracking(self.tracker)
+            os.close(self.fd)
+            close_old_connections()
+
+    def _lock_watcher(self) -> (int, None):
+        """
+        Takes the watcher lock of the app, so every edit is only indexed once however many processes start a watcher.
+        While another process holds it, tries again every LOCK_RETRY_SECONDS until stopped
+
+        :return: file descriptor holding the lock, or None if stopped first or the lock file could not be opened
+        """
+        lock_file = os.path.join(os.path.expanduser('~/.pan_cnc'), self.app_name, WATCHER_LOCK_FILE)
+        try:
+            os.makedirs(os.path.dirname(lock_file), mode=0o700, exist_ok=True)
+            lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        except OSError as ose:
+            print(f'Could not open skillet watcher lock: {ose}')
+            return None
+
+        waiting = False
+        while True:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_fd
+            except BlockingIOError:
+                if not waiting:
+                    print(f'Skillet repositories of {self.app_name} are already watched by another process')
+                    waiting = True
+
+            if self.stop_event.wait(LOCK_RETRY_SECONDS):
+                os.close(lock_fd)
+                return None
+
+    def _watch_tree(self, directory: str) -> list:
+        """
+        Adds a watch for this directory and every directory below it, other than those matching
+        settings.SKILLET_SCAN_IGNORE. Call while holding the lock of the tracker
+
+        :param directory: absolute path of the directory
+        :return: list of the files found, relative to the repositories directory
+        """
+        found_files = list()
+        stack = [directory]
+        while stack:
+            dir_path = stack.pop()
+            # watch before listing, so any entry added in the meantime is either listed or reported
+            wd = _libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK | IN_ONLYDIR)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error != errno.ENOENT:
+                    # a directory that was removed again is reported to its parent, any other is never watched
+                    print(f'Could not watch {dir_path}: {os.strerror(error)}')
+                    self.watching_all = False
+                    scan_utils.stop_tracking(self.tracker)
+
+                continue
+
+            self.watched_dirs[wd] = dir_path
+            # entries may have been added before the watch, a manifest entry from before then can not be trusted
+            self.tracker.mark_changed(dir_path)
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if not entry.is_dir():
+                            found_files.append(os.path.relpath(entry.path, self.repositories_dir))
+                        elif not entry.is_symlink() and not self._is_ignored(entry.name):
+                            stack.append(entry.path)
+
+            except OSError as oe:
+                print(f'Could not list {dir_path}: {oe}')
+
+        return found_files
+
+    def _has_unread_events(self) -> bool:
+        (readable, _, _) = select.select([self.fd], [], [], 0)
+        return bool(readable)
+
+    def _read_events(self) -> None:
+        # scans wait for the changes read here to be reported to the tracker
+        with self.tracker.lock:
+            self._read_tracked_events()
+
+    def _read_tracked_events(self) -> None:
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            (wd, mask, _cookie, name_length) = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, re-index every repository from git
+                print('Skillet watcher missed some changes, checking all repositories')
+                self.tracker.reset()
+                for repo_name in os.listdir(self.repositories_dir):
+                    self.pending.setdefault(repo_name, set()).add(None)
+
+                self._touch()
+                continue
+
+            if mask & IN_IGNORED:
+                self.watched_dirs.pop(wd, None)
+                continue
+
+            directory = self.watched_dirs.get(wd, None)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+                self.tracker.mark_changed(directory)
+
+            if mask & IN_ISDIR and self._is_ignored(name):
+                continue
+
+            if not mask & IN_ISDIR:
+                changed_files = [os.path.relpath(path, self.repositories_dir)]
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                # files may be written before the new directory is watched, treat them all as changed
+                changed_files = self._watch_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changed_files = [os.path.relpath(path, self.repositories_dir)]
+            else:
+                continue
+
+            for changed_file in changed_files:
+                self._add_change(changed_file)
+
+    def _add_change(self, changed_file: str) -> None:
+        parts = changed_file.split(os.sep)
+        if len(parts) < 2 or any(self._is_ignored(part) for part in parts[:-1]):
+            return
+
+        self.pending.setdefault(parts[0], set()).add(os.path.join(*parts[1:]))
+        self._touch()
+
+    def _is_ignored(self, dir_name: str) -> bool:
+        return any(fnmatchcase(dir_name, i) for i in self.ignore)
+
+    def _touch(self) -> None:
+        now = time.monotonic()
+        if self.first_change == 0.0:
+            self.first_change = now
+
+        self.last_change = now
+
+    def _index_pending(self) -> None:
+        (pending, self.pending) = (self.pending, dict())
+        self.first_change = 0.0
+
+        close_old_connections()
+        for (repo_name, changed_files) in pending.items():
+            try:
+                if None in changed_files:
+                    db_utils.refresh_skillets_from_repo(repo_name)
+                else:
+                    db_utils.refresh_skillets_in_paths(repo_name, sorted(changed_files))
+            except Exception as e:
+                # keep watching, the next change or a full refresh will try again
+                print(f'Could not index changes in repository {repo_name}: {e}')
+
+
+def start_watcher(app_name: str) -> (SkilletRepositoryWatcher, None):
+    """
+    Starts watching the repositories of an app in a background thread, unless it is already being watched
+
+    :param app_name: name of the CNC application
+    :return: the running watcher, or None if inotify is not available
+    """
+    if not watcher_available():
+        print('inotify is not available on this platform, skillet repositories will not be watched')
+        return None
+
+    with _watchers_lock:
+        watcher = _watchers.get(app_name, None)
+        if watcher is None or not watcher.is_alive():
+            watcher = SkilletRepositoryWatcher(app_name)
+            watcher.start()
+            _watchers[app_name] = watcher
+
+    return watcher
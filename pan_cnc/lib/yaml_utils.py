@@ -0,0 +1,67 @@
+# Copyright (c) 2018, Palo Alto Networks
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Author: Nathan Embery nembery@paloaltonetworks.com
+
+"""
+YAML loading for skillet metadata files
+
+Uses the libyaml based CSafeLoader when PyYAML was built with libyaml, which parses several times faster than the pure
+Python SafeLoader used by oyaml.safe_load, and falls back to SafeLoader otherwise. Both produce exactly the same
+objects, with mappings loaded as dicts in document order.
+"""
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as _BaseSafeLoader
+    libyaml_available = True
+except ImportError:
+    from yaml import SafeLoader as _BaseSafeLoader
+    libyaml_available = False
+
+
+class OrderedSafeLoader(_BaseSafeLoader):
+    """
+    Safe loader that always builds mappings in the order they appear in the document
+    """
+    pass
+
+
+def _construct_ordered_mapping(loader: OrderedSafeLoader, node: yaml.MappingNode):
+    # yield the empty dict first so recursive anchors can refer to it, same as SafeConstructor.construct_yaml_map
+    data = dict()
+    yield data
+    loader.flatten_mapping(node)
+    for (key_node, value_node) in node.value:
+        key = loader.construct_object(key_node, deep=False)
+        try:
+            hash(key)
+        except TypeError as te:
+            raise yaml.constructor.ConstructorError('while constructing a mapping', node.start_mark,
+                                                    f'found unhashable key ({te})', key_node.start_mark)
+        data[key] = loader.construct_object(value_node, deep=False)
+
+
+OrderedSafeLoader.add_constructor('tag:yaml.org,2002:map', _construct_ordered_mapping)
+
+
+def safe_load(stream: (str, bytes)) -> any:
+    """
+    Drop in replacement for yaml.safe_load and oyaml.safe_load using the fastest available loader
+
+    :param stream: YAML document as a str, bytes, or open file
+    :return: loaded object
+    """
+    return yaml.load(stream, Loader=OrderedSafeLoader)
@@ -160,6 +160,42 @@ CACHES = {
     }
 }
 
+# Long term cache storage shared by the web and celery worker processes. BACKEND is one of:
+#   'file' - snapshot plus journal in $HOME/.pan_cnc/<app>
+#   'sqlite' - indexed SQLite table, keys are loaded on demand. LOCATION is an optional directory for the db files
+#   'redis' - any Redis protocol server, requires the redis package. LOCATION is a url such as
+#             redis://localhost:6379/0 or unix:///run/cnc/redis.sock
+# or the dotted path of a pan_cnc.lib.cache_utils.LongTermCache subclass
+# SERIALIZER is 'pickle' or 'json' for the file backend and defaults to 'pickle'. The sqlite and redis backends may be
+# written to by other hosts and always use 'json', as loading a pickle someone else wrote can run arbitrary code.
+# COMPRESSION is 'zlib' or 'none'. Existing data is read regardless of these
+LONG_TERM_CACHE = {
+    'BACKEND': os.environ.get('CNC_LONG_TERM_CACHE_BACKEND', 'file'),
+    'LOCATION': os.environ.get('CNC_LONG_TERM_CACHE_LOCATION', ''),
+    'SERIALIZER': os.environ.get('CNC_LONG_TERM_CACHE_SERIALIZER', ''),
+    'COMPRESSION': 'zlib',
+}
+
+# Number of processes used to parse skillet metadata files when indexing. 1 parses serially in the calling process,
+# 0 starts one process per cpu
+SKILLET_INDEX_WORKERS = os.environ.get('CNC_SKILLET_INDEX_WORKERS', 1)
+
+# Number of per commit snapshots of indexed repositories to keep, checking out a commit with a snapshot restores its
+# skillets without loading any skillet files. 0 disables snapshots
+SKILLET_INDEX_SNAPSHOTS = os.environ.get('CNC_SKILLET_INDEX_SNAPSHOTS', 20)
+
+# Glob patterns of directory names that are never searched or watched for skillets
+SKILLET_SCAN_IGNORE = ('*.git*', '*.venv*', '*.terraform*', 'node_modules', '__pycache__')
+
+# Watch the imported repositories for local edits from the web process and re-index the changed skillets as they are
+# saved. Linux only. With several web worker processes only one of them watches at a time, the others wait on a lock
+# file to take over. The watcher can also be run on its own with 'python manage.py watch_skillets' instead
+SKILLET_WATCHER = os.environ.get('CNC_SKILLET_WATCHER', 'false').lower() in ('1', 'true', 'yes')
+
+# Catalog file created with 'python manage.py catalog_snapshot export', imported on start when the repositories are
+# checked out at the same commits it was exported from. Lets container images ship an already indexed catalog
+CATALOG_SNAPSHOT = os.environ.get('CNC_CATALOG_SNAPSHOT', '')
+
 LOGIN_REDIRECT_URL = '/'
 
 INSTALLED_APPS_CONFIG = dict()
@@ -175,7 +211,8 @@ for app in os.listdir(SRC_PATH):
             if os.path.exists(os.path.join(app_dir, '.pan-cnc.yaml')):
                 try:
                     with open(os.path.join(app_dir, '.pan-cnc.yaml')) as app_conf_file:
-                        app_conf = yaml.safe_load(app_conf_file.read())
+                        # use libyaml when available, pan_cnc.lib.yaml_utils cannot be imported before django is set up
+                        app_conf = yaml.load(app_conf_file.read(), Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
                         app_conf['app_dir'] = app_dir
                         print('Adding app config for app: %s' % app)
                         # print(app_conf)
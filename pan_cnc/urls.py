@@ -30,10 +30,13 @@ import sys
 
 from django.conf import settings
 from django.contrib.auth import views as auth_views
+from django.db import DatabaseError
 from django.urls import path
 
 from pan_cnc import views as pan_cnc_views
+from pan_cnc.lib import catalog_utils
 from pan_cnc.lib import cnc_utils
+from pan_cnc.lib import watch_utils
 
 # ensure every view gets this in the context, even django default views
 app_settings = settings.INSTALLED_APPS_CONFIG
@@ -63,6 +66,7 @@ urlpatterns = [
     path('provision', pan_cnc_views.ProvisionSnippetView.as_view()),
     path('terraform', pan_cnc_views.EditTerraformView.as_view()),
     path('clear_cache', pan_cnc_views.ClearCacheView.as_view()),
+    path('search_skillets', pan_cnc_views.SearchSkilletsView.as_view()),
     path('view_workflow', pan_cnc_views.DebugContextView.as_view()),
     path('view_context', pan_cnc_views.DebugContextView.as_view()),
     path('app_logs', pan_cnc_views.ViewLogsView.as_view()),
@@ -81,6 +85,16 @@ for app_name in settings.INSTALLED_APPS_CONFIG:
     print('Performing CNC App initialization')
     cnc_utils.init_app(app)
 
+    # once the repositories are cloned, load the catalog shipped with this install if they are at the same commits
+    if settings.CATALOG_SNAPSHOT and not cnc_utils.is_testing():
+        try:
+            catalog_utils.import_catalog(settings.CATALOG_SNAPSHOT)
+        except DatabaseError as de:
+            print(f'Could not import skillet catalog: {de}')
+
+    if settings.SKILLET_WATCHER:
+        watch_utils.start_watcher(app_name)
+
     if 'views' not in app:
         print('Skipping app: %s with no views configured' % app_name)
         continue
@@ -74,6 +74,7 @@ from pan_cnc.lib import cnc_utils
 from pan_cnc.lib import db_utils
 from pan_cnc.lib import git_utils
 from pan_cnc.lib import output_utils
+from pan_cnc.lib import search_utils
 from pan_cnc.lib import snippet_utils
 from pan_cnc.lib import task_utils
 from pan_cnc.lib import widgets
@@ -2762,6 +2763,25 @@ class GetSecretView(EnvironmentBase):
             return JsonResponse(res)
 
 
+class SearchSkilletsView(CNCBaseAuth, View):
+    """
+    Full text search of the skillet catalog. Accepts the query string parameters q, page, and page_size and returns
+    a ranked page of matching skillets as JSON
+    """
+
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        query = request.GET.get('q', '')
+        try:
+            page = int(request.GET.get('page', 1))
+            page_size = int(request.GET.get('page_size', 20))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'page and page_size must be integers'}, status=400)
+
+        res = search_utils.search_skillets(query, page, page_size)
+        res['status'] = 'success'
+        return JsonResponse(res)
+
+
 class UnlockEnvironmentsView(CNCBaseAuth, FormView):
     """
     unlock an environment
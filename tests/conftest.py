@@ -0,0 +1,43 @@
+import os
+import subprocess
+
+import pytest
+
+from pan_cnc.lib import cache_utils
+
+
+class SkilletRepo:
+    """
+    Git repository of skillets, imported as 'repo' into the 'testapp' CNC application
+    """
+
+    def __init__(self, repo_dir: str):
+        self.repo_dir = repo_dir
+        os.makedirs(repo_dir)
+        self.git('init', '-q')
+
+    def git(self, *args) -> None:
+        subprocess.run(['git', '-C', self.repo_dir, '-c', 'user.email=cnc@example.com', '-c', 'user.name=cnc', *args],
+                       check=True, capture_output=True)
+
+    def write_skillet(self, path: str, name: str, description='', snippets=None) -> None:
+        if snippets is None:
+            snippets = [f'  - name: {name}_snippet\n    xpath: /config\n    element: <{name}/>\n']
+
+        os.makedirs(os.path.join(self.repo_dir, path), exist_ok=True)
+        with open(os.path.join(self.repo_dir, path, '.meta-cnc.yaml'), 'w') as meta_file:
+            meta_file.write(f'name: {name}\nlabel: {name}\ndescription: {description}\ntype: panos\n'
+                            f'variables: []\nsnippets:\n{"".join(snippets)}')
+
+    def commit(self) -> None:
+        self.git('add', '-A')
+        self.git('commit', '-qm', 'update skillets')
+
+
+@pytest.fixture
+def skillet_repo(tmp_path, monkeypatch, settings):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    settings.INSTALLED_APPS_CONFIG = {'testapp': {}}
+    settings.SKILLET_INDEX_SNAPSHOTS = 0
+    return SkilletRepo(os.path.join(str(tmp_path), '.pan_cnc', 'testapp', 'repositories', 'repo'))
@@ -0,0 +1,280 @@
+import multiprocessing
+import pickle
+import threading
+from time import sleep
+
+import pytest
+
+from pan_cnc.lib import cache_utils
+
+
+@pytest.fixture
+def ltc(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return cache_utils.LongTermCache('test_app')
+
+
+def test_get_returns_live_reference(ltc):
+    catalog = [{'name': 'one'}]
+    ltc.set('all_snippets', catalog, -1)
+    assert ltc.get('all_snippets') is catalog
+
+
+def test_set_none_removes_key(ltc):
+    ltc.set('key', 'value')
+    ltc.set('key', None)
+    assert ltc.get('key') is None
+    assert 'key' not in ltc.meta
+
+
+def test_expired_value_is_not_returned(ltc):
+    ltc.set('key', 'value', life=10)
+    ltc.meta['key']['time'] -= 11
+    ltc.load_dict(ltc.to_dict())
+    assert ltc.get('key') is None
+
+
+def test_round_trip_legacy_format(ltc):
+    ltc.set('key', 'value', -1, 'git')
+    restored = cache_utils.LongTermCache('test_app')
+    restored.load_dict(ltc.to_dict())
+    assert restored.get('key') == 'value'
+    assert restored.keys_of_type('git') == ['key']
+
+
+def test_journal_replay_restores_changes(ltc, monkeypatch):
+    monkeypatch.setattr(cache_utils, '_caches', {'test_app': ltc})
+    ltc.set('kept', 'value', -1)
+    ltc.set('removed', 'value', -1)
+    ltc.save()
+    ltc.set('removed', None)
+    ltc.save()
+
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    restored = cache_utils.get_cache('test_app')
+    assert restored.get('kept') == 'value'
+    assert restored.get('removed') is None
+
+
+def test_sqlite_backend_loads_keys_on_demand(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    ltc = cache_utils.SqliteLongTermCache('test_app')
+    ltc.set('catalog', [{'name': 'one'}], -1)
+    ltc.set('throttle', True, 3600, 'git')
+    ltc.save()
+
+    restored = cache_utils.SqliteLongTermCache('test_app')
+    restored.load()
+    assert restored.values == dict()
+    assert restored.get('throttle') is True
+    assert list(restored.values) == ['throttle']
+    assert restored.keys_of_type('snippet') == ['catalog']
+
+
+def test_evict_type_only_removes_that_type(ltc):
+    ltc.set('repo_one', 'detail', -1, 'git_repo_details')
+    ltc.set('repo_two', 'detail', -1, 'git_repo_details')
+    ltc.set('all_snippets', [], -1, 'snippet')
+    assert sorted(ltc.evict_type('git_repo_details')) == ['repo_one', 'repo_two']
+    assert ltc.keys_of_type('git_repo_details') == []
+    assert ltc.get('all_snippets') == []
+    assert {'repo_one', 'repo_two'} <= ltc.dirty_keys
+
+
+def test_sweep_removes_only_expired_items(ltc):
+    ltc.set('expired', 'value', life=10)
+    ltc.set('overwritten', 'value', life=10)
+    ltc.set('forever', 'value', life=-1)
+    for key in ('expired', 'overwritten'):
+        ltc.meta[key]['time'] -= 11
+    ltc.load_dict(ltc.to_dict())
+    ltc.set('overwritten', 'new value', life=10)
+    ltc.dirty_keys = set()
+
+    assert ltc.sweep() == 1
+    assert 'expired' not in ltc.values
+    assert ltc.get('overwritten') == 'new value'
+    assert ltc.get('forever') == 'value'
+    assert ltc.dirty_keys == {'expired'}
+
+
+def test_deserialize_reads_legacy_json(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    assert cache_utils.deserialize(b'{"all_snippets": []}') == {'all_snippets': []}
+    assert cache_utils.deserialize(cache_utils.serialize({'key': [1, 2]})) == {'key': [1, 2]}
+
+
+def test_torn_journal_record_is_skipped(ltc, monkeypatch):
+    monkeypatch.setattr(cache_utils, '_caches', {'test_app': ltc})
+    ltc.set('first', 'value', -1)
+    ltc.save()
+    journal = cache_utils.get_cache_dir('test_app') + '/cache.journal'
+    with open(journal, 'r+b') as jf:
+        jf.truncate(len(jf.read()) - 3)
+    ltc.set('second', 'value', -1)
+    ltc.save()
+
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    restored = cache_utils.get_cache('test_app')
+    assert restored.get('first') is None
+    assert restored.get('second') == 'value'
+
+
+def test_memory_usage_counts_shared_values_once(ltc, monkeypatch):
+    other = cache_utils.LongTermCache('other_app')
+    monkeypatch.setattr(cache_utils, '_caches', {'test_app': ltc, 'other_app': other})
+    catalog = [{'name': f'skillet_{i}', 'description': 'x' * 100} for i in range(100)]
+    ltc.set('all_snippets', catalog, -1)
+    single = cache_utils.memory_usage()['test_app']
+
+    other.set('all_snippets', catalog, -1)
+    usage = cache_utils.memory_usage()
+    assert usage['test_app'] == single
+    assert usage['other_app'] < single / 10
+
+
+def test_single_flight_rebuilds_once(ltc, monkeypatch):
+    monkeypatch.setattr(cache_utils, '_caches', {'test_app': ltc})
+    rebuilds = list()
+
+    def load():
+        with cache_utils.single_flight('test_app', 'catalog'):
+            if ltc.get('catalog') is None:
+                rebuilds.append(threading.get_ident())
+                sleep(0.05)
+                ltc.set('catalog', ['rebuilt'], -1)
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(rebuilds) == 1
+    assert ltc.get('catalog') == ['rebuilt']
+
+
+def test_pickled_values_must_be_signed_with_the_key_of_this_install(settings, tmp_path, monkeypatch):
+    settings.LONG_TERM_CACHE = {'BACKEND': 'file'}
+    monkeypatch.setenv('HOME', str(tmp_path / 'other'))
+    other_install = cache_utils.serialize({'key': (1, 2)})
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    data = cache_utils.serialize({'key': (1, 2)})
+    assert cache_utils.deserialize(data) == {'key': (1, 2)}
+    key_file = tmp_path / '.pan_cnc' / cache_utils.SIGNING_KEY_FILE
+    assert key_file.stat().st_mode & 0o777 == 0o600
+
+    header = len(cache_utils.SERIALIZED_MAGIC) + 2
+    tampered = data[:header] + bytes(cache_utils.SIGNATURE_LENGTH) + data[header + cache_utils.SIGNATURE_LENGTH:]
+    unsigned = cache_utils.SERIALIZED_MAGIC + b'p-' + pickle.dumps({'key': (1, 2)})
+    for untrusted in (tampered, unsigned, other_install):
+        with pytest.raises(ValueError):
+            cache_utils.deserialize(untrusted)
+
+
+def test_shared_backends_never_use_pickle(settings, tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    settings.LONG_TERM_CACHE = {'BACKEND': 'file'}
+    pickled = cache_utils.serialize({'key': [1, 2]})
+
+    settings.LONG_TERM_CACHE = {'BACKEND': 'redis', 'SERIALIZER': 'pickle'}
+    data = cache_utils.serialize({'key': [1, 2]})
+    assert data[len(cache_utils.SERIALIZED_MAGIC):len(cache_utils.SERIALIZED_MAGIC) + 1] == b'j'
+    assert cache_utils.deserialize(data) == {'key': [1, 2]}
+    with pytest.raises(ValueError):
+        cache_utils.deserialize(pickled)
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache_utils.redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server))
+    return server
+
+
+def test_redis_backend_set_delete_and_clear(redis_server):
+    ltc = cache_utils.RedisLongTermCache('test_app')
+    ltc.set('catalog', [{'name': 'one'}], -1)
+    ltc.set('throttle', True, 3600, 'git')
+    ltc.set('removed', 'value')
+    ltc.save()
+    ltc.set('removed', None)
+    ltc.save()
+
+    restored = cache_utils.RedisLongTermCache('test_app')
+    restored.load()
+    assert restored.get('catalog') == [{'name': 'one'}]
+    assert restored.get('removed') is None
+    assert restored.keys_of_type('git') == ['throttle']
+
+    restored.clear()
+    restored.save()
+    assert cache_utils.RedisLongTermCache('test_app').to_dict() == {'meta': {}}
+
+
+def test_redis_backend_instances_stay_coherent(redis_server):
+    (first, second) = (cache_utils.RedisLongTermCache('test_app'), cache_utils.RedisLongTermCache('test_app'))
+    first.set('catalog', ['old'], -1)
+    first.save()
+    assert second.get('catalog') == ['old']
+
+    first.set('catalog', ['new'], -1)
+    first.set('other', 'value', -1)
+    first.save()
+    second.maybe_refresh(force=True)
+    assert (second.get('catalog'), second.get('other')) == (['new'], 'value')
+
+    second.clear()
+    second.save()
+    first.maybe_refresh(force=True)
+    assert (first.get('catalog'), first.get('other')) == (None, None)
+
+
+def _set_in_other_process(backend: type, location: str, key: str, value: any) -> None:
+    ltc = backend('test_app', location)
+    ltc.load()
+    ltc.set(key, value, -1)
+    ltc.save()
+
+
+@pytest.mark.parametrize('backend', ['file', 'redis'])
+def test_processes_stay_coherent(backend, tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    location = ''
+    if backend == 'redis':
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        location = f'redis://127.0.0.1:{server.server_address[1]}/0'
+
+    backend_class = cache_utils.BACKENDS[backend]
+    ltc = backend_class('test_app', location)
+    ltc.load()
+    ltc.set('catalog', ['old'], -1)
+    ltc.save()
+
+    try:
+        for value in (['new'], ['newer']):
+            writer = multiprocessing.get_context('fork').Process(target=_set_in_other_process,
+                                                                 args=(backend_class, location, 'catalog', value))
+            writer.start()
+            writer.join()
+            assert writer.exitcode == 0
+
+            ltc.maybe_refresh(force=True)
+            assert ltc.get('catalog') == value
+    finally:
+        if backend == 'redis':
+            server.shutdown()
+            server.server_close()
+
+
+def test_incomplete_lazy_backend_cannot_be_created():
+    class IncompleteCache(cache_utils.LazyLongTermCache):
+        def _fetch(self, key: str) -> (tuple, None):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteCache('test_app')
@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+from cnc.models import RepositoryDetails
+from cnc.models import Skillet
+from pan_cnc.lib import catalog_utils
+from pan_cnc.lib import cnc_utils
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import dependency_utils
+
+
+@pytest.fixture
+def exported_catalog(db, skillet_repo, tmp_path):
+    skillet_repo.write_skillet('dns', 'dns')
+    skillet_repo.write_skillet('ntp', 'ntp')
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+
+    catalog_file = str(tmp_path / 'catalog.json')
+    assert catalog_utils.export_catalog(catalog_file)
+    return catalog_file
+
+
+def test_catalog_imports_only_at_exported_commit(exported_catalog, skillet_repo):
+    with open(exported_catalog) as cf:
+        assert json.load(cf)['version'] == catalog_utils.CATALOG_VERSION
+
+    assert not catalog_utils.import_catalog(exported_catalog)
+
+    RepositoryDetails.objects.all().delete()
+    cnc_utils.clear_long_term_cache('cnc')
+    with open(os.path.join(skillet_repo.repo_dir, 'dns', '.meta-cnc.yaml'), 'a') as meta_file:
+        meta_file.write('description: edited\n')
+
+    assert not catalog_utils.import_catalog(exported_catalog)
+    assert not Skillet.objects.exists()
+
+    skillet_repo.git('checkout', '-q', '.')
+    assert catalog_utils.import_catalog(exported_catalog)
+    assert sorted(Skillet.objects.values_list('name', flat=True)) == ['dns', 'ntp']
+    assert len(cnc_utils.get_long_term_cached_value('cnc', 'all_snippets')) == 2
+
+
+def test_import_replaces_a_stale_catalog_missing_from_the_export(db, skillet_repo, tmp_path, monkeypatch):
+    skillet_repo.write_skillet('dns', 'dns')
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+    cnc_utils.clear_long_term_cache('cnc')
+    catalog_file = str(tmp_path / 'catalog.json')
+    assert catalog_utils.export_catalog(catalog_file)
+
+    RepositoryDetails.objects.all().delete()
+    cnc_utils.set_long_term_cached_value('cnc', 'all_snippets', [{'name': 'stale'}], -1)
+    reported = list()
+    monkeypatch.setattr(dependency_utils, 'report_dependency_problems', reported.append)
+
+    assert catalog_utils.import_catalog(catalog_file)
+    assert [s['name'] for s in cnc_utils.get_long_term_cached_value('cnc', 'all_snippets')] == ['dns']
+    assert [[s['name'] for s in catalog] for catalog in reported] == [['dns']]
@@ -0,0 +1,346 @@
+import json
+import os
+import threading
+
+import pytest
+from django.db import connection
+
+from cnc.models import RepositoryDetails
+from cnc.models import Skillet
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import snippet_utils
+
+
+@pytest.mark.django_db
+def test_save_skillets_creates_updates_and_deletes_unseen_records(django_assert_max_num_queries):
+    repo = RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    skillets = [{'name': name, 'label': name, 'labels': {'role': name}} for name in ('dns', 'ntp', 'syslog', 'snmp')]
+    db_utils._save_skillets(repo, skillets, list(), repo.skillet_set.all())
+    assert sorted(Skillet.objects.values_list('name', flat=True)) == ['dns', 'ntp', 'snmp', 'syslog']
+    unchanged_id = Skillet.objects.get(name='ntp').id
+
+    found = [dict(skillets[0], label='DNS', labels={'role': 'resolver'}), {'name': 'banner', 'label': 'banner'}]
+    # the number of statements does not depend on the number of skillets
+    with django_assert_max_num_queries(12):
+        db_utils._save_skillets(repo, found, ['ntp'], repo.skillet_set.all())
+
+    records = {s.name: s for s in Skillet.objects.all()}
+    assert sorted(records) == ['banner', 'dns', 'ntp']
+    assert json.loads(records['dns'].skillet_json)['label'] == 'DNS'
+    assert records['ntp'].id == unchanged_id
+    assert sorted(db_utils.load_all_skillet_label_values('role')) == ['ntp', 'resolver']
+
+
+@pytest.mark.django_db
+def test_listings_read_summaries_and_opening_a_skillet_loads_its_definition(skillet_repo):
+    repo = RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    skillet = {'name': 'dns', 'label': 'Configure DNS', 'type': 'panos', 'description': 'DNS servers',
+               'labels': {'collection': ['Basics', 'Network']}, 'extends': 'base', 'variables': [{'name': 'dns'}]}
+    db_utils._save_skillets(repo, [skillet, {'name': 'base', 'type': 'panos'}], list(), repo.skillet_set.all())
+    assert db_utils.load_skillets_from_repo('repo')[0] == {
+        'name': 'dns', 'type': 'panos', 'label': 'Configure DNS', 'description': 'DNS servers', 'collection': 'Basics',
+        'labels': {'collection': ['Basics', 'Network']}, 'extends': 'base'}
+
+    updated = dict(skillet, label='DNS Servers', labels={'collection': 'Network'})
+    db_utils._save_skillets(repo, [updated], ['base'], repo.skillet_set.all())
+    # none of the listings parse skillet_json
+    Skillet.objects.update(skillet_json='not json')
+    listings = (db_utils.load_skillets_from_repo('repo'), db_utils.load_skillets_with_label('collection', 'Network'),
+                snippet_utils.load_all_snippets('testapp'))
+    for listing in listings:
+        dns = next(s for s in listing if s['name'] == 'dns')
+        assert (dns['label'], dns['collection'], dns['labels']) == ('DNS Servers', 'Network', {'collection': 'Network'})
+
+    assert 'labels' not in db_utils.load_skillets_from_repo('repo')[1]
+    assert snippet_utils.load_snippet_with_name('dns', 'testapp') is None
+
+    Skillet.objects.filter(name='dns').update(skillet_json=json.dumps(updated))
+    assert snippet_utils.load_snippet_with_name('dns', 'testapp')['variables'] == [{'name': 'dns'}]
+    assert snippet_utils.load_snippet_with_name('missing', 'testapp') is None
+
+
+@pytest.fixture
+def labelled_skillets(db):
+    repo = RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    skillets = [
+        {'name': 'dns', 'type': 'panos', 'labels': {'collection': ['Basics', 'Network'], 'order': 5}},
+        {'name': 'ntp', 'type': 'panos', 'labels': {'collection': ['Network', 9, 'Basics', 'x' * 600]}},
+        {'name': 'syslog', 'type': 'panos', 'labels': {'collection': 'Logging', 'help_link': 'https://example.com'}},
+        {'name': 'banner', 'type': 'panos'},
+        {'name': 'workflow', 'type': 'app', 'labels': {'order': 1}},
+    ]
+    db_utils._save_skillets(repo, skillets, list(), repo.skillet_set.all())
+
+
+def test_label_values_include_every_item_in_order(labelled_skillets):
+    assert db_utils.load_all_skillet_label_values('collection') == ['Basics', 'Network', 9, 'x' * 600, 'Logging']
+    assert db_utils.load_all_skillet_label_values('order') == []
+    assert db_utils.load_all_skillet_label_keys() == ['collection', 'order', 'help_link']
+
+
+def test_skillets_with_label(labelled_skillets):
+    assert [s['name'] for s in db_utils.load_skillets_with_label('collection', 'Network')] == ['dns', 'ntp']
+    assert [s['name'] for s in db_utils.load_skillets_with_label('collection', 'Logging')] == ['syslog']
+    assert db_utils.load_skillets_with_label('collection', 'Missing') == []
+
+
+def test_skillets_with_and_without_label_key(labelled_skillets):
+    assert [s['name'] for s in snippet_utils.load_all_snippets_with_label_key('', 'order')] == ['dns', 'workflow']
+    assert [s['name'] for s in db_utils.load_skillets_without_label_key('order')] == ['ntp', 'syslog', 'banner']
+    # skillets without any labels and apps are left out
+    assert [s['name'] for s in snippet_utils.load_all_snippets_without_label_key('', 'order')] == ['ntp', 'syslog']
+
+
+@pytest.mark.django_db
+def test_editing_an_including_skillet_resolves_includes_across_directories(skillet_repo):
+    skillet_repo.write_skillet('base', 'base')
+    skillet_repo.write_skillet('inc', 'inc', snippets=['  - name: base\n    include: base\n'])
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+
+    skillet_repo.write_skillet('inc', 'inc', description='edited', snippets=['  - name: base\n    include: base\n'])
+    skillet_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    inc = json.loads(Skillet.objects.get(name='inc').skillet_json)
+    assert inc['description'] == 'edited'
+    assert [s['name'] for s in inc['snippets']] == ['base.base_snippet']
+
+
+@pytest.fixture
+def indexed_repo(db, skillet_repo, monkeypatch):
+    for name in ('dns', 'ntp', 'syslog'):
+        skillet_repo.write_skillet(name, name)
+
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+
+    # directories of the definition files loaded by each refresh from here on
+    skillet_repo.loaded = list()
+    load_skillet_files = db_utils._load_skillet_files
+
+    def recording_load(definitions, repo_dir):
+        skillet_repo.loaded.extend(d.parent.name for d in definitions)
+        return load_skillet_files(definitions, repo_dir)
+
+    monkeypatch.setattr(db_utils, '_load_skillet_files', recording_load)
+    return skillet_repo
+
+
+def get_indexed_skillets() -> dict:
+    return {s.name: json.loads(s.skillet_json) for s in Skillet.objects.all()}
+
+
+def test_refresh_without_changes_loads_nothing(indexed_repo):
+    before = get_indexed_skillets()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert indexed_repo.loaded == []
+    assert get_indexed_skillets() == before
+
+
+def test_refresh_loads_only_the_edited_directory(indexed_repo):
+    indexed_repo.write_skillet('dns', 'dns', description='edited')
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert indexed_repo.loaded == ['dns']
+    assert get_indexed_skillets()['dns']['description'] == 'edited'
+
+
+def test_refresh_removes_deleted_skillets(indexed_repo):
+    indexed_repo.git('rm', '-rq', 'ntp')
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert indexed_repo.loaded == []
+    assert sorted(get_indexed_skillets()) == ['dns', 'syslog']
+
+
+def test_refresh_follows_renamed_directories(indexed_repo):
+    indexed_repo.git('mv', 'syslog', 'logging')
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert indexed_repo.loaded == ['logging']
+    assert get_indexed_skillets()['syslog']['skillet_path'] == os.path.join(indexed_repo.repo_dir, 'logging')
+
+
+def test_editing_an_included_skillet_reindexes_the_including_skillet(indexed_repo):
+    indexed_repo.write_skillet('inc', 'inc', snippets=['  - name: dns\n    include: dns\n'])
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    indexed_repo.write_skillet('dns', 'dns', snippets=['  - name: server\n    xpath: /config\n    element: <new/>\n'])
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert [s['element'] for s in get_indexed_skillets()['inc']['snippets']] == ['<new/>']
+
+
+def test_skillets_that_fail_to_load_keep_their_last_indexed_version(indexed_repo):
+    with open(os.path.join(indexed_repo.repo_dir, 'ntp', '.meta-cnc.yaml'), 'w') as meta_file:
+        meta_file.write('name: ntp\nsnippets: [\n')
+
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    assert indexed_repo.loaded == ['ntp']
+    assert get_indexed_skillets()['ntp']['label'] == 'ntp'
+
+
+def resync_by_content_hash() -> None:
+    # without a commit to diff against, every definition is checked against the content hash of its record
+    RepositoryDetails.objects.update(indexed_commit='')
+    db_utils.refresh_skillets_from_repo('repo')
+
+
+def test_content_hash_skips_unchanged_skillets_including_others(indexed_repo):
+    indexed_repo.write_skillet('inc', 'inc', snippets=['  - name: dns\n    include: dns\n'])
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+    assert Skillet.objects.get(name='inc').content_hash != ''
+
+    indexed_repo.loaded.clear()
+    resync_by_content_hash()
+    assert indexed_repo.loaded == []
+
+
+def test_content_hash_reloads_skillets_whose_included_skillet_changed(indexed_repo):
+    indexed_repo.write_skillet('inc', 'inc', snippets=['  - name: dns\n    include: dns\n'])
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+
+    indexed_repo.loaded.clear()
+    indexed_repo.write_skillet('dns', 'dns', snippets=['  - name: server\n    xpath: /config\n    element: <new/>\n'])
+    resync_by_content_hash()
+
+    assert sorted(indexed_repo.loaded) == ['dns', 'inc']
+    assert [s['element'] for s in get_indexed_skillets()['inc']['snippets']] == ['<new/>']
+
+
+def test_checking_out_an_indexed_commit_restores_its_snapshot(indexed_repo, settings):
+    settings.SKILLET_INDEX_SNAPSHOTS = 20
+    db_utils.refresh_skillets_from_repo('repo')
+    indexed_repo.git('checkout', '-qb', 'feature')
+    indexed_repo.write_skillet('dns', 'dns', description='feature')
+    indexed_repo.commit()
+    db_utils.refresh_skillets_from_repo('repo')
+    assert indexed_repo.loaded == ['dns']
+
+    for (branch, description) in (('-', None), ('feature', 'feature')):
+        indexed_repo.loaded.clear()
+        indexed_repo.git('checkout', '-q', branch)
+        db_utils.refresh_skillets_from_repo('repo')
+
+        assert indexed_repo.loaded == []
+        assert get_indexed_skillets()['dns']['description'] == description
+        assert sorted(Skillet.objects.values_list('name', flat=True)) == ['dns', 'ntp', 'syslog']
+
+
+def test_readers_see_the_old_or_the_new_catalog_during_a_reindex(indexed_repo, monkeypatch):
+    other_repo = type(indexed_repo)(os.path.join(os.path.dirname(indexed_repo.repo_dir), 'other'))
+    other_repo.write_skillet('snmp', 'snmp')
+    other_repo.commit()
+    RepositoryDetails.objects.create(name='other', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('other')
+
+    def read_catalog() -> list:
+        return sorted((s['name'], s['description']) for s in snippet_utils.load_all_snippets('testapp'))
+
+    old_catalog = read_catalog()
+    indexed_repo.write_skillet('dns', 'dns', description='edited')
+    indexed_repo.git('rm', '-rq', 'ntp')
+    indexed_repo.commit()
+    other_repo.write_skillet('banner', 'banner')
+    other_repo.commit()
+
+    # once each repository is written, a reader in another thread reads the catalog before the reindex goes on
+    read_requested = threading.Event()
+    read_done = threading.Event()
+    stopped = threading.Event()
+    catalogs = list()
+    errors = list()
+
+    def reader() -> None:
+        try:
+            while not stopped.is_set():
+                if read_requested.wait(0.001):
+                    read_requested.clear()
+                    catalogs.append(read_catalog())
+                    read_done.set()
+                else:
+                    catalogs.append(read_catalog())
+
+        except Exception as e:
+            errors.append(e)
+            read_done.set()
+
+    save_repo_changes = db_utils._save_repo_changes
+
+    def save_and_read(repo_object, changes) -> None:
+        save_repo_changes(repo_object, changes)
+        read_done.clear()
+        read_requested.set()
+        assert read_done.wait(5)
+
+    monkeypatch.setattr(db_utils, '_save_repo_changes', save_and_read)
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    try:
+        db_utils.refresh_skillets_from_all_repos()
+    finally:
+        stopped.set()
+        reader_thread.join()
+
+    new_catalog = read_catalog()
+    assert errors == []
+    assert new_catalog == [('banner', ''), ('dns', 'edited'), ('snmp', ''), ('syslog', '')]
+    assert catalogs.count(old_catalog) >= 2
+    assert [c for c in catalogs if c not in (old_catalog, new_catalog)] == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_reindexes_create_each_new_skillet_once(skillet_repo, monkeypatch):
+    skillet_repo.write_skillet('dns', 'dns')
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+    skillet_repo.write_skillet('ntp', 'ntp')
+    skillet_repo.commit()
+
+    # each indexer waits for the other to also find ntp missing before writing, unless only one can load at a time
+    both_loaded = threading.Barrier(2)
+    load_repo_changes = db_utils._load_repo_changes
+
+    def load_and_wait(repo_object) -> dict:
+        changes = load_repo_changes(repo_object)
+        try:
+            both_loaded.wait(0.5)
+        except threading.BrokenBarrierError:
+            pass
+
+        return changes
+
+    monkeypatch.setattr(db_utils, '_load_repo_changes', load_and_wait)
+    errors = list()
+
+    def reindex() -> None:
+        try:
+            db_utils.refresh_skillets_from_repo('repo')
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=reindex) for _ in range(2)]
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert sorted(Skillet.objects.values_list('name', flat=True)) == ['dns', 'ntp']
@@ -0,0 +1,23 @@
+from pan_cnc.lib import dependency_utils
+
+
+def test_graph_orders_lineage_and_finds_cycles():
+    catalog = [
+        {'name': 'child', 'extends': 'parent'},
+        {'name': 'parent', 'extends': 'base'},
+        {'name': 'base'},
+        {'name': 'loop_a', 'extends': 'loop_b'},
+        {'name': 'loop_b', 'extends': 'loop_a'},
+        {'name': 'into_loop', 'extends': 'loop_a'},
+        {'name': 'orphan', 'extends': 'missing'},
+    ]
+    graph = dependency_utils.get_dependency_graph(catalog)
+    assert dependency_utils.get_dependency_graph(catalog) is graph
+
+    assert graph.lineage['child'] == ('child', 'parent', 'base')
+    assert graph.extends('child', 'base') and not graph.extends('base', 'child')
+    assert graph.order.index('base') < graph.order.index('parent') < graph.order.index('child')
+    assert graph.cycles == [['loop_a', 'loop_b']]
+    assert graph.lineage['into_loop'] == ('into_loop', 'loop_a', 'loop_b')
+    assert 'into_loop' not in graph.order
+    assert graph.missing == {'orphan': 'missing'}
@@ -0,0 +1,26 @@
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import parallel_utils
+
+
+def test_map_in_processes_keeps_order():
+    items = list(range(parallel_utils.PARALLEL_MIN_ITEMS * 2))
+    assert parallel_utils.map_in_processes(str, items, workers=3) == [str(i) for i in items]
+
+
+def test_map_in_processes_runs_small_batches_serially(monkeypatch):
+    monkeypatch.setattr(parallel_utils, 'ProcessPoolExecutor', None)
+    assert parallel_utils.map_in_processes(str, [1, 2], workers=4) == ['1', '2']
+
+
+def test_workers_can_run_functions_that_need_django(tmp_path, capsys):
+    definitions = list()
+    for i in range(parallel_utils.PARALLEL_MIN_ITEMS):
+        (tmp_path / str(i)).mkdir()
+        definition = tmp_path / str(i) / '.meta-cnc.yaml'
+        definition.write_text(f'name: skillet_{i}\ntype: panos\nsnippets:\n  - name: s\n    xpath: /config\n'
+                              f'    element: <a/>\n')
+        definitions.append(definition)
+
+    loaded = parallel_utils.map_in_processes(db_utils._load_skillet_file, definitions, workers=2)
+    assert [s['name'] for s in loaded] == [f'skillet_{i}' for i in range(parallel_utils.PARALLEL_MIN_ITEMS)]
+    assert 'continuing serially' not in capsys.readouterr().out
@@ -0,0 +1,76 @@
+import os
+
+from pan_cnc.lib import cache_utils
+from pan_cnc.lib import scan_utils
+
+
+def test_find_files_reuses_manifest_for_unchanged_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    # trust every mtime, the test tree is written within the racy window
+    monkeypatch.setattr(scan_utils, 'RACY_SECONDS', -60)
+
+    repo = tmp_path / 'repo'
+    for skillet_dir in ('a', 'b/c', 'node_modules/d', 'a/nested'):
+        (repo / skillet_dir).mkdir(parents=True)
+        (repo / skillet_dir / '.meta-cnc.yaml').write_text('name: x')
+
+    expected = [str(repo / 'a' / '.meta-cnc.yaml'), str(repo / 'b' / 'c' / '.meta-cnc.yaml')]
+    assert sorted(scan_utils.find_files(str(repo), ('.meta-cnc.y*',), stop_at_match=True)) == expected
+
+    scanned = list()
+    real_scan_dir = scan_utils._scan_dir
+    monkeypatch.setattr(scan_utils, '_scan_dir', lambda path, *args: scanned.append(path) or real_scan_dir(path, *args))
+    assert sorted(scan_utils.find_files(str(repo), ('.meta-cnc.y*',), stop_at_match=True)) == expected
+    assert scanned == []
+
+    (repo / 'b' / 'e').mkdir()
+    (repo / 'b' / 'e' / '.meta-cnc.yml').write_text('name: y')
+    os.utime(repo / 'b', ns=(0, 0))
+    assert sorted(scan_utils.find_files(str(repo), ('.meta-cnc.y*',), stop_at_match=True)) == \
+        expected + [str(repo / 'b' / 'e' / '.meta-cnc.yml')]
+    assert sorted(scanned) == [str(repo / 'b'), str(repo / 'b' / 'e')]
+
+
+def test_tracked_walks_skip_unchanged_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    monkeypatch.setattr(scan_utils, 'RACY_SECONDS', -60)
+    repo = tmp_path / 'repo'
+    for skillet_dir in ('a', 'b/c', 'docs/d/e'):
+        (repo / skillet_dir).mkdir(parents=True)
+
+    (repo / 'a' / '.meta-cnc.yaml').write_text('name: a')
+    unread_changes = list()
+    tracker = scan_utils.ChangeTracker(str(repo), scan_utils.get_ignore_globs(), lambda: bool(unread_changes))
+    monkeypatch.setattr(scan_utils, '_trackers', [tracker])
+
+    stat_calls = list()
+    real_stat = os.stat
+    monkeypatch.setattr(os, 'stat', lambda path, *args, **kwargs: stat_calls.append(str(path)) or
+                        real_stat(path, *args, **kwargs))
+
+    def find_files() -> list:
+        stat_calls.clear()
+        return scan_utils.find_files(str(repo), ('.meta-cnc.y*',), stop_at_match=True)
+
+    # the first walk checks every directory, after that only those reported as changed
+    expected = [str(repo / 'a' / '.meta-cnc.yaml')]
+    assert find_files() == expected
+    assert str(repo / 'docs' / 'd' / 'e') in stat_calls
+    assert find_files() == expected
+    assert not [p for p in stat_calls if p.startswith(str(repo))]
+
+    (repo / 'docs' / 'd' / 'e' / '.meta-cnc.yaml').write_text('name: e')
+    with tracker.lock:
+        tracker.mark_changed(str(repo / 'docs' / 'd' / 'e'))
+
+    expected.append(str(repo / 'docs' / 'd' / 'e' / '.meta-cnc.yaml'))
+    assert find_files() == expected
+    assert [p for p in stat_calls if p.startswith(str(repo))] == [str(repo / 'docs' / 'd' / 'e')]
+
+    # changes not yet reported to the tracker are found by checking every directory again
+    (repo / 'b' / 'c' / '.meta-cnc.yaml').write_text('name: c')
+    unread_changes.append(str(repo / 'b' / 'c'))
+    assert sorted(find_files()) == sorted(expected + [str(repo / 'b' / 'c' / '.meta-cnc.yaml')])
+    assert str(repo / 'docs' / 'd') in stat_calls
@@ -0,0 +1,46 @@
+import pytest
+
+from cnc.models import RepositoryDetails
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import search_utils
+
+
+def build_skillet(name: str, label: str, variables=()) -> dict:
+    return {'name': name, 'label': label, 'description': '', 'type': 'panos',
+            'labels': {'collection': ['Firewall Basics']}, 'variables': [{'name': v} for v in variables]}
+
+
+@pytest.mark.django_db
+def test_search_ranks_and_follows_sync():
+    repo = RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    skillets = [
+        build_skillet('dns_servers', 'Configure DNS'),
+        build_skillet('ntp_servers', 'Configure NTP', variables=['dns_primary']),
+        build_skillet('syslog', 'Configure Syslog'),
+    ]
+    db_utils._save_skillets(repo, skillets, list(), repo.skillet_set.all())
+
+    results = search_utils.search_skillets('dns')
+    assert results['total'] == 2
+    assert [r['name'] for r in results['results']] == ['dns_servers', 'ntp_servers']
+    pages = [search_utils.search_skillets('firewall bas', page=p, page_size=2) for p in (1, 2)]
+    assert pages[0]['total'] == 3
+    assert sorted(r['name'] for p in pages for r in p['results']) == ['dns_servers', 'ntp_servers', 'syslog']
+    assert search_utils.search_skillets('"dns"* ^(')['total'] == 2
+
+    db_utils._save_skillets(repo, skillets[1:], list(), repo.skillet_set.all())
+    assert [r['name'] for r in search_utils.search_skillets('dns')['results']] == ['ntp_servers']
+
+
+@pytest.mark.django_db
+def test_search_leaves_out_skillets_deleted_with_their_repository():
+    repo = RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    other_repo = RepositoryDetails.objects.create(name='other', url='', details_json='{}')
+    db_utils._save_skillets(repo, [build_skillet('dns_servers', 'Configure DNS')], list(), repo.skillet_set.all())
+    db_utils._save_skillets(other_repo, [build_skillet('dns_proxy', 'Configure DNS Proxy')], list(),
+                            other_repo.skillet_set.all())
+    assert search_utils.search_skillets('dns')['total'] == 2
+
+    repo.delete()
+    results = search_utils.search_skillets('dns')
+    assert (results['total'], [r['name'] for r in results['results']]) == (1, ['dns_proxy'])
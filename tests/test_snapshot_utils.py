@@ -0,0 +1,23 @@
+import os
+
+from pan_cnc.lib import snapshot_utils
+
+
+def test_snapshots_are_bounded_lru(tmp_path, monkeypatch, settings):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    settings.SKILLET_INDEX_SNAPSHOTS = 2
+    skillets = [('{"name": "one"}', 'abc')]
+
+    snapshot_utils.save_snapshot('repo/one', '/repos/one', 'sha1', skillets)
+    snapshot_utils.save_snapshot('repo/one', '/repos/one', 'sha2', skillets)
+    for (i, name) in enumerate(sorted(os.listdir(snapshot_utils.get_snapshot_dir()))):
+        os.utime(os.path.join(snapshot_utils.get_snapshot_dir(), name), ns=(i, i))
+
+    # using sha1 makes sha2 the least recently used
+    assert snapshot_utils.load_snapshot('repo/one', '/repos/one', 'sha1') == skillets
+    assert snapshot_utils.load_snapshot('repo/one', '/repos/moved', 'sha1') is None
+    snapshot_utils.save_snapshot('repo/one', '/repos/one', 'sha3', skillets)
+
+    assert snapshot_utils.has_snapshot('repo/one', 'sha1')
+    assert not snapshot_utils.has_snapshot('repo/one', 'sha2')
+    assert snapshot_utils.has_snapshot('repo/one', 'sha3')
@@ -0,0 +1,69 @@
+import pytest
+
+from pan_cnc.lib import cache_utils
+from pan_cnc.lib import snippet_utils
+from pan_cnc.lib.exceptions import SnippetNotFoundException
+
+
+def test_name_index_follows_catalog():
+    first = {'name': 'one', 'label': 'first'}
+    catalog = [first, {'name': 'two'}, {'name': 'one', 'label': 'duplicate'}]
+    index = snippet_utils._get_name_index(catalog)
+    assert index['one'] is first
+    assert snippet_utils._get_name_index(catalog) is index
+
+    rebuilt = [{'name': 'three'}]
+    assert list(snippet_utils._get_name_index(rebuilt)) == ['three']
+
+
+def test_resolve_dependencies_walks_extends(monkeypatch):
+    catalog = [{'name': 'child', 'extends': 'parent'}, {'name': 'parent', 'extends': 'base'}, {'name': 'base'},
+               {'name': 'loop_a', 'extends': 'loop_b'}, {'name': 'loop_b', 'extends': 'loop_a'}]
+    monkeypatch.setattr(snippet_utils, 'load_all_snippets', lambda app_dir: catalog)
+
+    assert snippet_utils.resolve_dependencies(catalog[0], 'app', []) == ['base', 'parent']
+    assert snippet_utils.resolve_dependencies(catalog[3], 'app', []) == ['loop_a', 'loop_b']
+    with pytest.raises(SnippetNotFoundException):
+        snippet_utils.resolve_dependencies({'name': 'orphan', 'extends': 'missing'}, 'app', [])
+
+
+def test_check_dir_descends_until_a_matching_skillet_is_loaded(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    repo = tmp_path / 'repo'
+    for (skillet_dir, skillet_type) in (('a', 'panos'), ('a/nested', 'panos'), ('b', 'app'), ('b/c', 'panos'),
+                                        ('d', 'panos'), ('node_modules/e', 'panos')):
+        (repo / skillet_dir).mkdir(parents=True)
+        (repo / skillet_dir / '.meta-cnc.yaml').write_text(f'name: {skillet_dir}\ntype: {skillet_type}\n')
+
+    # a metadata file that fails to load stops the search below it
+    (repo / 'd' / '.meta-cnc.yaml').write_text('name: [d\n')
+    (repo / 'd' / 'f').mkdir()
+    (repo / 'd' / 'f' / '.meta-cnc.yaml').write_text('name: d/f\ntype: panos\n')
+
+    skillets = snippet_utils._check_dir(repo, 'panos', list())
+    assert sorted(s['name'] for s in skillets) == ['a', 'b/c']
+
+
+@pytest.mark.parametrize('workers', (1, 2))
+def test_type_views_find_the_skillets_check_dir_finds(tmp_path, monkeypatch, workers):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(cache_utils, '_caches', dict())
+    monkeypatch.setattr(snippet_utils.parallel_utils, 'get_worker_count', lambda: workers)
+    repo = tmp_path / 'repo'
+    for (skillet_dir, skillet_type) in (('a', 'panos'), ('a/b', 'service'), ('a/b/c', 'service'), ('d', 'app'),
+                                        ('d/e', 'panos'), ('f', 'template'), ('f/g', 'broken')):
+        (repo / skillet_dir).mkdir(parents=True)
+        (repo / skillet_dir / '.meta-cnc.yaml').write_text(f'name: {skillet_dir}\ntype: {skillet_type}\n')
+
+    (repo / 'f' / 'g' / '.meta-cnc.yaml').write_text('name: [g\n')
+    (repo / 'f' / 'g' / 'h').mkdir()
+    (repo / 'f' / 'g' / 'h' / '.meta-cnc.yaml').write_text('name: f/g/h\ntype: service\n')
+
+    for snippet_type in (None, 'panos', 'service', 'app', 'template'):
+        skillets = snippet_utils.load_snippets_of_type_from_dir('testapp', str(repo), snippet_type)
+        expected = snippet_utils._check_dir(repo, snippet_type, list())
+        assert sorted(s['name'] for s in skillets) == sorted(s['name'] for s in expected)
+
+    assert [s['name'] for s in snippet_utils.load_snippets_of_type_from_dir('testapp', str(repo), 'service')] == \
+        ['a/b']
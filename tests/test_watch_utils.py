@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+
+import pytest
+
+from cnc.models import RepositoryDetails
+from cnc.models import Skillet
+from pan_cnc.lib import db_utils
+from pan_cnc.lib import scan_utils
+from pan_cnc.lib import watch_utils
+
+pytestmark = pytest.mark.skipif(not watch_utils.watcher_available(), reason='inotify is not available')
+
+
+@pytest.fixture
+def watcher(transactional_db, skillet_repo):
+    for name in ('dns', 'ntp'):
+        skillet_repo.write_skillet(name, name)
+
+    os.makedirs(os.path.join(skillet_repo.repo_dir, 'node_modules', 'pkg'))
+    skillet_repo.commit()
+    RepositoryDetails.objects.create(name='repo', url='', details_json='{}')
+    db_utils.refresh_skillets_from_repo('repo')
+
+    # set up as run() does, the test reads and indexes the events itself
+    watcher = watch_utils.SkilletRepositoryWatcher('testapp')
+    watcher.fd = watch_utils._libc.inotify_init1(watch_utils.IN_NONBLOCK | watch_utils.IN_CLOEXEC)
+    with watcher.tracker.lock:
+        watcher._watch_tree(watcher.repositories_dir)
+
+    yield watcher
+    os.close(watcher.fd)
+
+
+def test_watcher_reindexes_only_the_edited_skillet(watcher, skillet_repo, monkeypatch):
+    watched_dirs = {os.path.relpath(d, skillet_repo.repo_dir) for d in watcher.watched_dirs.values()}
+    assert {'.', 'dns', 'ntp'}.issubset(watched_dirs)
+    assert not [d for d in watched_dirs if d.startswith(('.git', 'node_modules'))]
+
+    refreshed = list()
+    refresh_skillets_in_paths = db_utils.refresh_skillets_in_paths
+    monkeypatch.setattr(db_utils, 'refresh_skillets_in_paths',
+                        lambda *args: refreshed.append(args) or refresh_skillets_in_paths(*args))
+
+    skillet_repo.write_skillet('dns', 'dns', description='edited')
+    os.makedirs(os.path.join(skillet_repo.repo_dir, '.venv', 'lib'))
+    # inotify queues the events before the writes return
+    watcher._read_events()
+    watcher._index_pending()
+
+    assert refreshed == [('repo', [os.path.join('dns', '.meta-cnc.yaml')])]
+    assert json.loads(Skillet.objects.get(name='dns').skillet_json)['description'] == 'edited'
+    assert json.loads(RepositoryDetails.objects.get(name='repo').indexed_local_changes) == \
+        [os.path.join('dns', '.meta-cnc.yaml')]
+
+
+def test_too_many_local_changes_index_the_entire_repository(watcher, skillet_repo, monkeypatch):
+    monkeypatch.setattr(db_utils, 'MAX_LOCAL_CHANGES', 1)
+    skillet_repo.write_skillet('dns', 'dns', description='edited')
+    watcher._read_events()
+    watcher._index_pending()
+    skillet_repo.commit()
+
+    skillet_repo.write_skillet('ntp', 'ntp', description='edited')
+    watcher._read_events()
+    watcher._index_pending()
+
+    # the full index only records the files git reports as changed, dropping the dns file committed since
+    repo_object = RepositoryDetails.objects.get(name='repo')
+    assert json.loads(repo_object.indexed_local_changes) == [os.path.join('ntp', '.meta-cnc.yaml')]
+    assert {json.loads(s.skillet_json)['description'] for s in Skillet.objects.all()} == {'edited'}
+
+
+def test_scans_only_check_the_directories_the_watcher_reports(watcher, skillet_repo, monkeypatch):
+    monkeypatch.setattr(scan_utils, 'RACY_SECONDS', -60)
+    monkeypatch.setattr(scan_utils, '_trackers', [watcher.tracker])
+    checked = list()
+    real_stat = os.stat
+    monkeypatch.setattr(os, 'stat', lambda path, *args, **kwargs: checked.append(str(path)) or
+                        real_stat(path, *args, **kwargs))
+
+    def find_skillets() -> list:
+        checked.clear()
+        found = scan_utils.find_files(watcher.repositories_dir, ('.meta-cnc.y*',), stop_at_match=True)
+        return sorted(os.path.relpath(os.path.dirname(f), skillet_repo.repo_dir) for f in found)
+
+    assert find_skillets() == ['dns', 'ntp']
+    assert find_skillets() == ['dns', 'ntp']
+    assert not [p for p in checked if p.startswith(watcher.repositories_dir)]
+
+    skillet_repo.write_skillet(os.path.join('new', 'deep'), 'deep')
+    watcher._read_events()
+
+    assert find_skillets() == ['dns', 'new/deep', 'ntp']
+    assert sorted(os.path.relpath(p, skillet_repo.repo_dir) for p in checked) == ['.', 'new', 'new/deep']
+
+
+def test_only_one_watcher_runs_per_install(skillet_repo, monkeypatch):
+    monkeypatch.setattr(watch_utils, 'LOCK_RETRY_SECONDS', 0.05)
+    first_fd = watch_utils.SkilletRepositoryWatcher('testapp')._lock_watcher()
+    assert first_fd is not None
+
+    second = watch_utils.SkilletRepositoryWatcher('testapp')
+    second_fd = list()
+    waiting = threading.Thread(target=lambda: second_fd.append(second._lock_watcher()))
+    waiting.start()
+    waiting.join(0.3)
+    assert second_fd == []
+
+    # takes over once the first watcher exits
+    os.close(first_fd)
+    waiting.join(5)
+    assert second_fd[0] is not None
+
+    third = watch_utils.SkilletRepositoryWatcher('testapp')
+    third.stop()
+    assert third._lock_watcher() is None
+    os.close(second_fd[0])
@@ -0,0 +1,24 @@
+import oyaml
+
+from pan_cnc.lib import yaml_utils
+
+DOCUMENT = '''
+name: example
+zeta: 1
+alpha: 2
+defaults: &defaults
+  type_hint: text
+  default: ''
+variables:
+  - name: second
+    <<: *defaults
+  - name: first
+    <<: *defaults
+'''
+
+
+def test_safe_load_matches_oyaml_including_key_order():
+    loaded = yaml_utils.safe_load(DOCUMENT)
+    assert loaded == oyaml.safe_load(DOCUMENT)
+    assert list(loaded) == ['name', 'zeta', 'alpha', 'defaults', 'variables']
+    assert type(loaded) is dict
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark load time and size of the long term cache snapshot for each serializer
+
+Compares the plain JSON written by older versions with every SERIALIZER / COMPRESSION combination supported by
+pan_cnc.lib.cache_utils.serialize
+
+usage: python tools/bench_cache_serializer.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pan_cnc.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from bench_long_term_cache import build_skillet  # noqa: E402
+from pan_cnc.lib import cache_utils  # noqa: E402
+
+LOADS = 20
+
+FORMATS = [
+    ('pickle', 'zlib'),
+    ('pickle', 'none'),
+    ('json', 'zlib'),
+    ('json', 'none'),
+]
+
+
+def build_contents(size: int) -> dict:
+    catalog = [build_skillet(i) for i in range(size)]
+    return {
+        'all_snippets': catalog,
+        'snippet_types_in_repositories': {'repositories': {None: catalog}},
+        'meta': {
+            'all_snippets': {'time': 0, 'life': -1, 'cache_type': 'snippet'},
+            'snippet_types_in_repositories': {'time': 0, 'life': -1, 'cache_type': 'snippet'},
+        }
+    }
+
+
+def main():
+    print(f'{"skillets":>10} {"format":>14} {"size (KB)":>12} {"load (ms)":>12}')
+    for size in (100, 500, 2000):
+        contents = build_contents(size)
+
+        legacy = json.dumps(contents).encode('utf-8')
+        load = timeit.timeit(lambda: json.loads(legacy), number=LOADS) / LOADS
+        print(f'{size:>10} {"legacy json":>14} {len(legacy) / 1024:>12.1f} {load * 1000:>12.2f}')
+
+        for (serializer, compression) in FORMATS:
+            settings.LONG_TERM_CACHE = {'SERIALIZER': serializer, 'COMPRESSION': compression}
+            data = cache_utils.serialize(contents)
+            load = timeit.timeit(lambda: cache_utils.deserialize(data), number=LOADS) / LOADS
+            name = f'{serializer}+{compression}'
+            print(f'{size:>10} {name:>14} {len(data) / 1024:>12.1f} {load * 1000:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measure resident memory of the skillet catalog in the long term cache
+
+Compares the old layout, where the catalog was stored under both the app name and 'cnc' and every directory kept a
+separate list per snippet_type, with the current layout of a single catalog under 'cnc' and one list per directory
+that each snippet_type view points into. Each old copy is built by a serialize / deserialize round trip, which is what
+a process loading those keys from disk ends up with
+
+usage: python tools/bench_catalog_memory.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pan_cnc.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from bench_long_term_cache import build_skillet  # noqa: E402
+from pan_cnc.lib import cache_utils  # noqa: E402
+from pan_cnc.lib import snippet_utils  # noqa: E402
+
+SNIPPET_TYPES = (None, 'panos', 'service', 'template')
+
+
+def copy_of(value: any) -> any:
+    return cache_utils.deserialize(cache_utils.serialize(value))
+
+
+def old_layout(catalog: list) -> dict:
+    app = cache_utils.LongTermCache('app')
+    cnc = cache_utils.LongTermCache('cnc')
+    cnc.set('all_snippets', copy_of(catalog), -1)
+    app.set('all_snippets', copy_of(catalog), -1)
+    types = dict()
+    for snippet_type in SNIPPET_TYPES:
+        types[snippet_type] = copy_of([s for s in catalog if snippet_type is None or s['type'] == snippet_type])
+    app.set('snippet_types_in_repositories', {'repositories': types}, -1)
+    return {'app': app, 'cnc': cnc}
+
+
+def new_layout(catalog: list) -> dict:
+    app = cache_utils.LongTermCache('app')
+    cnc = cache_utils.LongTermCache('cnc')
+    cnc.set('all_snippets', copy_of(catalog), -1)
+    skillets = copy_of(catalog)
+    app.set('skillets_in_repositories', skillets, -1)
+    for snippet_type in SNIPPET_TYPES:
+        snippet_utils._get_type_view('app', 'repositories', skillets, snippet_type)
+    return {'app': app, 'cnc': cnc}
+
+
+def measure(caches: dict) -> int:
+    seen = set()
+    size = sum(cache_utils.deep_sizeof(c.values, seen) for c in caches.values())
+    return size + cache_utils.deep_sizeof(snippet_utils._type_views, seen)
+
+
+def main():
+    # keep any cache files created along the way out of the real home dir
+    os.environ['HOME'] = tempfile.mkdtemp()
+
+    print(f'{"skillets":>10} {"old (KB)":>12} {"new (KB)":>12}')
+    for size in (100, 1000, 5000):
+        catalog = [build_skillet(i) for i in range(size)]
+        for (i, skillet) in enumerate(catalog):
+            skillet['type'] = SNIPPET_TYPES[1 + i % 3]
+
+        snippet_utils._type_views.clear()
+        old = measure(old_layout(catalog))
+        new = measure(new_layout(catalog))
+        print(f'{size:>10} {old / 1024:>12.0f} {new / 1024:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
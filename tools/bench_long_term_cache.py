@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-lookup cost of the long term cache as the skillet catalog grows
+
+Compares the old approach of keeping the whole long term cache dict in Django's LocMemCache, which pickles on every
+set and unpickles on every get, with the in-process LongTermCache store in pan_cnc.lib.cache_utils
+
+usage: python tools/bench_long_term_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pan_cnc.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+
+from pan_cnc.lib import cache_utils  # noqa: E402
+
+LOOKUPS = 200
+
+
+def build_skillet(i: int) -> dict:
+    return {
+        'name': f'skillet_{i}',
+        'label': f'Skillet number {i}',
+        'description': 'A synthetic skillet used for benchmarking the long term cache',
+        'type': 'panos',
+        'labels': {'collection': ['Benchmark']},
+        'variables': [{'name': f'var_{v}', 'description': 'Variable', 'default': '', 'type_hint': 'text'}
+                      for v in range(10)],
+        'snippets': [{'name': f'snippet_{s}', 'xpath': '/config/devices', 'file': f'{s}.xml'} for s in range(5)],
+        'snippet_path': f'/home/cnc_user/.pan_cnc/app/repositories/repo/skillet_{i}'
+    }
+
+
+def bench(size: int) -> (float, float):
+    catalog = [build_skillet(i) for i in range(size)]
+    contents = {'all_snippets': catalog, 'git_utils_api_throttle': True,
+                'meta': {'all_snippets': {'time': 0, 'life': -1, 'cache_type': 'snippet'},
+                         'git_utils_api_throttle': {'time': 0, 'life': -1, 'cache_type': 'git'}}}
+
+    cache.set('bench_cache', contents)
+
+    def locmem_lookup():
+        return cache.get('bench_cache')['all_snippets']
+
+    ltc = cache_utils.LongTermCache('bench')
+    ltc.load_dict(dict(contents))
+
+    def store_lookup():
+        return ltc.get('all_snippets')
+
+    locmem = timeit.timeit(locmem_lookup, number=LOOKUPS) / LOOKUPS
+    store = timeit.timeit(store_lookup, number=LOOKUPS) / LOOKUPS
+    return locmem, store
+
+
+def main():
+    # keep any cache files created along the way out of the real home dir
+    os.environ['HOME'] = tempfile.mkdtemp()
+
+    print(f'{"skillets":>10} {"LocMemCache (us)":>18} {"LongTermCache (us)":>20}')
+    for size in (10, 100, 1000, 5000):
+        locmem, store = bench(size)
+        print(f'{size:>10} {locmem * 1e6:>18.1f} {store * 1e6:>20.2f}')
+
+
+if __name__ == '__main__':
+    main()
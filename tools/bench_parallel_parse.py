@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs parallel parsing of skillet metadata files
+
+Builds a synthetic repository of skillet directories and times both the snippet_utils directory scan and the db_utils
+skillet loader with a varying number of worker processes, checking that each produces the same ordered results as the
+serial path
+
+usage: python tools/bench_parallel_parse.py [number of skillets]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pan_cnc.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from pan_cnc.lib import db_utils  # noqa: E402
+from pan_cnc.lib import snippet_utils  # noqa: E402
+
+SKILLET_TEMPLATE = '''name: skillet_{i}
+label: Skillet number {i}
+description: A synthetic skillet used for benchmarking metadata parsing
+type: panos
+labels:
+  collection:
+    - Benchmark
+variables:
+{variables}
+snippets:
+{snippets}
+'''
+
+
+def build_repository(repo_dir: str, size: int) -> None:
+    variables = ''.join(f'  - name: var_{v}\n    description: Variable {v}\n    default: value\n    type_hint: text\n'
+                        for v in range(20))
+    snippets = ''.join(f'  - name: snippet_{s}\n    xpath: /config/devices\n'
+                       f'    element: <entry name="{{{{ var_{s} }}}}"/>\n' for s in range(10))
+    for i in range(size):
+        skillet_dir = os.path.join(repo_dir, f'group_{i % 10}', f'skillet_{i}')
+        os.makedirs(skillet_dir)
+        with open(os.path.join(skillet_dir, '.meta-cnc.yaml'), 'w') as f:
+            f.write(SKILLET_TEMPLATE.format(i=i, variables=variables, snippets=snippets))
+
+
+def timed(func: callable) -> (float, list):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repo_dir = tempfile.mkdtemp()
+    build_repository(repo_dir, size)
+    definitions = db_utils._find_skillet_definitions(Path(repo_dir))
+
+    print(f'{size} skillets, {os.cpu_count()} cpus')
+    print(f'{"workers":>8} {"_check_tree (s)":>16} {"skillet loader (s)":>20}')
+
+    settings.SKILLET_INDEX_WORKERS = 1
+    (serial_dir, expected_dir) = timed(lambda: snippet_utils._check_tree(Path(repo_dir), list()))
+    (serial_loader, expected_loader) = timed(lambda: db_utils._load_skillet_files(definitions, repo_dir))
+    print(f'{"serial":>8} {serial_dir:>16.2f} {serial_loader:>20.2f}')
+
+    for workers in (2, 4, 8):
+        settings.SKILLET_INDEX_WORKERS = workers
+        (parallel_dir, result_dir) = timed(lambda: snippet_utils._check_dir_parallel(Path(repo_dir)))
+        (parallel_loader, result_loader) = timed(lambda: db_utils._load_skillet_files(definitions, repo_dir))
+        assert result_dir == expected_dir and result_loader == expected_loader, 'parallel results differ'
+        print(f'{workers:>8} {parallel_dir:>16.2f} {parallel_loader:>20.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark parse throughput of skillet metadata files for each YAML loader
+
+Compares oyaml.safe_load, which always uses the pure Python SafeLoader, with pan_cnc.lib.yaml_utils.safe_load using
+libyaml when available, over a synthetic corpus of skillets. Also checks that every loader produces identical output,
+including key order, and that the db_utils skillet loader matches SkilletLoader.load_skillet_from_path
+
+usage: python tools/bench_yaml_loader.py [number of skillets]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pan_cnc.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import oyaml  # noqa: E402
+import yaml  # noqa: E402
+from skilletlib import SkilletLoader  # noqa: E402
+
+from bench_parallel_parse import build_repository  # noqa: E402
+from pan_cnc.lib import db_utils  # noqa: E402
+from pan_cnc.lib import yaml_utils  # noqa: E402
+
+
+class PurePythonOrderedSafeLoader(yaml.SafeLoader):
+    pass
+
+
+PurePythonOrderedSafeLoader.add_constructor('tag:yaml.org,2002:map', yaml_utils._construct_ordered_mapping)
+
+LOADERS = [
+    ('oyaml.safe_load', oyaml.safe_load),
+    ('yaml_utils (pure python)', lambda data: yaml.load(data, Loader=PurePythonOrderedSafeLoader)),
+    (f'yaml_utils (libyaml={yaml_utils.libyaml_available})', yaml_utils.safe_load),
+]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repo_dir = tempfile.mkdtemp()
+    build_repository(repo_dir, size)
+    definitions = db_utils._find_skillet_definitions(Path(repo_dir))
+    corpus = [d.read_text() for d in definitions]
+    megabytes = sum(len(c) for c in corpus) / 1024 / 1024
+
+    print(f'{size} skillets, {megabytes:.1f} MB')
+    print(f'{"loader":>32} {"time (s)":>10} {"MB/s":>8}')
+
+    expected = None
+    for (name, load) in LOADERS:
+        start = time.perf_counter()
+        loaded = [load(c) for c in corpus]
+        elapsed = time.perf_counter() - start
+        print(f'{name:>32} {elapsed:>10.2f} {megabytes / elapsed:>8.2f}')
+
+        # json.dumps keeps key order, so this also checks that mappings are in document order
+        dumped = [json.dumps(d) for d in loaded]
+        if expected is None:
+            expected = dumped
+        assert dumped == expected, f'{name} output differs from oyaml.safe_load'
+
+    start = time.perf_counter()
+    skilletlib_dicts = [SkilletLoader().load_skillet_from_path(d).skillet_dict for d in definitions]
+    skilletlib_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_dicts = [db_utils._load_skillet_file(d) for d in definitions]
+    fast_time = time.perf_counter() - start
+
+    assert json.dumps(fast_dicts) == json.dumps(skilletlib_dicts), 'db_utils loader output differs from skilletlib'
+    print(f'{"SkilletLoader":>32} {skilletlib_time:>10.2f}')
+    print(f'{"db_utils._load_skillet_file":>32} {fast_time:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()